@@ -0,0 +1,407 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import secrets
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from io import BytesIO
+from datetime import datetime, timedelta
+
+# 基准测试：在临时目录中生成用户、会话和不同规模的目录，测量热点路径的耗时和吞吐量，
+# 结果输出为JSON，可以用--compare与另一次提交的结果对比。
+#
+#   python benchmark.py --quick                      # 小规模，几十秒内完成
+#   python benchmark.py --output before.json         # 完整规模
+#   python benchmark.py --output after.json --compare before.json
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PASSWORD = 'benchmark-password'
+BENCH_USER = 'user00000'
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(name, latencies, elapsed, extra=None):
+    """汇总一组操作：吞吐量和延迟分位数（毫秒）"""
+    latencies = sorted(latencies)
+    result = {'name': name, 'ops': len(latencies), 'seconds': round(elapsed, 4)}
+    if latencies:
+        result.update({
+            'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 4),
+            'p50_ms': round(_percentile(latencies, 0.50) * 1000, 4),
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 4),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 4),
+            'max_ms': round(latencies[-1] * 1000, 4)
+        })
+    if extra:
+        result.update(extra)
+    return result
+
+
+def measure(name, func, iterations, bytes_per_op=None):
+    """顺序执行func(i) iterations次并汇总"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        op_started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+    extra = None
+    if bytes_per_op:
+        extra = {'mb_per_sec': round(bytes_per_op * iterations / elapsed / 1e6, 2)}
+    result = summarize(name, latencies, elapsed, extra)
+    print(f"  {name}: {result.get('ops_per_sec')} ops/s, p50 {result.get('p50_ms')} ms, p99 {result.get('p99_ms')} ms")
+    return result
+
+
+# ---- 测试数据 ----
+
+def build_fixtures(work_dir, users, sessions, dir_sizes, file_size):
+    """生成users.json、sessions.json、BENCH_USER的各规模目录和下载用的文件，返回BENCH_USER的会话token"""
+    from password_hasher import PasswordHasher
+
+    data_dir = os.path.join(work_dir, 'data')
+    user_root = os.path.join(work_dir, 'files', BENCH_USER)
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(user_root, exist_ok=True)
+
+    # 所有用户使用同一个密码哈希，生成大量用户时不需要逐个计算
+    password_hash = PasswordHasher().hash(BENCH_PASSWORD)
+    now = datetime.now()
+    user_data = {}
+    for i in range(users):
+        username = f'user{i:05d}'
+        user_data[username] = {
+            'password_hash': password_hash,
+            'email': f'{username}@bench.local',
+            'created_at': now.isoformat(),
+            'last_login': None,
+            'is_verified': False,
+            'user_dir': username
+        }
+
+    session_data = {}
+    bench_tokens = []
+    expires_at = (now + timedelta(days=1)).isoformat()
+    for i in range(sessions):
+        token = secrets.token_urlsafe(32)
+        username = f'user{i % users:05d}'
+        session_data[token] = {'username': username, 'created_at': now.isoformat(), 'expires_at': expires_at}
+        if username == BENCH_USER:
+            bench_tokens.append(token)
+
+    for name, content in (('users.json', user_data), ('sessions.json', session_data), ('reset_tokens.json', {})):
+        with open(os.path.join(data_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(content, f)
+
+    for size in dir_sizes:
+        dir_path = os.path.join(user_root, f'dir_{size}')
+        os.makedirs(dir_path)
+        for i in range(size):
+            open(os.path.join(dir_path, f'file{i:06d}.txt'), 'wb').close()
+
+    with open(os.path.join(user_root, 'download.zip'), 'wb') as f:
+        f.write(os.urandom(file_size))
+    return bench_tokens, list(session_data)
+
+
+# ---- 进程内（Flask测试客户端） ----
+
+def run_inprocess(args, bench_tokens, all_tokens):
+    """直接调用和通过Flask测试客户端测量各热点路径"""
+    import server
+    app = server.create_app()
+    file_manager = server.file_manager
+    try:
+        return _measure_inprocess(args, app, file_manager, bench_tokens, all_tokens)
+    finally:
+        # 在切换回原工作目录之前写回数据
+        file_manager.shutdown()
+
+
+def _measure_inprocess(args, app, file_manager, bench_tokens, all_tokens):
+    # 等待启动时的索引扫描结束，避免与测量争用磁盘
+    file_manager.search_index.wait_idle()
+
+    rng = random.Random(0)
+    results = []
+    iterations = args.iterations
+
+    print("进程内:")
+    results.append(measure('verify_session', lambda i: file_manager.user_manager.verify_session(
+        all_tokens[rng.randrange(len(all_tokens))]), iterations))
+
+    for size in args.dir_sizes:
+        path = f'dir_{size}'
+        # 大目录每次冷启动列表都要扫描整个目录，次数按规模减少
+        repeat = max(3, min(iterations, 1000000 // max(size, 1)))
+
+        def list_cold(i, path=path):
+            file_manager.dir_cache.clear()
+            file_manager.list_files(BENCH_USER, path)
+        results.append(measure(f'list_files_cold[{size}]', list_cold, repeat))
+        results.append(measure(f'list_files_warm[{size}]',
+                               lambda i, path=path: file_manager.list_files(BENCH_USER, path), repeat))
+
+    client = app.test_client()
+    headers = {'X-Session-Token': bench_tokens[0]}
+
+    def get(url):
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, (url, response.status_code)
+        data = response.get_data()
+        response.close()
+        return data
+
+    results.append(measure('http_user_info', lambda i: get('/api/user/info'), iterations))
+    for size in args.dir_sizes:
+        repeat = max(3, min(iterations, 1000000 // max(size, 1)))
+        results.append(measure(f'http_list_files[{size}]',
+                               lambda i, size=size: get(f'/api/files?path=dir_{size}&limit=100'), repeat))
+
+    # 登录和注册的耗时主要在密码哈希上
+    def login(i):
+        response = client.post('/api/login', json={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+        assert response.status_code == 200, response.get_json()
+    results.append(measure('http_login', login, args.auth_iterations))
+
+    run_id = secrets.token_hex(4)
+
+    def register(i):
+        username = f'reg{run_id}{i:05d}'
+        response = client.post('/api/register', json={'username': username, 'password': BENCH_PASSWORD,
+                                                      'email': f'{username}@bench.local'})
+        assert response.status_code == 200, response.get_json()
+    results.append(measure('http_register', register, args.auth_iterations))
+
+    payload = os.urandom(args.file_size)
+
+    def upload(i):
+        response = client.post('/api/upload', headers=headers, content_type='multipart/form-data',
+                               data={'path': '', 'file': (BytesIO(payload), 'upload.zip')})
+        assert response.status_code == 200, response.get_json()
+    results.append(measure('http_upload', upload, args.transfer_iterations, args.file_size))
+
+    def download(i):
+        assert len(get('/api/download?path=&filename=download.zip')) == args.file_size
+    results.append(measure('http_download', download, args.transfer_iterations, args.file_size))
+    return results
+
+
+# ---- 真实服务器并发压测 ----
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(args, work_dir, port, env):
+    """在work_dir中启动服务器子进程，等待端口可用"""
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+                   '--pythonpath', REPO_DIR, '-b', f'127.0.0.1:{port}', 'wsgi:app']
+    else:
+        command = [sys.executable, os.path.join(REPO_DIR, 'server.py'), '--host', '127.0.0.1',
+                   '--port', str(port), '--threads', str(args.threads)]
+    log = open(os.path.join(work_dir, 'server.log'), 'wb')
+    process = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，见 {log.name}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/metrics')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("等待服务器启动超时")
+
+
+def load_test(name, port, method, url, tokens, concurrency, duration):
+    """concurrency个线程各自保持一个长连接，在duration秒内不断发送请求"""
+    latencies = []
+    errors = [0]
+    received = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        token = tokens[index % len(tokens)]
+        local_latencies = []
+        local_errors = local_bytes = 0
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request(method, url, headers={'X-Session-Token': token})
+                response = connection.getresponse()
+                body = response.read()
+                if response.status >= 400:
+                    local_errors += 1
+                    continue
+                local_bytes += len(body)
+                local_latencies.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+            received[0] += local_bytes
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(name, latencies, elapsed, {
+        'concurrency': concurrency,
+        'errors': errors[0],
+        'mb_per_sec': round(received[0] / elapsed / 1e6, 2)
+    })
+    print(f"  {name}: {result.get('ops_per_sec')} req/s, p50 {result.get('p50_ms')} ms, "
+          f"p99 {result.get('p99_ms')} ms, 错误 {errors[0]}")
+    return result
+
+
+def run_server_load(args, work_dir, bench_tokens):
+    """启动真实服务器并发压测"""
+    port = args.port or _free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    process = _start_server(args, work_dir, port, env)
+    print(f"并发压测（{args.server}，{args.concurrency} 个连接，每项 {args.duration} 秒）:")
+    scenarios = [('load_user_info', 'GET', '/api/user/info')]
+    scenarios += [(f'load_list_files[{size}]', 'GET', f'/api/files?path=dir_{size}&limit=100')
+                  for size in args.dir_sizes]
+    scenarios.append(('load_download', 'GET', '/api/download?path=&filename=download.zip'))
+    try:
+        return [load_test(name, port, method, url, bench_tokens, args.concurrency, args.duration)
+                for name, method, url in scenarios]
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ---- 结果 ----
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """与之前的结果对比吞吐量，打印变化比例"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {item['name']: item for item in json.load(f)['results']}
+    print(f"与 {baseline_path} 对比（ops/s，>1表示更快）:")
+    for item in results:
+        old = baseline.get(item['name'])
+        if not old or not old.get('ops_per_sec') or not item.get('ops_per_sec'):
+            continue
+        ratio = item['ops_per_sec'] / old['ops_per_sec']
+        flag = '  <-- 变慢' if ratio < 0.9 else ''
+        print(f"  {item['name']:<32} {old['ops_per_sec']:>12} -> {item['ops_per_sec']:>12}  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件管理器基准测试')
+    parser.add_argument('--quick', action='store_true', help='小规模快速运行')
+    parser.add_argument('--users', type=int, default=10000, help='users.json中的用户数')
+    parser.add_argument('--sessions', type=int, default=100000, help='sessions.json中的会话数')
+    parser.add_argument('--dir-sizes', default='10,10000,100000', help='测试目录的文件数，逗号分隔')
+    parser.add_argument('--file-size', type=int, default=16 * 1024 * 1024, help='上传下载测试的文件大小（字节）')
+    parser.add_argument('--iterations', type=int, default=2000, help='轻量操作的重复次数')
+    parser.add_argument('--auth-iterations', type=int, default=20, help='登录和注册的重复次数')
+    parser.add_argument('--transfer-iterations', type=int, default=10, help='上传和下载的重复次数')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json', help='用户存储后端')
+    parser.add_argument('--server', choices=('waitress', 'gunicorn', 'none'), default='waitress',
+                        help='并发压测使用的服务器，none表示只运行进程内测试')
+    parser.add_argument('--threads', type=int, default=16, help='waitress线程数')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发连接数')
+    parser.add_argument('--duration', type=float, default=10, help='每项压测的秒数')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json', help='JSON结果文件')
+    parser.add_argument('--compare', help='对比的基准结果文件')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录')
+    args = parser.parse_args()
+    if args.quick:
+        args.users, args.sessions, args.dir_sizes = 100, 1000, '10,1000'
+        args.file_size, args.iterations, args.auth_iterations = 1024 * 1024, 200, 3
+        args.transfer_iterations, args.duration = 3, 2
+    args.dir_sizes = [int(size) for size in args.dir_sizes.split(',') if size]
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    work_dir = tempfile.mkdtemp(prefix='file-manager-bench-')
+    original_cwd = os.getcwd()
+    sys.path.insert(0, REPO_DIR)
+    if args.server == 'gunicorn':
+        # gunicorn多进程时会话需要在进程间共享
+        args.backend = 'sqlite'
+    os.environ['FILE_MANAGER_BACKEND'] = args.backend
+    try:
+        print(f"生成测试数据: {args.users} 用户, {args.sessions} 会话, 目录 {args.dir_sizes} -> {work_dir}")
+        started = time.perf_counter()
+        bench_tokens, all_tokens = build_fixtures(work_dir, args.users, args.sessions, args.dir_sizes,
+                                                  args.file_size)
+        print(f"  耗时 {time.perf_counter() - started:.1f} 秒")
+        if not bench_tokens:
+            raise SystemExit("没有属于测试用户的会话，请增加--sessions")
+
+        # 服务器使用相对于当前目录的data/和files/
+        os.chdir(work_dir)
+        results = run_inprocess(args, bench_tokens, all_tokens)
+        if args.server != 'none':
+            results += run_server_load(args, work_dir, bench_tokens)
+    finally:
+        os.chdir(original_cwd)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
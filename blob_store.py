@@ -0,0 +1,265 @@
+import os
+import time
+import errno
+import shutil
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from file_ops import temp_name, WRITING_SUFFIX
+
+try:
+    import fcntl
+except ImportError:
+    # Windows上只以单个进程运行（waitress），进程内的锁已经足够
+    fcntl = None
+
+# 计算哈希和复制数据时每次读取的块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """内容寻址的去重存储
+
+    上传的内容边接收边计算SHA-256，按哈希保存在data/blobs/<前2位>/<哈希>中，每份内容只存一次；
+    用户目录中的文件是指向blob的硬链接，引用计数就是blob的链接数减一，用户文件无论通过
+    哪种方式删除，引用计数都会自动减少，链接数为1的blob在垃圾回收时删除。
+    POSIX系统上blob设为只读，服务器对用户文件的所有写入都通过写临时文件后重命名完成，
+    不会原地修改被多个文件共享的内容。
+
+    客户端上传前可以提供哈希和大小，如果该用户之前上传过相同内容，服务器直接创建链接，
+    不需要传输数据。只对上传过该内容的用户开放这一捷径，避免其他用户仅凭哈希取得文件。
+
+    同一内容的所有用户文件是同一个inode，共享修改时间（内容第一次存入的时间）和只读权限。
+    多个服务器进程共用存储时，放入blob、创建链接和垃圾回收由store_dir/lock文件锁互斥。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS owners (
+            hash TEXT NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (hash, username)
+        );
+    """
+
+    def __init__(self, store_dir='data/blobs', gc_interval=3600):
+        self.store_dir = store_dir
+        self.tmp_dir = os.path.join(store_dir, 'tmp')
+        self.gc_interval = gc_interval
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._lock_file = open(os.path.join(store_dir, 'lock'), 'a') if fcntl is not None else None
+        self._lock_depth = 0
+        self._conn = sqlite3.connect(os.path.join(store_dir, 'index.db'), timeout=30,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        self._last_gc = 0
+        self.stats = {
+            'ingested': 0,
+            'deduplicated': 0,
+            'bytes_saved': 0,
+            'transfers_skipped': 0
+        }
+
+    @contextmanager
+    def _exclusive(self):
+        """进程内和进程间互斥：线程锁之外再对锁文件加flock（可重入）"""
+        with self._lock:
+            if self._lock_file is not None and self._lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_file is not None and self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def blob_path(self, digest):
+        """blob的存储路径"""
+        return os.path.join(self.store_dir, digest[:2], digest)
+
+    @staticmethod
+    def is_valid_digest(digest):
+        """是否是合法的SHA-256十六进制字符串"""
+        return isinstance(digest, str) and len(digest) == 64 and \
+            all(c in '0123456789abcdef' for c in digest)
+
+    def has_blob(self, digest, size, username):
+        """该用户是否上传过这份内容（哈希和大小都匹配且blob仍然存在）"""
+        if not self.is_valid_digest(digest):
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM blobs JOIN owners ON owners.hash = blobs.hash '
+                'WHERE blobs.hash = ? AND blobs.size = ? AND owners.username = ?',
+                (digest, size, username)).fetchone()
+        return row is not None and os.path.isfile(self.blob_path(digest))
+
+    # ---- 写入 ----
+
+    def _commit(self, tmp_path, digest, size, username, target_path):
+        """把计算好哈希的临时文件放入存储（内容已存在时丢弃临时文件）并链接到target_path
+
+        放入存储和创建链接在同一个（跨进程的）锁内完成，垃圾回收不会在两者之间删除blob。
+        """
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with self._exclusive():
+            if os.path.isfile(blob_path):
+                os.remove(tmp_path)
+                self.stats['deduplicated'] += 1
+                self.stats['bytes_saved'] += size
+            else:
+                if os.name == 'posix':
+                    os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, blob_path)
+            self.stats['ingested'] += 1
+            self._conn.execute('INSERT OR IGNORE INTO blobs (hash, size, created_at) VALUES (?, ?, ?)',
+                               (digest, size, time.time()))
+            self._conn.execute('INSERT OR IGNORE INTO owners (hash, username) VALUES (?, ?)',
+                               (digest, username))
+            self._link(digest, target_path)
+
+    def ingest_stream(self, stream, username, target_path):
+        """边读取边计算哈希并写入存储，完成后链接到target_path，返回(哈希, 大小)"""
+        self.maybe_gc()
+        tmp_path = os.path.join(self.tmp_dir, temp_name('upload', WRITING_SUFFIX))
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            self._commit(tmp_path, digest, size, username, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest, size
+
+    def _same_device(self, file_path):
+        """文件是否与存储在同一个文件系统上（可以直接重命名进存储）"""
+        return os.stat(file_path).st_dev == os.stat(self.tmp_dir).st_dev
+
+    def ingest_file(self, file_path, username, target_path):
+        """计算已有文件（如分块上传的临时文件）的哈希，移入存储后链接到target_path，返回(哈希, 大小)
+
+        文件与存储不在同一个文件系统上时无法重命名，先复制到存储的临时目录，完成后删除原文件。
+        """
+        if not self._same_device(file_path):
+            with open(file_path, 'rb') as f:
+                result = self.ingest_stream(f, username, target_path)
+            os.remove(file_path)
+            return result
+
+        self.maybe_gc()
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        size = os.path.getsize(file_path)
+        digest = hasher.hexdigest()
+        self._commit(file_path, digest, size, username, target_path)
+        return digest, size
+
+    def _link(self, digest, target_path):
+        """在target_path创建指向blob的硬链接（原子替换已有文件），无法创建硬链接时复制内容（调用方需持有_exclusive）"""
+        blob_path = self.blob_path(digest)
+        tmp_path = os.path.join(os.path.dirname(target_path),
+                                temp_name(os.path.basename(target_path), WRITING_SUFFIX))
+        try:
+            try:
+                os.link(blob_path, tmp_path)
+            except OSError as e:
+                # 跨文件系统或文件系统不支持硬链接时退化为复制
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                shutil.copyfile(blob_path, tmp_path)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def link_existing(self, digest, size, username, target_path):
+        """客户端声明已有内容时直接创建链接，内容不属于该用户时返回False"""
+        with self._exclusive():
+            if not self.has_blob(digest, size, username):
+                return False
+            self._link(digest, target_path)
+            self.stats['transfers_skipped'] += 1
+            self.stats['bytes_saved'] += size
+        return True
+
+    # ---- 垃圾回收 ----
+
+    def maybe_gc(self):
+        """距离上次垃圾回收超过gc_interval时执行一次"""
+        if time.time() - self._last_gc >= self.gc_interval:
+            self.gc()
+
+    def gc(self):
+        """删除没有用户文件引用（链接数为1）的blob和遗留的临时文件，返回删除的blob数"""
+        self._last_gc = time.time()
+        removed = []
+        for prefix in os.listdir(self.store_dir):
+            prefix_dir = os.path.join(self.store_dir, prefix)
+            if prefix == 'tmp' or len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for digest in os.listdir(prefix_dir):
+                blob_path = os.path.join(prefix_dir, digest)
+                with self._exclusive():
+                    try:
+                        if os.stat(blob_path).st_nlink > 1:
+                            continue
+                        os.chmod(blob_path, 0o644)
+                        os.remove(blob_path)
+                    except OSError as e:
+                        print(f"回收blob失败 {blob_path}: {e}")
+                        continue
+                    self._conn.execute('DELETE FROM blobs WHERE hash = ?', (digest,))
+                    self._conn.execute('DELETE FROM owners WHERE hash = ?', (digest,))
+                removed.append(digest)
+
+        # 超过一天的临时文件是中断的上传留下的
+        for name in os.listdir(self.tmp_dir):
+            tmp_path = os.path.join(self.tmp_dir, name)
+            try:
+                if time.time() - os.path.getmtime(tmp_path) > 24 * 3600:
+                    os.remove(tmp_path)
+            except OSError:
+                pass
+        return len(removed)
+
+    def get_stats(self):
+        """获取去重统计信息"""
+        with self._lock:
+            blobs, stored_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+            stats = dict(self.stats)
+        stats['blobs'] = blobs
+        stats['stored_bytes'] = stored_bytes
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            if self._lock_file is not None:
+                self._lock_file.close()
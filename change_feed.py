@@ -0,0 +1,247 @@
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from collections import deque
+
+# 每个用户（内存模式）或全部用户（共享模式）保留的事件数，更早的事件丢弃
+MAX_EVENTS = 10000
+
+# 一次读取返回的最多事件数
+READ_LIMIT = 1000
+
+# 共享模式下等待其他进程写入的事件时查询数据库的间隔（秒）
+SHARED_POLL_INTERVAL = 0.5
+
+# 用于合并重复事件：与同一文件最近的若干个事件比较
+_RECENT_WINDOW = 256
+
+
+class ChangeFeed:
+    """按用户划分的文件变更事件流
+
+    服务器自己的修改路径（上传、新建文件夹、删除、移动等）和inotify事件都发布到这里，
+    客户端用游标读取之后的created、deleted、modified事件，增量更新界面而不必重新获取
+    整个目录列表。created和modified事件带有文件信息（与列表接口的格式相同）。
+
+    游标形如"<纪元>-<序号>"：纪元在内存模式下每次启动重新生成，在共享模式下随数据库
+    创建，事件丢失（inotify队列溢出）时调用reset()更换；游标过期（服务器重启、事件已被
+    丢弃或纪元已更换）时读取结果带reset标记，客户端应重新获取列表后从新的游标继续。
+
+    事件以用户的文件目录（如files/<user_dir>）区分，inotify事件只知道目录，不知道用户名。
+    多个服务器进程时（db_path不为None）事件写入共享的SQLite数据库，等待中的读取定期
+    查询数据库，以收到其他进程发布的事件。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner TEXT NOT NULL,
+            path TEXT NOT NULL,
+            name TEXT NOT NULL,
+            action TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            file TEXT,
+            time REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS events_owner ON events (owner, id);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    '''
+
+    def __init__(self, db_path=None, max_events=MAX_EVENTS):
+        self.max_events = max_events
+        self._condition = threading.Condition()
+        self._closed = False
+        self._recent = deque(maxlen=_RECENT_WINDOW)
+        self._conn = None
+        if db_path is None:
+            self._epoch = secrets.token_hex(4)
+            self._seq = 0
+            self._events = {}
+            self._dropped = {}
+        else:
+            self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(self.SCHEMA)
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)",
+                               (secrets.token_hex(4),))
+            self._epoch = self._conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+            self._inserts = 0
+
+    def _is_duplicate(self, owner, path, name, action, is_dir, file_info):
+        """同一文件最近一次事件与本次相同（如服务器的修改随后又收到inotify事件）时返回True"""
+        signature = (action == 'deleted', is_dir,
+                     file_info and (file_info['size'], file_info['mtime']))
+        for recent_key, recent_signature in reversed(self._recent):
+            if recent_key == (owner, path, name):
+                if recent_signature == signature:
+                    return True
+                break
+        self._recent.append(((owner, path, name), signature))
+        return False
+
+    def publish(self, owner, path, name, action, is_dir=False, file_info=None):
+        """发布事件：owner为用户文件目录，path为所在目录的相对路径，action为'created'、'deleted'或'modified'"""
+        with self._condition:
+            if self._closed or self._is_duplicate(owner, path, name, action, is_dir, file_info):
+                return
+            event_time = time.time()
+            if self._conn is None:
+                self._seq += 1
+                events = self._events.setdefault(owner, deque())
+                events.append((self._seq, path, name, action, is_dir, file_info, event_time))
+                if len(events) > self.max_events:
+                    self._dropped[owner] = events.popleft()[0]
+            else:
+                try:
+                    self._insert(owner, path, name, action, is_dir, file_info, event_time)
+                except sqlite3.Error as e:
+                    print(f"写入变更事件失败: {e}")
+                    return
+            self._condition.notify_all()
+
+    def _insert(self, owner, path, name, action, is_dir, file_info, event_time):
+        cursor = self._conn.execute(
+            'INSERT INTO events (owner, path, name, action, is_dir, file, time) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (owner, path, name, action, int(is_dir), json.dumps(file_info) if file_info else None, event_time))
+        # 定期删除最早的事件，并记下被删除的最大序号，用于判断游标是否过期
+        self._inserts += 1
+        if self._inserts % 256 == 0:
+            dropped = cursor.lastrowid - self.max_events
+            if dropped > 0:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    self._conn.execute('DELETE FROM events WHERE id <= ?', (dropped,))
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dropped', ?)",
+                                       (str(dropped),))
+                    self._conn.execute('COMMIT')
+                except sqlite3.Error:
+                    self._conn.execute('ROLLBACK')
+                    raise
+
+    def reset(self):
+        """更换纪元，使所有客户端的游标过期并重新获取列表（有事件丢失时使用）"""
+        with self._condition:
+            if self._closed:
+                return
+            epoch = secrets.token_hex(4)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', ?)", (epoch,))
+                except sqlite3.Error as e:
+                    print(f"更换变更事件纪元失败: {e}")
+                    return
+            self._epoch = epoch
+            self._condition.notify_all()
+
+    def _refresh_epoch(self):
+        """共享模式下载入其他进程更换的纪元（调用时持有锁）"""
+        if self._conn is None:
+            return
+        try:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()
+        except sqlite3.Error as e:
+            print(f"读取变更事件纪元失败: {e}")
+            return
+        if row:
+            self._epoch = row[0]
+
+    def _format_cursor(self, seq):
+        return f'{self._epoch}-{seq}'
+
+    def _parse_cursor(self, cursor):
+        """返回游标中的序号，游标不属于当前纪元时返回None"""
+        epoch, _, seq = (cursor or '').partition('-')
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _latest_seq(self):
+        if self._conn is None:
+            return self._seq
+        row = self._conn.execute('SELECT MAX(id) FROM events').fetchone()
+        return row[0] or 0
+
+    def current_cursor(self):
+        """指向最新事件之后的游标"""
+        with self._condition:
+            self._refresh_epoch()
+            return self._format_cursor(self._latest_seq())
+
+    def _read(self, owner, seq):
+        """读取序号之后的事件，返回(事件列表, 最后的序号, 是否过期)，调用时持有锁"""
+        if self._conn is None:
+            if seq > self._seq or seq < self._dropped.get(owner, 0):
+                return [], self._seq, True
+            rows = [event for event in self._events.get(owner, ()) if event[0] > seq][:READ_LIMIT]
+            # 没有该用户的事件时游标前进到最新，避免反复扫描
+            last = rows[-1][0] if len(rows) == READ_LIMIT else self._seq
+        else:
+            dropped = self._conn.execute("SELECT value FROM meta WHERE key = 'dropped'").fetchone()
+            latest = self._latest_seq()
+            if seq > latest or seq < int(dropped[0] if dropped else 0):
+                return [], latest, True
+            rows = self._conn.execute(
+                'SELECT id, path, name, action, is_dir, file, time FROM events '
+                'WHERE owner = ? AND id > ? AND id <= ? ORDER BY id LIMIT ?',
+                (owner, seq, latest, READ_LIMIT)).fetchall()
+            rows = [(row[0], row[1], row[2], row[3], bool(row[4]), json.loads(row[5]) if row[5] else None, row[6])
+                    for row in rows]
+            last = rows[-1][0] if len(rows) == READ_LIMIT else latest
+        events = [{
+            'id': self._format_cursor(row[0]),
+            'path': row[1],
+            'name': row[2],
+            'action': row[3],
+            'is_dir': row[4],
+            'file': row[5],
+            'time': row[6]
+        } for row in rows]
+        return events, last, False
+
+    def wait(self, owner, cursor, timeout=25, paths=None):
+        """读取游标之后的事件，没有新事件时最多等待timeout秒
+
+        paths不为None时只返回这些目录（相对路径）中的事件。
+        返回(事件列表, 新游标, 是否需要重新获取列表)。
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._refresh_epoch()
+            epoch = self._epoch
+            seq = self._parse_cursor(cursor)
+            if seq is None:
+                return [], self._format_cursor(self._latest_seq()), True
+            while True:
+                # 等待期间纪元被更换（有事件丢失）
+                if self._conn is not None:
+                    self._refresh_epoch()
+                if self._epoch != epoch:
+                    return [], self._format_cursor(self._latest_seq()), True
+                try:
+                    events, seq, reset = self._read(owner, seq)
+                except sqlite3.Error as e:
+                    print(f"读取变更事件失败: {e}")
+                    events, reset = [], False
+                if paths is not None:
+                    events = [event for event in events if event['path'] in paths]
+                remaining = deadline - time.monotonic()
+                if events or reset or remaining <= 0 or self._closed:
+                    return events, self._format_cursor(seq), reset
+                self._condition.wait(remaining if self._conn is None else min(remaining, SHARED_POLL_INTERVAL))
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """唤醒所有等待中的读取，关闭数据库"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+            if self._conn is not None:
+                self._conn.close()
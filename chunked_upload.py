@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import secrets
+import threading
+from contextlib import contextmanager
+from user_store import JsonFilePersister, write_file_atomic
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 上传中的临时文件后缀，列目录时隐藏
+PART_SUFFIX = '.uploading'
+
+# 单个分块的最大大小
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# 从请求体复制数据时的缓冲区大小
+COPY_BUFFER_SIZE = 256 * 1024
+
+
+def is_partial_file(name):
+    """是否是分块上传的临时文件"""
+    return name.startswith('.') and name.endswith(PART_SUFFIX)
+
+
+def _merge_range(ranges, start, stop):
+    """把[start, stop)合并进已排序且互不重叠的范围列表"""
+    merged = []
+    placed = False
+    for s, e in ranges:
+        if e < start:
+            merged.append([s, e])
+        elif stop < s:
+            if not placed:
+                merged.append([start, stop])
+                placed = True
+            merged.append([s, e])
+        else:
+            start, stop = min(s, start), max(e, stop)
+    if not placed:
+        merged.append([start, stop])
+    return merged
+
+
+class UploadManager:
+    """分块、可续传的上传
+
+    create()在用户目录中创建与目标文件同目录的临时文件，各分块按偏移直接写入
+    该文件（可并行上传），finalize()确认所有字节都已收到后原子重命名为目标文件。
+    上传状态保存在data/uploads.json中，服务器重启后可以继续；超过expire_seconds
+    没有活动的上传不再计入配额预留，由后台清理线程（start_sweeper）或创建上传时清理。
+
+    多个服务器进程共同处理上传时（shared=True，需要POSIX文件锁），每次访问状态前
+    加文件锁并载入其他进程的修改，修改后立即写盘，同一上传的分块可以落在不同进程上。
+    """
+
+    def __init__(self, data_dir='data', expire_seconds=24 * 3600, persist_delay=1, shared=False):
+        if shared and fcntl is None:
+            raise ValueError("多进程共享上传状态需要POSIX文件锁")
+        self.uploads_file = os.path.join(data_dir, 'uploads.json')
+        self.expire_seconds = expire_seconds
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._uploads = self._load()
+        self._version = self._file_version()
+        self._persister = JsonFilePersister(self.uploads_file, self._serialize, persist_delay)
+        self._last_expire = 0
+        self._sweeper_stop = threading.Event()
+        self._sweeper_thread = None
+
+    def _load(self):
+        """加载上传状态"""
+        try:
+            with open(self.uploads_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _file_version(self):
+        """状态文件的版本（修改时间和大小），文件不存在时返回None"""
+        try:
+            stat = os.stat(self.uploads_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _snapshot(self):
+        """复制上传状态（调用方需持有_lock）"""
+        return {upload_id: dict(upload, received=[list(r) for r in upload['received']])
+                for upload_id, upload in self._uploads.items()}
+
+    def _serialize(self):
+        """复制上传状态用于写盘"""
+        with self._lock:
+            return self._snapshot()
+
+    @contextmanager
+    def _state(self, modify=False):
+        """访问上传状态；共享模式下持有文件锁，先载入其他进程的修改，modify时退出前写盘"""
+        with self._lock:
+            if not self.shared:
+                yield
+                return
+            with open(self.uploads_file + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                version = self._file_version()
+                if version != self._version:
+                    self._uploads = self._load()
+                yield
+                if modify:
+                    write_file_atomic(self.uploads_file, json.dumps(self._snapshot(), ensure_ascii=False,
+                                                                    separators=(',', ':')))
+                self._version = self._file_version()
+
+    def _changed(self):
+        """修改后安排写盘（共享模式下已在_state中写入）"""
+        if not self.shared:
+            self._persister.mark_dirty()
+
+    def flush(self):
+        """立即写入未保存的修改"""
+        self._persister.flush()
+
+    def _public(self, upload):
+        """上传状态中可以返回给客户端的部分"""
+        received_bytes = sum(e - s for s, e in upload['received'])
+        return {
+            'upload_id': upload['id'],
+            'path': upload['path'],
+            'filename': upload['filename'],
+            'size': upload['size'],
+            'received': [list(r) for r in upload['received']],
+            'received_bytes': received_bytes,
+            'complete': received_bytes == upload['size'],
+            'max_chunk_size': MAX_CHUNK_SIZE
+        }
+
+    def _get(self, upload_id, username):
+        """获取属于该用户的上传（调用方需持有_lock）"""
+        upload = self._uploads.get(upload_id)
+        if upload is None or upload['username'] != username:
+            return None
+        return upload
+
+    def create(self, username, path, filename, size, dir_path):
+        """创建上传，返回(是否成功, 上传状态或错误信息)"""
+        self.expire_stale()
+
+        part_name = f".{filename}.{secrets.token_hex(8)}{PART_SUFFIX}"
+        part_path = os.path.join(dir_path, part_name)
+        try:
+            os.makedirs(dir_path, exist_ok=True)
+            # 预先设置文件大小（稀疏文件），各分块可以按偏移并行写入
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+        except OSError as e:
+            return False, f"创建上传失败: {str(e)}"
+
+        now = time.time()
+        upload = {
+            'id': secrets.token_urlsafe(16),
+            'username': username,
+            'path': path,
+            'filename': filename,
+            'size': size,
+            'part_path': part_path,
+            'target_path': os.path.join(dir_path, filename),
+            'received': [],
+            'created_at': now,
+            'updated_at': now
+        }
+        with self._state(modify=True):
+            self._uploads[upload['id']] = upload
+            result = self._public(upload)
+        self._changed()
+        return True, result
+
+    def write_chunk(self, upload_id, username, offset, length, stream):
+        """把请求体中的一个分块写入临时文件的offset处，返回(是否成功, 上传状态或错误信息)"""
+        with self._state():
+            upload = self._get(upload_id, username)
+            if upload is None:
+                return False, "上传不存在或已过期"
+            part_path, size = upload['part_path'], upload['size']
+
+        if offset < 0 or length < 0 or offset + length > size:
+            return False, "分块超出文件范围"
+        if length > MAX_CHUNK_SIZE:
+            return False, "分块过大"
+
+        written = 0
+        try:
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                while written < length:
+                    data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+        except OSError as e:
+            return False, f"写入分块失败: {str(e)}"
+
+        if written != length:
+            return False, "分块数据不完整"
+
+        with self._state(modify=True):
+            upload = self._get(upload_id, username)
+            if upload is None:
+                return False, "上传不存在或已过期"
+            if length:
+                upload['received'] = _merge_range(upload['received'], offset, offset + length)
+            upload['updated_at'] = time.time()
+            result = self._public(upload)
+        self._changed()
+        return True, result
+
+    def status(self, upload_id, username):
+        """查询上传状态，上传不存在时返回None"""
+        with self._state():
+            upload = self._get(upload_id, username)
+            return self._public(upload) if upload is not None else None
+
+    def _is_stale(self, upload, now):
+        return now - upload['updated_at'] > self.expire_seconds
+
+    def reserved_bytes(self, username):
+        """用户所有未完成上传预留的字节数（用于配额检查），已过期的上传不计入"""
+        now = time.time()
+        with self._state():
+            return sum(upload['size'] for upload in self._uploads.values()
+                       if upload['username'] == username and not self._is_stale(upload, now))
+
+    def finalize(self, upload_id, username, commit=None):
+        """确认所有分块都已收到后把临时文件重命名为目标文件，返回(是否成功, 上传状态或错误信息)
+
+        commit(临时文件, 目标文件)可以替换默认的重命名（如放入去重存储后再链接）。
+        """
+        with self._state(modify=True):
+            upload = self._get(upload_id, username)
+            if upload is None:
+                return False, "上传不存在或已过期"
+            result = self._public(upload)
+            if not result['complete']:
+                return False, "还有分块未上传"
+            del self._uploads[upload_id]
+
+        try:
+            (commit or os.replace)(upload['part_path'], upload['target_path'])
+        except Exception as e:
+            # 临时文件可能仍然存在，恢复上传状态，客户端可以重试或取消
+            with self._state(modify=True):
+                self._uploads[upload_id] = upload
+            return False, f"保存文件失败: {str(e)}"
+        finally:
+            self._changed()
+        return True, result
+
+    def abort(self, upload_id, username):
+        """取消上传并删除临时文件"""
+        with self._state(modify=True):
+            upload = self._get(upload_id, username)
+            if upload is None:
+                return False
+            del self._uploads[upload_id]
+        self._remove_part(upload)
+        self._changed()
+        return True
+
+    def _remove_part(self, upload):
+        """删除上传的临时文件"""
+        try:
+            os.remove(upload['part_path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"删除上传临时文件失败 {upload['part_path']}: {e}")
+
+    def expire_stale(self, force=False):
+        """清理长时间没有活动的上传，返回清理数量（非强制时每小时最多执行一次）"""
+        now = time.time()
+        if not force and now - self._last_expire < min(self.expire_seconds, 3600):
+            return 0
+        self._last_expire = now
+
+        with self._state(modify=True):
+            stale = [upload for upload in self._uploads.values() if self._is_stale(upload, now)]
+            for upload in stale:
+                del self._uploads[upload['id']]
+        for upload in stale:
+            self._remove_part(upload)
+        if stale:
+            self._changed()
+        return len(stale)
+
+    def _sweeper_loop(self, interval):
+        while not self._sweeper_stop.wait(interval):
+            try:
+                expired = self.expire_stale(force=True)
+                if expired:
+                    print(f"清理过期上传: {expired} 个")
+            except Exception as e:
+                print(f"清理过期上传失败: {e}")
+
+    def start_sweeper(self, interval=3600):
+        """启动后台线程，每interval秒清理一次过期的上传"""
+        if self._sweeper_thread is not None and self._sweeper_thread.is_alive():
+            return False
+        self._sweeper_stop.clear()
+        self._sweeper_thread = threading.Thread(target=self._sweeper_loop, args=(interval,),
+                                                name='upload-sweeper', daemon=True)
+        self._sweeper_thread.start()
+        return True
+
+    def stop_sweeper(self):
+        """停止后台清理线程"""
+        self._sweeper_stop.set()
+        if self._sweeper_thread is not None:
+            self._sweeper_thread.join()
+            self._sweeper_thread = None
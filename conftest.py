@@ -0,0 +1,23 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def file_manager(tmp_path, monkeypatch):
+    """在临时目录中运行的服务器实例（data/和files/都在临时目录下）"""
+    monkeypatch.chdir(tmp_path)
+    manager = server.FileManagerServer()
+    monkeypatch.setattr(server, 'file_manager', manager)
+    yield manager
+    manager.shutdown()
+
+
+@pytest.fixture
+def client(file_manager):
+    """已登录用户tester的测试客户端"""
+    test_client = server.app.test_client()
+    test_client.post('/api/register', json={'username': 'tester', 'password': 'password', 'email': 'tester@example.com'})
+    response = test_client.post('/api/login', json={'username': 'tester', 'password': 'password'})
+    assert response.status_code == 200, response.get_json()
+    return test_client
@@ -0,0 +1,247 @@
+import math
+import zlib
+import struct
+import hashlib
+
+# 块大小的范围，未指定时约为文件大小的平方根（取2的幂）
+MIN_BLOCK_SIZE = 1024
+MAX_BLOCK_SIZE = 8 * 1024 * 1024
+
+# 强校验值：SHA-256的前16字节
+STRONG_DIGEST_SIZE = 16
+
+# 差异数据中单个数据段的最大长度
+MAX_LITERAL_SIZE = 64 * 1024 * 1024
+
+# 读写文件的缓冲区大小
+CHUNK_SIZE = 1024 * 1024
+
+# 差异数据由以下记录依次组成（整数均为大端序uint32）：
+#   b'C' + 起始块号 + 块数    从原文件复制连续的若干块
+#   b'D' + 长度 + 数据        新的数据
+OP_COPY = b'C'
+OP_DATA = b'D'
+_COPY_RECORD = struct.Struct('>II')
+_DATA_HEADER = struct.Struct('>I')
+
+# adler32的模数，滚动计算弱校验值时使用
+_ADLER_MOD = 65521
+
+
+class DeltaError(ValueError):
+    """差异数据无效或与原文件不符"""
+
+
+class BaseChangedError(DeltaError):
+    """生成签名之后原文件已被修改"""
+
+
+def choose_block_size(size):
+    """按文件大小选择块大小：约为大小的平方根，在MIN_BLOCK_SIZE和MAX_BLOCK_SIZE之间"""
+    block_size = 1 << math.isqrt(size).bit_length()
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+
+
+def weak_checksum(data):
+    """弱校验值（adler32），可以在数据上逐字节滚动计算"""
+    return zlib.adler32(data)
+
+
+def strong_checksum(data):
+    return hashlib.sha256(data).digest()[:STRONG_DIGEST_SIZE]
+
+
+def file_version(stat):
+    """文件版本标识，内容被替换或修改后改变"""
+    return f'{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}'
+
+
+def compute_signature(f, block_size):
+    """计算文件每个块的[弱校验值, 强校验值(十六进制)]，最后一块可能不满block_size"""
+    blocks = []
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        blocks.append([weak_checksum(block), strong_checksum(block).hex()])
+    return blocks
+
+
+def _read_exact(stream, size):
+    """从请求体中读取size字节，数据不足时抛出DeltaError"""
+    parts = []
+    while size > 0:
+        data = stream.read(min(size, CHUNK_SIZE))
+        if not data:
+            raise DeltaError("差异数据不完整")
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def apply_delta(base, stream, out, block_size, base_size, max_size=None):
+    """按差异数据用原文件base和新数据重建文件，写入out
+
+    边读取边写入，不在内存中保存整个文件。返回(新文件大小, SHA-256十六进制)。
+    max_size不为None时新文件超过该大小即停止并抛出DeltaError。
+    """
+    block_count = (base_size + block_size - 1) // block_size
+    hasher = hashlib.sha256()
+    written = 0
+
+    def write(data):
+        nonlocal written
+        written += len(data)
+        if max_size is not None and written > max_size:
+            raise DeltaError("重建的文件大小超过声明的大小")
+        hasher.update(data)
+        out.write(data)
+
+    while True:
+        op = stream.read(1)
+        if not op:
+            break
+        if op == OP_COPY:
+            start, count = _COPY_RECORD.unpack(_read_exact(stream, _COPY_RECORD.size))
+            if count == 0 or start + count > block_count:
+                raise DeltaError(f"块号超出范围: {start}+{count}")
+            # 最后一块可能不满block_size
+            offset = start * block_size
+            end = min((start + count) * block_size, base_size)
+            base.seek(offset)
+            while offset < end:
+                data = base.read(min(CHUNK_SIZE, end - offset))
+                if not data:
+                    raise DeltaError("原文件比签名时短")
+                write(data)
+                offset += len(data)
+        elif op == OP_DATA:
+            (length,) = _DATA_HEADER.unpack(_read_exact(stream, _DATA_HEADER.size))
+            if length > MAX_LITERAL_SIZE:
+                raise DeltaError("数据段过长")
+            while length > 0:
+                data = _read_exact(stream, min(length, CHUNK_SIZE))
+                write(data)
+                length -= len(data)
+        else:
+            raise DeltaError(f"未知的差异记录类型: {op!r}")
+    return written, hasher.hexdigest()
+
+
+def encode_copy(start, count):
+    return OP_COPY + _COPY_RECORD.pack(start, count)
+
+
+def encode_data(data):
+    return OP_DATA + _DATA_HEADER.pack(len(data)) + data
+
+
+def compute_delta(signature, f):
+    """客户端参考实现：对照服务器返回的签名，逐个生成新文件f的差异记录
+
+    与原文件对齐且未修改的块只计算一次校验值；修改过的区域按rsync的方式逐字节
+    滚动计算弱校验值查找匹配的块，这部分是纯Python实现，速度约为每秒数MB。
+    """
+    block_size = signature['block_size']
+    blocks = signature['blocks']
+    tail_size = signature['size'] % block_size
+    full_blocks = len(blocks) - (1 if tail_size else 0)
+
+    table = {}
+    for index in range(full_blocks):
+        weak, strong = blocks[index]
+        table.setdefault(weak, []).append((bytes.fromhex(strong), index))
+    tail = (blocks[-1][0], bytes.fromhex(blocks[-1][1]), full_blocks) if tail_size else None
+
+    # 连续复制的块合并为一条记录
+    pending_copy = None
+
+    def flush_copy():
+        nonlocal pending_copy
+        if pending_copy:
+            record = encode_copy(*pending_copy)
+            pending_copy = None
+            return [record]
+        return []
+
+    def copy(index):
+        nonlocal pending_copy
+        if pending_copy and pending_copy[0] + pending_copy[1] == index:
+            pending_copy = (pending_copy[0], pending_copy[1] + 1)
+            return []
+        records = flush_copy()
+        pending_copy = (index, 1)
+        return records
+
+    def literal(data):
+        records = flush_copy() if data else []
+        for start in range(0, len(data), CHUNK_SIZE):
+            records.append(encode_data(data[start:start + CHUNK_SIZE]))
+        return records
+
+    buf = b''
+    pos = 0          # 当前窗口在buf中的起点
+    literal_start = 0  # 尚未输出的新数据在buf中的起点
+    eof = False
+    rolling = None   # 当前窗口的(a, b)，None表示需要重新计算
+
+    while True:
+        # 保证缓冲区中有完整的窗口，并丢弃已经输出的数据
+        if len(buf) - pos < block_size + 1 and not eof:
+            chunk = f.read(max(CHUNK_SIZE, block_size * 2))
+            eof = not chunk
+            buf = buf[literal_start:] + chunk
+            pos -= literal_start
+            literal_start = 0
+            continue
+        # 未匹配的数据积累过多时先输出
+        if pos - literal_start >= CHUNK_SIZE:
+            yield from literal(buf[literal_start:pos])
+            literal_start = pos
+
+        if not full_blocks and not eof:
+            # 原文件没有完整的块，只需检查新文件的末尾
+            pos = max(pos, len(buf) - block_size)
+            continue
+        if len(buf) - pos < block_size or not full_blocks:
+            # 剩余不足一块：只可能与原文件的最后一块（不满的块）匹配
+            if tail and len(buf) - literal_start >= tail_size:
+                end_block = buf[len(buf) - tail_size:]
+                if weak_checksum(end_block) == tail[0] and strong_checksum(end_block) == tail[1]:
+                    yield from literal(buf[literal_start:len(buf) - tail_size])
+                    yield from copy(tail[2])
+                    yield from flush_copy()
+                    return
+            yield from literal(buf[literal_start:])
+            yield from flush_copy()
+            return
+
+        if rolling is None:
+            weak = weak_checksum(buf[pos:pos + block_size])
+            rolling = (weak & 0xffff, weak >> 16)
+        else:
+            weak = (rolling[1] << 16) | rolling[0]
+
+        candidates = table.get(weak)
+        if candidates:
+            strong = strong_checksum(buf[pos:pos + block_size])
+            match = next((index for digest, index in candidates if digest == strong), None)
+            if match is not None:
+                yield from literal(buf[literal_start:pos])
+                yield from copy(match)
+                pos += block_size
+                literal_start = pos
+                rolling = None
+                continue
+
+        if pos + block_size >= len(buf):
+            # 文件末尾的窗口没有匹配，剩余部分按不满一块处理
+            pos += block_size
+            continue
+        # 窗口右移一个字节
+        out_byte = buf[pos]
+        in_byte = buf[pos + block_size]
+        a = (rolling[0] - out_byte + in_byte) % _ADLER_MOD
+        b = (rolling[1] - block_size * out_byte + a - 1) % _ADLER_MOD
+        rolling = (a, b)
+        pos += 1
@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import errno
+import select
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 没有inotify时缓存列表的有效期（秒）：目录修改时间只反映增删和重命名，
+# 文件内容的原地修改（大小、修改时间）要等有效期过后重新扫描才能看到
+UNWATCHED_TTL = 2.0
+
+
+def _normalize(dir_path):
+    """缓存和监视使用的目录键"""
+    return os.path.normcase(os.path.abspath(dir_path))
+
+
+class CachedListing:
+    """一个目录的缓存列表：扫描结果、ETag以及按不同排序方式排好的视图"""
+
+    def __init__(self, version, entries):
+        self.version = version
+        self.entries = entries
+        self.loaded_at = time.monotonic()
+        digest = hashlib.md5(repr(entries).encode('utf-8', 'surrogateescape')).hexdigest()
+        self.etag = digest[:16]
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    def sorted_view(self, key, sorter):
+        """获取排好序的条目列表，同一排序方式只排序一次"""
+        with self._views_lock:
+            view = self._views.get(key)
+            if view is None:
+                view = self._views[key] = sorter(self.entries)
+            return view
+
+
+class DirectoryCache:
+    """目录列表缓存（LRU）
+
+    以目录的修改时间作为版本号，目录内增删文件后自动失效；服务器自身的修改路径
+    调用invalidate()主动失效；配合InotifyWatcher可以感知文件内容等外部修改。
+    没有监视器时（如Windows）列表最多缓存ttl秒，外部原地修改的文件在此之后可见。
+    """
+
+    def __init__(self, max_entries=256, watcher=None, ttl=UNWATCHED_TTL):
+        self.max_entries = max_entries
+        self.watcher = watcher
+        self.ttl = None if watcher is not None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _dir_version(self, dir_path):
+        """目录版本：修改时间（纳秒）和inode"""
+        stat = os.stat(dir_path)
+        return (stat.st_mtime_ns, stat.st_ino)
+
+    def get(self, dir_path, loader):
+        """获取目录的缓存列表，缓存不存在或已过期时调用loader(dir_path)重新扫描"""
+        key = _normalize(dir_path)
+        version = self._dir_version(dir_path)
+        with self._lock:
+            listing = self._entries.get(key)
+            if listing is not None and listing.version == version and \
+                    (self.ttl is None or time.monotonic() - listing.loaded_at < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return listing
+            self.misses += 1
+            invalidations = self.invalidations
+
+        # 先开始监视再扫描，扫描期间发生的修改也会产生事件
+        if self.watcher is not None:
+            self.watcher.add(key)
+        listing = CachedListing(version, list(loader(dir_path)))
+
+        evicted = []
+        with self._lock:
+            # 扫描期间有缓存失效时不保存本次结果，避免缓存过期数据
+            if self.invalidations != invalidations:
+                return listing
+            self._entries[key] = listing
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+
+        if self.watcher is not None:
+            for evicted_key in evicted:
+                self.watcher.remove(evicted_key)
+        return listing
+
+    def invalidate(self, dir_path):
+        """使目录的缓存失效
+
+        条目只标记为过期，仍留在LRU中，目录也继续被监视：变更事件流和搜索索引依赖
+        inotify感知之后的外部修改，监视只在条目被淘汰或目录被删除时移除。
+        """
+        key = _normalize(dir_path)
+        with self._lock:
+            listing = self._entries.get(key)
+            if listing is not None and listing.version is not None:
+                listing.version = None
+                self.invalidations += 1
+
+    def invalidate_tree(self, dir_path):
+        """使目录及其所有子目录的缓存失效（删除或移动文件夹时使用）"""
+        key = _normalize(dir_path)
+        prefix = key.rstrip(os.sep) + os.sep
+        with self._lock:
+            removed = [k for k in self._entries if k == key or k.startswith(prefix)]
+            for cached in removed:
+                del self._entries[cached]
+                self.invalidations += 1
+        if self.watcher is not None:
+            for cached in removed:
+                self.watcher.remove(cached)
+
+    def invalidate_all(self):
+        """使所有缓存失效（inotify事件队列溢出、事件丢失时使用），目录继续被监视"""
+        with self._lock:
+            for listing in self._entries.values():
+                listing.version = None
+            self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'watching': self.watcher is not None,
+                'ttl': self.ttl
+            }
+
+
+def make_etag(listing, params):
+    """根据目录列表和查询参数生成ETag"""
+    params_digest = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()[:8]
+    return f'{listing.etag}-{params_digest}'
+
+
+class InotifyWatcher:
+    """基于Linux inotify的目录监视器
+
+    只监视被add()的目录（不递归），目录内有文件创建、删除、修改、移动时
+    调用callback(目录路径, 文件名, 事件掩码)；内核事件队列溢出（事件已丢失）时调用on_overflow()。
+    其他平台上available()返回False。
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, callback, on_overflow=None):
+        self.callback = callback
+        self.on_overflow = on_overflow
+        self._libc = self._load_libc()
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(errno.EINVAL, "inotify_init1 失败")
+        self._lock = threading.Lock()
+        self._wd_to_path = {}
+        self._path_to_wd = {}
+        self._stop_read, self._stop_write = os.pipe()
+        self._thread = threading.Thread(target=self._run, name='inotify-watcher', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _load_libc():
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+
+    @staticmethod
+    def available():
+        """当前平台是否支持inotify"""
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            InotifyWatcher._load_libc()
+            return True
+        except (OSError, AttributeError):
+            return False
+
+    def add(self, dir_path):
+        """开始监视目录"""
+        with self._lock:
+            if dir_path in self._path_to_wd:
+                return True
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), self.WATCH_MASK)
+            if wd < 0:
+                return False
+            self._wd_to_path[wd] = dir_path
+            self._path_to_wd[dir_path] = wd
+            return True
+
+    def remove(self, dir_path):
+        """停止监视目录"""
+        with self._lock:
+            wd = self._path_to_wd.pop(dir_path, None)
+            if wd is None:
+                return
+            self._wd_to_path.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _run(self):
+        """读取inotify事件的后台线程"""
+        while True:
+            readable, _, _ = select.select([self._fd, self._stop_read], [], [])
+            if self._stop_read in readable:
+                break
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                print(f"读取inotify事件失败: {e}")
+                break
+            self._dispatch(data)
+
+    def _dispatch(self, data):
+        """解析事件并调用回调"""
+        offset = 0
+        header_size = self._EVENT_HEADER.size
+        while offset + header_size <= len(data):
+            wd, mask, _, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + header_size:offset + header_size + name_len].rstrip(b'\0')
+            offset += header_size + name_len
+
+            if mask & self.IN_Q_OVERFLOW:
+                print("inotify事件队列溢出，部分修改没有被感知")
+                if self.on_overflow is not None:
+                    try:
+                        self.on_overflow()
+                    except Exception as e:
+                        print(f"处理inotify事件队列溢出失败: {e}")
+                continue
+
+            with self._lock:
+                dir_path = self._wd_to_path.get(wd)
+                if mask & (self.IN_IGNORED | self.IN_DELETE_SELF | self.IN_MOVE_SELF) and dir_path:
+                    self._wd_to_path.pop(wd, None)
+                    self._path_to_wd.pop(dir_path, None)
+            if dir_path is None or mask & self.IN_IGNORED:
+                continue
+            try:
+                self.callback(dir_path, os.fsdecode(name), mask)
+            except Exception as e:
+                print(f"处理inotify事件失败: {e}")
+
+    def close(self):
+        """停止监视线程并释放inotify句柄"""
+        os.write(self._stop_write, b'x')
+        self._thread.join()
+        os.close(self._fd)
+        os.close(self._stop_read)
+        os.close(self._stop_write)
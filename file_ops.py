@@ -0,0 +1,187 @@
+import os
+import errno
+import shutil
+import secrets
+from chunked_upload import is_partial_file
+
+# 后台任务使用的隐藏临时名称后缀：等待删除的目录、正在写入的复制或压缩包
+DELETING_SUFFIX = '.deleting'
+WRITING_SUFFIX = '.writing'
+
+# 复制文件时每次读写的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def is_temp_file(name):
+    """是否是上传、删除、复制过程中的临时文件（列目录和打包时跳过）"""
+    return is_partial_file(name) or \
+        (name.startswith('.') and name.endswith((DELETING_SUFFIX, WRITING_SUFFIX)))
+
+
+def temp_name(name, suffix):
+    """生成与name同目录的隐藏临时名称"""
+    return f".{name}.{secrets.token_hex(8)}{suffix}"
+
+
+def sweep_temp_entries(root, before, job=None):
+    """删除root下遗留的删除、写入临时项目（进程崩溃或任务被中断时留下），返回删除的数量
+
+    只删除修改时间早于before（时间戳）的项目，正在进行的上传、复制等使用的临时项目不受影响。
+    """
+    removed = 0
+    for dir_path, dir_names, file_names in os.walk(root):
+        for names in (dir_names, file_names):
+            for name in list(names):
+                if not (name.startswith('.') and name.endswith((DELETING_SUFFIX, WRITING_SUFFIX))):
+                    continue
+                path = os.path.join(dir_path, name)
+                if names is dir_names:
+                    # 不进入临时目录
+                    dir_names.remove(name)
+                try:
+                    if os.lstat(path).st_mtime >= before:
+                        continue
+                    delete_path(path)
+                    removed += 1
+                except OSError as e:
+                    print(f"清理临时项目失败 {path}: {e}")
+                if job is not None:
+                    job.check_cancelled()
+    return removed
+
+
+def is_within(path, parent):
+    """path是否就是parent或位于parent之下"""
+    path = os.path.normcase(os.path.abspath(path))
+    parent = os.path.normcase(os.path.abspath(parent))
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+def _ignore_partial(directory, names):
+    """复制目录时跳过临时文件"""
+    return [name for name in names if is_temp_file(name)]
+
+
+def move_path(src, dst):
+    """移动文件或目录，同一文件系统内直接重命名，跨文件系统时复制后删除"""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
+def copy_path(src, dst):
+    """复制文件或目录（保留修改时间，不跟随符号链接），失败时清理已复制的部分"""
+    try:
+        if os.path.isdir(src) and not os.path.islink(src):
+            shutil.copytree(src, dst, symlinks=True, ignore=_ignore_partial)
+        else:
+            shutil.copy2(src, dst, follow_symlinks=False)
+    except BaseException:
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst, ignore_errors=True)
+        elif os.path.lexists(dst):
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+        raise
+
+
+def delete_path(path):
+    """删除文件或目录"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def scan_totals(path):
+    """统计文件或目录中的项目数和字节数（不跟随符号链接），用于任务进度"""
+    if not os.path.isdir(path) or os.path.islink(path):
+        return 1, os.lstat(path).st_size
+    items, total_bytes = 1, 0
+    for root, dirs, files in os.walk(path):
+        items += len(dirs) + len(files)
+        for name in files:
+            try:
+                total_bytes += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return items, total_bytes
+
+
+def delete_tree(path, job):
+    """逐个删除目录中的文件并报告进度，可在任意两项之间取消"""
+    job.set_total(*scan_totals(path))
+    if not os.path.isdir(path) or os.path.islink(path):
+        size = os.lstat(path).st_size
+        os.remove(path)
+        job.advance(1, size)
+        return
+
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            file_path = os.path.join(root, name)
+            size = os.lstat(file_path).st_size
+            os.remove(file_path)
+            job.advance(1, size)
+        for name in dirs:
+            dir_path = os.path.join(root, name)
+            if os.path.islink(dir_path):
+                os.remove(dir_path)
+            else:
+                os.rmdir(dir_path)
+            job.advance(1)
+    os.rmdir(path)
+    job.advance(1)
+
+
+def _copy_file(src, dst, job):
+    """按块复制单个文件并报告字节进度"""
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        return
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            chunk = fsrc.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            fdst.write(chunk)
+            job.advance(bytes_done=len(chunk))
+    shutil.copystat(src, dst)
+
+
+def copy_tree(src, dst, job):
+    """复制文件或目录并报告进度，可在任意两块数据之间取消；调用方负责清理未完成的dst"""
+    job.set_total(*scan_totals(src))
+    if not os.path.isdir(src) or os.path.islink(src):
+        _copy_file(src, dst, job)
+        job.advance(1)
+        return
+
+    os.mkdir(dst)
+    job.advance(1)
+    copied_dirs = []
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        copied_dirs.append((root, target_root))
+        for name in list(dirs):
+            source_dir = os.path.join(root, name)
+            if os.path.islink(source_dir):
+                os.symlink(os.readlink(source_dir), os.path.join(target_root, name))
+                dirs.remove(name)
+            elif is_temp_file(name):
+                dirs.remove(name)
+            else:
+                os.mkdir(os.path.join(target_root, name))
+            job.advance(1)
+        for name in files:
+            if not is_temp_file(name):
+                _copy_file(os.path.join(root, name), os.path.join(target_root, name), job)
+            job.advance(1)
+    # 目录内容写完后再复制目录的修改时间
+    for root, target_root in reversed(copied_dirs):
+        shutil.copystat(root, target_root)
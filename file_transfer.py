@@ -0,0 +1,209 @@
+import os
+import secrets
+import mimetypes
+import unicodedata
+from urllib.parse import quote
+from flask import Response
+from werkzeug.http import http_date
+from werkzeug.wsgi import FileWrapper
+
+# 每次从文件读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+# 合并后超过这个数量的范围请求直接返回完整文件，防止大量小范围拖慢服务器
+MAX_RANGES = 64
+
+
+def make_file_etag(stat):
+    """根据inode、大小和修改时间生成强ETag"""
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def parse_byte_ranges(header, length):
+    """解析Range请求头
+
+    返回按起始位置排序并合并重叠部分后的[(start, stop)]列表（stop不包含），
+    请求头语法无效时返回None，没有可满足的范围时返回空列表。
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        first, sep, last = spec.partition('-')
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # 后缀范围：最后N个字节
+                suffix = int(last)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                start, stop = max(length - suffix, 0), length
+            else:
+                start = int(first)
+                if start < 0:
+                    return None
+                if last:
+                    end = int(last)
+                    if end < start:
+                        return None
+                    stop = min(end + 1, length)
+                else:
+                    stop = length
+        except ValueError:
+            return None
+        if start >= length:
+            continue
+        ranges.append((start, stop))
+
+    ranges.sort()
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def content_disposition(download_name, as_attachment):
+    """生成Content-Disposition，非ASCII文件名按RFC 5987编码"""
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+        return f'{disposition}; filename="{download_name}"'
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|")
+        return f'{disposition}; filename="{fallback}"; filename*=UTF-8\'\'{quoted}'
+
+
+def _read_range(file, start, stop):
+    """从文件中读取[start, stop)范围的数据块"""
+    file.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = file.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _iter_range(file_path, start, stop):
+    """逐块生成单个范围的数据，结束后关闭文件"""
+    with open(file_path, 'rb') as f:
+        yield from _read_range(f, start, stop)
+
+
+def _iter_multipart(file_path, parts, trailer):
+    """生成multipart/byteranges响应体"""
+    with open(file_path, 'rb') as f:
+        for header, start, stop in parts:
+            yield header
+            yield from _read_range(f, start, stop)
+        yield trailer
+
+
+def _file_body(environ, file_path, start, stop, length):
+    """单个范围的响应体
+
+    服务器提供了wsgi.file_wrapper（如gunicorn、waitress）时交给它发送，
+    这些服务器按Content-Length截断并可使用os.sendfile零拷贝；
+    开发服务器下只在范围延伸到文件末尾时使用FileWrapper，否则按块读取。
+    """
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None or stop == length:
+        f = open(file_path, 'rb')
+        f.seek(start)
+        if file_wrapper is None:
+            return FileWrapper(f, CHUNK_SIZE)
+        return file_wrapper(f, CHUNK_SIZE)
+    return _iter_range(file_path, start, stop)
+
+
+def send_file_with_ranges(request, file_path, download_name=None, as_attachment=True):
+    """发送文件，支持条件请求（304）、单个及多个Range请求（206）和零拷贝发送"""
+    stat = os.stat(file_path)
+    length = stat.st_size
+    etag = make_file_etag(stat)
+    download_name = download_name or os.path.basename(file_path)
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': 'private, no-cache',
+        'Content-Disposition': content_disposition(download_name, as_attachment),
+    }
+
+    # 条件请求：If-None-Match优先于If-Modified-Since
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    elif request.if_modified_since:
+        not_modified = int(stat.st_mtime) <= request.if_modified_since.timestamp()
+    else:
+        not_modified = False
+    if not_modified and request.method in ('GET', 'HEAD'):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and request.method in ('GET', 'HEAD'):
+        # If-Range不匹配时忽略Range，返回完整的新文件
+        if_range = request.if_range
+        if if_range.etag is not None:
+            range_valid = if_range.etag == etag
+        elif if_range.date is not None:
+            range_valid = int(stat.st_mtime) <= if_range.date.timestamp()
+        else:
+            range_valid = True
+        if range_valid:
+            ranges = parse_byte_ranges(range_header, length)
+            if ranges is not None and len(ranges) > MAX_RANGES:
+                ranges = None
+
+    if ranges is not None and not ranges:
+        headers['Content-Range'] = f'bytes */{length}'
+        response = Response(status=416, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    if ranges is None or ranges == [(0, length)]:
+        headers['Content-Length'] = str(length)
+        body = _file_body(request.environ, file_path, 0, length, length)
+        response = Response(body, status=200, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{length}'
+        headers['Content-Length'] = str(stop - start)
+        body = _file_body(request.environ, file_path, start, stop, length)
+        response = Response(body, status=206, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    else:
+        boundary = secrets.token_hex(16)
+        parts = []
+        content_length = 0
+        for start, stop in ranges:
+            part_header = (f'\r\n--{boundary}\r\n'
+                           f'Content-Type: {mimetype}\r\n'
+                           f'Content-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n').encode('latin-1')
+            parts.append((part_header, start, stop))
+            content_length += len(part_header) + stop - start
+        trailer = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+        content_length += len(trailer)
+        headers['Content-Length'] = str(content_length)
+        response = Response(_iter_multipart(file_path, parts, trailer), status=206,
+                            content_type=f'multipart/byteranges; boundary={boundary}',
+                            headers=headers, direct_passthrough=True)
+
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,34 @@
+import os
+import sys
+
+# gunicorn配置（仅Linux/macOS）：gunicorn -c gunicorn.conf.py wsgi:app
+# Windows上使用 python server.py（waitress多线程服务器）
+
+bind = os.environ.get('FILE_MANAGER_BIND', '0.0.0.0:8000')
+
+# 多个工作进程，每个进程内多个线程；每个进程有自己的任务线程池和缩略图进程池，进程数不宜过多
+workers = int(os.environ.get('FILE_MANAGER_WORKERS', min(4, os.cpu_count() or 1)))
+worker_class = 'gthread'
+# 保持中的变更事件连接（SSE、长轮询）另外占用线程，不挤占处理普通请求的线程
+threads = int(os.environ.get('FILE_MANAGER_THREADS', 16)) + int(os.environ.get('FILE_MANAGER_MAX_CHANGE_STREAMS', 16))
+
+# gthread模式下timeout只用于检测卡死的工作进程，不限制大文件上传下载的时长
+timeout = 120
+# 收到SIGTERM后等待正在处理的请求完成的时间
+graceful_timeout = 30
+keepalive = 5
+
+# 不预加载应用：后台线程、线程池和数据库连接不能跨fork使用，每个工作进程各自初始化
+preload_app = False
+
+if workers > 1:
+    # 会话和用户数据存放在SQLite中，上传和任务状态通过data目录在进程间共享
+    os.environ.setdefault('FILE_MANAGER_BACKEND', 'sqlite')
+    os.environ['FILE_MANAGER_SHARED'] = '1'
+
+
+def worker_exit(server, worker):
+    """工作进程退出时取消后台任务、写回未保存的数据"""
+    module = sys.modules.get('server')
+    if module is not None and module.file_manager is not None:
+        module.file_manager.shutdown()
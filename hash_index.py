@@ -0,0 +1,170 @@
+import os
+import zlib
+import hashlib
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# 读取文件计算哈希时的缓冲区大小
+CHUNK_SIZE = 1024 * 1024
+
+
+class _Crc32:
+    """与hashlib接口一致的CRC32，结果为8位十六进制"""
+
+    def __init__(self):
+        self._value = 0
+
+    def update(self, data):
+        self._value = zlib.crc32(data, self._value)
+
+    def hexdigest(self):
+        return f'{self._value:08x}'
+
+
+# 支持的算法：sha256用于校验完整性，crc32和xxh64（安装了xxhash时）是快速的非加密校验值
+ALGORITHMS = {
+    'sha256': hashlib.sha256,
+    'crc32': _Crc32,
+}
+if xxhash is not None:
+    ALGORITHMS['xxh64'] = xxhash.xxh64
+
+
+def _key(stat):
+    return stat.st_dev, stat.st_ino
+
+
+class HashIndex:
+    """持久化的文件哈希缓存
+
+    以(设备号, inode)为键保存文件的哈希，同时记录计算时的大小和修改时间（纳秒），
+    两者都不变时直接返回保存的结果，未修改的文件不会被重新读取。去重存储中链接到
+    同一内容的文件共享inode，也共享缓存。上传、差异同步等写入路径在写入时已经算出
+    SHA-256，直接调用record()保存。
+
+    计算时读取文件前后各取一次状态，文件在计算期间被修改时结果不保存。
+    数据保存在SQLite数据库中，多个服务器进程可以共享。目录的批量计算在线程池中并行进行
+    （hashlib和zlib处理大块数据时释放GIL）。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS hashes (
+            dev INTEGER NOT NULL,
+            ino INTEGER NOT NULL,
+            algorithm TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (dev, ino, algorithm)
+        ) WITHOUT ROWID;
+    '''
+
+    def __init__(self, db_path, max_workers=4):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='file-hash')
+
+    @staticmethod
+    def available_algorithms():
+        return sorted(ALGORITHMS)
+
+    def lookup(self, stat, algorithm):
+        """返回与文件当前状态相符的已保存哈希，没有时返回None"""
+        dev, ino = _key(stat)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, digest FROM hashes WHERE dev = ? AND ino = ? AND algorithm = ?',
+                (dev, ino, algorithm)).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        return None
+
+    def record(self, stat, algorithm, digest):
+        """保存文件在stat状态下的哈希（写入路径在写入数据时已经计算出哈希）"""
+        dev, ino = _key(stat)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO hashes (dev, ino, algorithm, size, mtime_ns, digest) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (dev, ino, algorithm, stat.st_size, stat.st_mtime_ns, digest))
+        except sqlite3.Error as e:
+            print(f"保存文件哈希失败: {e}")
+
+    def get(self, file_path, algorithm='sha256'):
+        """返回(哈希, 大小, 是否来自缓存)，缓存中没有时读取文件计算"""
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            digest = self.lookup(stat, algorithm)
+            if digest is not None:
+                return digest, stat.st_size, True
+
+            hasher = ALGORITHMS[algorithm]()
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+            digest = hasher.hexdigest()
+
+            after = os.fstat(f.fileno())
+            if (after.st_size, after.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                self.record(stat, algorithm, digest)
+        return digest, stat.st_size, False
+
+    def get_many(self, file_paths, algorithm='sha256', window=64):
+        """按顺序逐个生成(路径, 哈希, 大小, 是否来自缓存)，缓存中没有的文件在线程池中并行计算
+
+        同时进行中的计算不超过window个；文件无法读取时哈希为None。
+        生成器被关闭（如任务取消）时取消尚未开始的计算。
+        """
+        pending = deque()
+
+        def result(item):
+            path, future = item
+            try:
+                digest, size, cached = future.result()
+            except OSError as e:
+                print(f"计算文件哈希失败 {path}: {e}")
+                return path, None, None, False
+            return path, digest, size, cached
+
+        try:
+            for path in file_paths:
+                pending.append((path, self._executor.submit(self.get, path, algorithm)))
+                while len(pending) >= window or (pending and pending[0][1].done()):
+                    yield result(pending.popleft())
+            while pending:
+                yield result(pending.popleft())
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def warm(self, file_path, algorithm='sha256'):
+        """在后台计算并缓存文件的哈希（无法在写入时计算的，如乱序写入的分块上传）"""
+        def run():
+            try:
+                self.get(file_path, algorithm)
+            except OSError as e:
+                print(f"计算文件哈希失败 {file_path}: {e}")
+        try:
+            self._executor.submit(run)
+        except RuntimeError:
+            # 已经关闭
+            pass
+
+    def close(self):
+        """取消尚未开始的计算，等待进行中的计算结束后关闭数据库"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from user_store import write_file_atomic
+
+# 共享任务状态时进度写盘和检查取消标记的最小间隔（秒）
+SHARED_STATE_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class Job:
+    """后台任务：记录状态和进度（项目数、字节数），支持取消"""
+
+    def __init__(self, username, kind, description=''):
+        self.id = secrets.token_urlsafe(12)
+        self.username = username
+        self.kind = kind
+        self.description = description
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.items_done = 0
+        self.items_total = None
+        self.bytes_done = 0
+        self.bytes_total = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._lock = threading.Lock()
+        # 共享模式下由JobManager设置：状态文件路径和上次写盘、检查取消标记的时间
+        self._state_path = None
+        self._last_shared = 0
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """任务被取消时抛出JobCancelled，由任务函数在处理每一项前调用"""
+        if self._state_path is not None:
+            self._sync_shared()
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def _sync_shared(self, force=False):
+        """共享模式下定期写出进度，并检查其他进程留下的取消标记"""
+        now = time.time()
+        if not force and now - self._last_shared < SHARED_STATE_INTERVAL:
+            return
+        self._last_shared = now
+        if os.path.exists(self._state_path + '.cancel'):
+            self._cancel_event.set()
+        try:
+            write_file_atomic(self._state_path, json.dumps(dict(self.to_dict(), username=self.username),
+                                                           ensure_ascii=False))
+        except OSError as e:
+            print(f"写入任务状态失败 {self.id}: {e}")
+
+    def set_total(self, items=None, bytes_total=None):
+        """设置总项目数和总字节数"""
+        with self._lock:
+            self.items_total = items
+            self.bytes_total = bytes_total
+
+    def advance(self, items=0, bytes_done=0):
+        """报告进度，同时检查是否被取消"""
+        with self._lock:
+            self.items_done += items
+            self.bytes_done += bytes_done
+        self.check_cancelled()
+
+    def to_dict(self):
+        """接口返回的任务信息"""
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'type': self.kind,
+                'description': self.description,
+                'status': self.status,
+                'error': self.error,
+                'result': self.result,
+                'items_done': self.items_done,
+                'items_total': self.items_total,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobManager:
+    """后台任务队列
+
+    递归删除、复制、打包等耗时操作提交为任务，在有界线程池中执行，请求立即返回任务ID，
+    客户端通过任务ID查询进度或取消。任务只保存在内存中，结束超过keep_seconds后清除。
+
+    多个服务器进程时指定state_dir：任务仍在提交它的进程中执行，状态定期写入
+    state_dir/<任务ID>.json，其他进程从这里查询；取消请求写成<任务ID>.json.cancel标记，
+    由执行任务的进程在检查取消时发现。
+    """
+
+    def __init__(self, max_workers=2, keep_seconds=3600, state_dir=None):
+        self.keep_seconds = keep_seconds
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='file-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, username, kind, func, description='', on_finish=None):
+        """提交任务，func(job)在后台执行，返回值保存为任务结果；on_finish(job)在任务结束后调用"""
+        job = Job(username, kind, description)
+        if self.state_dir:
+            job._state_path = os.path.join(self.state_dir, f'{job.id}.json')
+            job._sync_shared(force=True)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, on_finish)
+        return job
+
+    def _run(self, job, func, on_finish):
+        """执行任务并记录结果"""
+        with job._lock:
+            if job.cancelled:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+            if not job.finished:
+                job.status = 'running'
+                job.started_at = time.time()
+        if job._state_path is not None:
+            job._sync_shared(force=True)
+        if job.finished:
+            # 开始前已被取消：仍然调用on_finish，让调用方清理为任务准备的临时状态
+            self._call_on_finish(job, on_finish)
+            job._done_event.set()
+            return
+
+        status, error, result = 'completed', None, None
+        try:
+            result = func(job)
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            status, error = 'failed', str(e)
+            print(f"任务执行失败 {job.kind} {job.id}: {e}")
+
+        with job._lock:
+            job.status = status
+            job.error = error
+            job.result = result
+            job.finished_at = time.time()
+
+        self._call_on_finish(job, on_finish)
+        if job._state_path is not None:
+            job._sync_shared(force=True)
+        job._done_event.set()
+
+    @staticmethod
+    def _call_on_finish(job, on_finish):
+        if on_finish is not None:
+            try:
+                on_finish(job)
+            except Exception as e:
+                print(f"任务结束回调失败 {job.id}: {e}")
+
+    def _prune(self):
+        """清除结束已久的任务（调用方需持有_lock）"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.keep_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.state_dir:
+            self._prune_shared(now)
+
+    def _prune_shared(self, now):
+        """删除结束已久或长时间没有更新（执行它的进程已退出）的任务状态文件"""
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.keep_seconds:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _get(self, job_id, username):
+        """获取属于该用户的任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.username != username:
+            return None
+        return job
+
+    def _load_shared(self, job_id, username):
+        """读取其他进程执行的任务状态，不存在或不属于该用户时返回None"""
+        if not self.state_dir or not job_id.replace('-', '').replace('_', '').isalnum():
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f'{job_id}.json'), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if info.pop('username', None) != username:
+            return None
+        return info
+
+    def get(self, job_id, username):
+        """查询任务信息，任务不存在时返回None"""
+        job = self._get(job_id, username)
+        if job is None:
+            return self._load_shared(job_id, username)
+        return job.to_dict()
+
+    def list_jobs(self, username):
+        """列出用户的任务（按创建时间倒序）"""
+        with self._lock:
+            self._prune()
+            jobs = [job.to_dict() for job in self._jobs.values() if job.username == username]
+        if self.state_dir:
+            local_ids = {job['job_id'] for job in jobs}
+            for name in os.listdir(self.state_dir):
+                job_id = name[:-len('.json')]
+                if name.endswith('.json') and job_id not in local_ids:
+                    info = self._load_shared(job_id, username)
+                    if info is not None:
+                        jobs.append(info)
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jobs
+
+    def cancel(self, job_id, username):
+        """请求取消任务，任务不存在或已结束时返回False"""
+        job = self._get(job_id, username)
+        if job is None:
+            info = self._load_shared(job_id, username)
+            if info is None or info['status'] in ('completed', 'failed', 'cancelled'):
+                return False
+            # 任务在其他进程中执行，留下取消标记
+            with open(os.path.join(self.state_dir, f'{job_id}.json.cancel'), 'w'):
+                pass
+            return True
+        if job.finished:
+            return False
+        job._cancel_event.set()
+        return True
+
+    def wait(self, job_id, username, timeout=None):
+        """等待任务结束，返回任务信息（其他进程中的任务通过轮询状态文件等待）"""
+        job = self._get(job_id, username)
+        if job is None:
+            deadline = None if timeout is None else time.time() + timeout
+            info = self._load_shared(job_id, username)
+            while info is not None and info['status'] not in ('completed', 'failed', 'cancelled') and \
+                    (deadline is None or time.time() < deadline):
+                time.sleep(SHARED_STATE_INTERVAL)
+                info = self._load_shared(job_id, username)
+            return info
+        job._done_event.wait(timeout)
+        return job.to_dict()
+
+    def shutdown(self, wait=True):
+        """取消所有未结束的任务并关闭线程池"""
+        with self._lock:
+            for job in self._jobs.values():
+                if not job.finished:
+                    job._cancel_event.set()
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,196 @@
+import time
+import bisect
+import threading
+from functools import wraps
+
+# 延迟直方图的默认桶上限（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames, values, extra=None):
+    """生成{name="value",...}形式的标签"""
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in values]
+
+
+class Histogram:
+    """分布直方图：按标签值记录各桶计数、总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # 各桶计数（最后一个是+Inf）、总和、次数
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        """计时上下文管理器"""
+        return _Timer(self, labels)
+
+    def get(self, *labels):
+        """返回(次数, 总和)"""
+        with self._lock:
+            state = self._values.get(labels)
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+class Gauge:
+    """瞬时值，导出时调用func()取得当前值（如队列深度）"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.func = func
+
+    def get(self):
+        return self.func() if self.func is not None else 0
+
+    def render(self):
+        return [f'{self.name} {_format_value(self.get())}']
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+
+class Registry:
+    """进程内的指标注册表，以Prometheus文本格式导出，不依赖外部服务
+
+    多进程运行时每个工作进程有自己的注册表，/metrics返回处理该请求的进程的数据。
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"指标 {name} 已以不同的类型或标签注册")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def gauge(self, name, help_text, func):
+        return self._get_or_create(Gauge, name, help_text, (), func=func)
+
+    def render(self):
+        """导出所有指标（Prometheus文本格式0.0.4）"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# 内部操作耗时（用户数据读写、会话验证、列目录等）
+OPERATION_SECONDS = REGISTRY.histogram(
+    'file_manager_operation_seconds', '内部操作耗时（秒）', ('operation',))
+
+
+def timed(operation):
+    """装饰器：把函数耗时记录到file_manager_operation_seconds{operation=...}"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                OPERATION_SECONDS.observe(time.perf_counter() - start, operation)
+        return wrapper
+    return decorator
@@ -0,0 +1,166 @@
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PasswordHasher:
+    """密码哈希器
+
+    支持PBKDF2-SHA256和scrypt两种算法，工作因子可配置。哈希计算在有界线程池中执行
+    （hashlib计算时会释放GIL），同时进行的计算数不超过max_workers，
+    排队等待的请求数超过max_queue时调用方会阻塞，避免登录高峰时CPU被打满。
+
+    哈希格式:
+        pbkdf2_sha256$<迭代次数>$<盐>$<哈希>
+        scrypt$<n>$<r>$<p>$<盐>$<哈希>
+        <盐>$<sha256哈希>（旧格式，只用于验证，登录时自动升级）
+    """
+
+    def __init__(self, algorithm='pbkdf2_sha256', iterations=260000,
+                 scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 max_workers=None, max_queue=64):
+        if algorithm not in ('pbkdf2_sha256', 'scrypt'):
+            raise ValueError(f"不支持的密码哈希算法: {algorithm}")
+        self.algorithm = algorithm
+        self.iterations = iterations
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='password-hasher')
+        self._slots = threading.BoundedSemaphore(self.max_workers + max_queue)
+
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self.stats = {
+            'hashes': 0,
+            'max_queue_depth': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0
+        }
+
+    # 环境变量和对应的构造参数
+    ENVIRON_PARAMS = (
+        ('FILE_MANAGER_PASSWORD_ALGORITHM', 'algorithm', str),
+        ('FILE_MANAGER_PBKDF2_ITERATIONS', 'iterations', int),
+        ('FILE_MANAGER_SCRYPT_N', 'scrypt_n', int),
+        ('FILE_MANAGER_SCRYPT_R', 'scrypt_r', int),
+        ('FILE_MANAGER_SCRYPT_P', 'scrypt_p', int),
+        ('FILE_MANAGER_PASSWORD_WORKERS', 'max_workers', int),
+        ('FILE_MANAGER_PASSWORD_QUEUE', 'max_queue', int),
+    )
+
+    @classmethod
+    def from_environ(cls, environ=os.environ):
+        """按环境变量中的配置创建哈希器，未设置的参数使用默认值"""
+        kwargs = {}
+        for variable, param, convert in cls.ENVIRON_PARAMS:
+            value = environ.get(variable)
+            if value:
+                kwargs[param] = convert(value)
+        return cls(**kwargs)
+
+    # ---- 哈希计算 ----
+
+    def _derive(self, algorithm, password, salt, params):
+        """计算派生密钥的十六进制字符串"""
+        if algorithm == 'pbkdf2_sha256':
+            return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), params[0]).hex()
+        if algorithm == 'scrypt':
+            n, r, p = params
+            return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                                  maxmem=256 * r * (n + p + 2)).hex()
+        # 旧格式：sha256(密码 + 盐)
+        return hashlib.sha256((password + salt).encode()).hexdigest()
+
+    def _run(self, func, *args):
+        """在线程池中执行计算并等待结果，记录排队深度和耗时"""
+        self._slots.acquire()
+        with self._stats_lock:
+            self._pending += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._pending)
+        started = time.perf_counter()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                self._pending -= 1
+                self.stats['hashes'] += 1
+                self.stats['total_ms'] += elapsed_ms
+                self.stats['max_ms'] = max(self.stats['max_ms'], elapsed_ms)
+            self._slots.release()
+
+    @property
+    def queue_depth(self):
+        """当前正在计算和排队等待的哈希请求数"""
+        return self._pending
+
+    def get_stats(self):
+        """获取哈希统计信息"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats['queue_depth'] = self._pending
+            stats['workers'] = self.max_workers
+            stats['avg_ms'] = stats['total_ms'] / stats['hashes'] if stats['hashes'] else 0.0
+            return stats
+
+    # ---- 对外接口 ----
+
+    def _current_params(self):
+        """当前配置的算法参数"""
+        if self.algorithm == 'pbkdf2_sha256':
+            return (self.iterations,)
+        return (self.scrypt_n, self.scrypt_r, self.scrypt_p)
+
+    def _parse(self, hashed_password):
+        """解析哈希字符串，返回(算法, 参数, 盐, 哈希)，格式无效时返回None"""
+        if not hashed_password or '$' not in hashed_password:
+            return None
+        parts = hashed_password.split('$')
+        try:
+            if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+                return parts[0], (int(parts[1]),), parts[2], parts[3]
+            if parts[0] == 'scrypt' and len(parts) == 6:
+                return parts[0], (int(parts[1]), int(parts[2]), int(parts[3])), parts[4], parts[5]
+        except ValueError:
+            return None
+        salt, stored_hash = hashed_password.split('$', 1)
+        return 'sha256', (), salt, stored_hash
+
+    def hash(self, password):
+        """使用当前配置计算密码哈希"""
+        salt = secrets.token_hex(16)
+        params = self._current_params()
+        derived = self._run(self._derive, self.algorithm, password, salt, params)
+        return '$'.join([self.algorithm, *map(str, params), salt, derived])
+
+    def verify(self, password, hashed_password):
+        """验证密码"""
+        parsed = self._parse(hashed_password)
+        if parsed is None:
+            return False
+        algorithm, params, salt, stored_hash = parsed
+        if algorithm == 'sha256':
+            computed_hash = self._derive(algorithm, password, salt, params)
+        else:
+            computed_hash = self._run(self._derive, algorithm, password, salt, params)
+        return hmac.compare_digest(computed_hash, stored_hash)
+
+    def needs_rehash(self, hashed_password):
+        """哈希是否使用了旧格式或与当前配置不同的算法/工作因子"""
+        parsed = self._parse(hashed_password)
+        if parsed is None:
+            return True
+        algorithm, params, _, _ = parsed
+        return algorithm != self.algorithm or params != self._current_params()
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=True)
@@ -3,6 +3,11 @@ class FileManager {
         this.currentPath = '';
         this.selectedFiles = new Set();
         this.username = null;
+        this.pageSize = 500;
+        this.nextOffset = null;
+        this.changeFeed = null;
+        this.changeFeedConnected = false;
+        this.changeFeedRetry = null;
         this.init();
     }
 
@@ -17,6 +22,17 @@ class FileManager {
             this.loadFiles();
         });
 
+        // 搜索
+        document.getElementById('search-btn').addEventListener('click', () => {
+            this.searchFiles();
+        });
+
+        document.getElementById('search-input').addEventListener('keydown', (e) => {
+            if (e.key === 'Enter') {
+                this.searchFiles();
+            }
+        });
+
         // 返回上级按钮
         document.getElementById('back-btn').addEventListener('click', () => {
             this.navigateUp();
@@ -27,6 +43,25 @@ class FileManager {
             this.showCreateFolderModal();
         });
 
+        // 打包下载所选按钮
+        document.getElementById('download-selected-btn').addEventListener('click', () => {
+            if (this.selectedFiles.size === 0) {
+                alert('请先选择要下载的文件');
+                return;
+            }
+            this.downloadZip(Array.from(this.selectedFiles));
+        });
+
+        // 删除所选按钮
+        document.getElementById('delete-selected-btn').addEventListener('click', () => {
+            this.deleteSelected();
+        });
+
+        // 移动所选按钮
+        document.getElementById('move-selected-btn').addEventListener('click', () => {
+            this.moveSelected();
+        });
+
         // 上传文件按钮
         document.getElementById('upload-btn').addEventListener('click', () => {
             document.getElementById('file-input').click();
@@ -65,13 +100,99 @@ class FileManager {
             }
 
             this.setStatus('加载中...');
-            const response = await fetch('http://localhost:8000/api/files', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                credentials: 'include',
-                body: JSON.stringify({ path: this.currentPath })
+            const page = await this.fetchFilesPage(0);
+            if (!page) return;
+
+            this.renderFileList(page.items);
+            this.renderLoadMore(page);
+            this.updatePathDisplay();
+            this.setStatus('就绪');
+        } catch (error) {
+            this.setStatus('错误: ' + error.message);
+            console.error('加载文件失败:', error);
+        }
+    }
+
+    async fetchFilesPage(offset) {
+        const params = new URLSearchParams({
+            path: this.currentPath,
+            offset: offset,
+            limit: this.pageSize,
+            sort: 'name'
+        });
+        // 使用GET请求并总是重新验证，目录未变化时服务器返回304，浏览器直接使用缓存
+        const response = await fetch(`http://localhost:8000/api/files?${params}`, {
+            credentials: 'include',
+            cache: 'no-cache'
+        });
+
+        if (response.status === 401) {
+            this.handleUnauthorized();
+            return null;
+        }
+
+        if (!response.ok) {
+            throw new Error('加载文件列表失败');
+        }
+
+        return await response.json();
+    }
+
+    renderLoadMore(page) {
+        const tbody = document.getElementById('file-list');
+        const oldRow = document.getElementById('load-more-row');
+        if (oldRow) oldRow.remove();
+
+        this.nextOffset = page.next_offset;
+        if (this.nextOffset === null || this.nextOffset === undefined) return;
+
+        const row = document.createElement('tr');
+        row.id = 'load-more-row';
+        const cell = document.createElement('td');
+        cell.colSpan = 5;
+        cell.style.textAlign = 'center';
+        const button = document.createElement('button');
+        button.className = 'btn';
+        button.textContent = `加载更多 (${page.total - this.nextOffset} 项未显示)`;
+        button.onclick = () => this.loadMoreFiles();
+        cell.appendChild(button);
+        row.appendChild(cell);
+        tbody.appendChild(row);
+    }
+
+    async loadMoreFiles() {
+        if (this.nextOffset === null) return;
+
+        try {
+            this.setStatus('加载中...');
+            const page = await this.fetchFilesPage(this.nextOffset);
+            if (!page) return;
+
+            const tbody = document.getElementById('file-list');
+            const loadMoreRow = document.getElementById('load-more-row');
+            page.items.forEach(file => {
+                tbody.insertBefore(this.createFileRow(file), loadMoreRow);
+            });
+            this.renderLoadMore(page);
+            this.setStatus('就绪');
+        } catch (error) {
+            this.setStatus('错误: ' + error.message);
+            console.error('加载文件失败:', error);
+        }
+    }
+
+    async searchFiles() {
+        const query = document.getElementById('search-input').value.trim();
+        if (!query) {
+            this.loadFiles();
+            return;
+        }
+
+        try {
+            this.setStatus('搜索中...');
+            const params = new URLSearchParams({ q: query, limit: 200 });
+            const response = await fetch(`http://localhost:8000/api/search?${params}`, {
+                credentials: 'include'
             });
 
             if (response.status === 401) {
@@ -80,19 +201,68 @@ class FileManager {
             }
 
             if (!response.ok) {
-                throw new Error('加载文件列表失败');
+                throw new Error('搜索失败');
             }
 
-            const files = await response.json();
-            this.renderFileList(files);
-            this.updatePathDisplay();
-            this.setStatus('就绪');
+            const result = await response.json();
+            this.renderSearchResults(result.items);
+            this.setStatus(result.indexing ?
+                `找到 ${result.items.length} 个结果（索引建立中，结果可能不完整）` :
+                `找到 ${result.items.length} 个结果`);
         } catch (error) {
             this.setStatus('错误: ' + error.message);
-            console.error('加载文件失败:', error);
+            console.error('搜索失败:', error);
         }
     }
 
+    renderSearchResults(items) {
+        // 搜索结果显示完整路径，点击后进入所在的文件夹
+        const tbody = document.getElementById('file-list');
+        tbody.innerHTML = '';
+
+        items.forEach(item => {
+            const row = document.createElement('tr');
+            row.className = 'file-item';
+
+            const nameCell = document.createElement('td');
+            const icon = document.createElement('span');
+            icon.className = 'file-icon';
+            icon.textContent = item.is_dir ? '📁' : '📄';
+            const nameSpan = document.createElement('span');
+            nameSpan.className = 'file-name';
+            nameSpan.textContent = item.path;
+            nameCell.appendChild(icon);
+            nameCell.appendChild(nameSpan);
+
+            const typeCell = document.createElement('td');
+            typeCell.className = 'file-type';
+            typeCell.textContent = item.is_dir ? '文件夹' : this.getFileType(item.name);
+
+            const sizeCell = document.createElement('td');
+            sizeCell.className = 'file-size';
+            sizeCell.textContent = item.is_dir ? '-' : this.formatFileSize(item.size);
+
+            const timeCell = document.createElement('td');
+            timeCell.className = 'file-time';
+            timeCell.textContent = item.modified;
+
+            const actionsCell = document.createElement('td');
+            actionsCell.className = 'file-actions';
+
+            row.appendChild(nameCell);
+            row.appendChild(typeCell);
+            row.appendChild(sizeCell);
+            row.appendChild(timeCell);
+            row.appendChild(actionsCell);
+
+            row.addEventListener('click', () => {
+                document.getElementById('search-input').value = '';
+                this.navigateTo(item.is_dir ? item.path : item.parent);
+            });
+            tbody.appendChild(row);
+        });
+    }
+
     renderFileList(files) {
         const tbody = document.getElementById('file-list');
         tbody.innerHTML = '';
@@ -120,13 +290,32 @@ class FileManager {
     createFileRow(file, isParent = false) {
         const row = document.createElement('tr');
         row.className = 'file-item';
-        if (isParent) row.classList.add('parent-dir');
+        if (isParent) {
+            row.classList.add('parent-dir');
+        } else {
+            row.dataset.name = file.name;
+            row.dataset.isDir = file.is_dir ? '1' : '';
+        }
 
         // 名称列
         const nameCell = document.createElement('td');
         const icon = document.createElement('span');
         icon.className = 'file-icon';
         icon.textContent = file.is_dir ? '📁' : '📄';
+        if (!file.is_dir && this.isImage(file.name)) {
+            // 图片显示缩略图，滚动到可见区域时才加载，加载失败时保留默认图标
+            const thumb = document.createElement('img');
+            thumb.className = 'file-thumb';
+            thumb.loading = 'lazy';
+            thumb.alt = '';
+            const params = new URLSearchParams({
+                path: this.currentPath, filename: file.name, size: 64, v: file.mtime
+            });
+            thumb.src = `http://localhost:8000/api/thumbnail?${params}`;
+            thumb.onerror = () => thumb.remove();
+            thumb.onload = () => icon.firstChild.remove();
+            icon.appendChild(thumb);
+        }
         
         const nameSpan = document.createElement('span');
         nameSpan.className = 'file-name';
@@ -155,16 +344,18 @@ class FileManager {
         actionsCell.className = 'file-actions';
         
         if (!isParent) {
-            if (!file.is_dir) {
-                const downloadBtn = document.createElement('button');
-                downloadBtn.className = 'btn btn-primary';
-                downloadBtn.textContent = '下载';
-                downloadBtn.onclick = (e) => {
-                    e.stopPropagation();
+            const downloadBtn = document.createElement('button');
+            downloadBtn.className = 'btn btn-primary';
+            downloadBtn.textContent = '下载';
+            downloadBtn.onclick = (e) => {
+                e.stopPropagation();
+                if (file.is_dir) {
+                    this.downloadZip([file.name]);
+                } else {
                     this.downloadFile(file);
-                };
-                actionsCell.appendChild(downloadBtn);
-            }
+                }
+            };
+            actionsCell.appendChild(downloadBtn);
             
             const deleteBtn = document.createElement('button');
             deleteBtn.className = 'btn btn-danger';
@@ -265,14 +456,134 @@ class FileManager {
                 throw new Error('删除失败');
             }
 
-            this.setStatus('删除成功');
-            this.loadFiles();
+            // 文件夹在服务器后台删除，列表中已经看不到它
+            const result = await response.json();
+            this.refreshAfterChange();
+            if (result.job) {
+                this.watchJob(result.job.job_id, '删除');
+            } else {
+                this.setStatus('删除成功');
+            }
         } catch (error) {
             this.setStatus('错误: ' + error.message);
             console.error('删除文件失败:', error);
         }
     }
 
+    async watchJob(jobId, actionName) {
+        // 轮询后台任务的进度，结束后刷新列表
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            let job;
+            try {
+                const response = await fetch(`http://localhost:8000/api/jobs/${jobId}`, {
+                    credentials: 'include'
+                });
+                if (!response.ok) {
+                    return;
+                }
+                job = await response.json();
+            } catch (error) {
+                console.error('查询任务状态失败:', error);
+                return;
+            }
+
+            if (job.status === 'completed') {
+                this.setStatus(`${actionName}完成`);
+                this.refreshAfterChange();
+                return;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                this.setStatus(`${actionName}${job.status === 'failed' ? '失败: ' + job.error : '已取消'}`);
+                this.loadFiles();
+                return;
+            }
+
+            const progress = job.items_total ? Math.floor(job.items_done * 100 / job.items_total) : 0;
+            this.setStatus(`${actionName}中... ${progress}%`);
+        }
+    }
+
+    async runBatch(operations, actionName) {
+        // 所有操作在一个请求中完成，服务器返回每一项的结果
+        try {
+            this.setStatus(`${actionName}中...`);
+            const response = await fetch('http://localhost:8000/api/batch', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                credentials: 'include',
+                body: JSON.stringify({
+                    path: this.currentPath,
+                    operations: operations
+                })
+            });
+
+            if (response.status === 401) {
+                this.handleUnauthorized();
+                return;
+            }
+
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.error || `${actionName}失败`);
+            }
+
+            if (result.failed > 0) {
+                const errors = result.results
+                    .filter(item => !item.success)
+                    .slice(0, 10)
+                    .map(item => `${item.name}: ${item.error}`);
+                alert(`${result.failed} 个项目${actionName}失败:\n${errors.join('\n')}`);
+            }
+
+            this.selectedFiles.clear();
+            this.updateSelectedCount();
+            this.setStatus(`${actionName}完成: 成功 ${result.succeeded} 个，失败 ${result.failed} 个`);
+            this.refreshAfterChange();
+
+            // 文件夹的删除在后台任务中继续进行
+            result.results
+                .filter(item => item.job_id)
+                .forEach(item => this.watchJob(item.job_id, `${actionName} ${item.name}`));
+        } catch (error) {
+            this.setStatus('错误: ' + error.message);
+            console.error(`${actionName}失败:`, error);
+        }
+    }
+
+    async deleteSelected() {
+        if (this.selectedFiles.size === 0) {
+            alert('请先选择要删除的文件');
+            return;
+        }
+        if (!confirm(`确定要删除选中的 ${this.selectedFiles.size} 个项目吗？`)) {
+            return;
+        }
+
+        const operations = Array.from(this.selectedFiles).map(name => ({ op: 'delete', name: name }));
+        await this.runBatch(operations, '删除');
+    }
+
+    async moveSelected() {
+        if (this.selectedFiles.size === 0) {
+            alert('请先选择要移动的文件');
+            return;
+        }
+        const destPath = prompt('移动到（相对于根目录的路径，留空表示根目录）:', this.currentPath);
+        if (destPath === null) {
+            return;
+        }
+
+        const operations = Array.from(this.selectedFiles).map(name => ({
+            op: 'move',
+            name: name,
+            dest_path: destPath.trim().replace(/^\/+|\/+$/g, '')
+        }));
+        await this.runBatch(operations, '移动');
+    }
+
     async downloadFile(file) {
         try {
             this.setStatus('准备下载中...');
@@ -300,6 +611,21 @@ class FileManager {
         }
     }
 
+    downloadZip(names) {
+        // 服务器边打包边发送ZIP，下载会立即开始
+        const params = new URLSearchParams({ path: this.currentPath });
+        names.forEach(name => params.append('names', name));
+
+        const link = document.createElement('a');
+        link.href = `http://localhost:8000/api/download-zip?${params}`;
+        link.style.display = 'none';
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+
+        this.setStatus('下载已开始');
+    }
+
     showCreateFolderModal() {
         document.getElementById('modal-title').textContent = '新建文件夹';
         document.getElementById('folder-name').value = '';
@@ -342,7 +668,7 @@ class FileManager {
 
             this.hideModal();
             this.setStatus('文件夹创建成功');
-            this.loadFiles();
+            this.refreshAfterChange();
         } catch (error) {
             this.setStatus('错误: ' + error.message);
             console.error('创建文件夹失败:', error);
@@ -356,31 +682,149 @@ class FileManager {
             this.setStatus('上传中...');
             
             for (let i = 0; i < files.length; i++) {
-                const formData = new FormData();
-                formData.append('file', files[i]);
-                formData.append('path', this.currentPath);
+                const uploaded = await this.uploadFileChunked(files[i]);
+                if (!uploaded) return;
+            }
 
-                const response = await fetch('http://localhost:8000/api/upload', {
-                    method: 'POST',
-                    credentials: 'include',
-                    body: formData
-                });
+            this.setStatus('上传完成');
+            this.refreshAfterChange();
+        } catch (error) {
+            this.setStatus('错误: ' + error.message);
+            console.error('上传文件失败:', error);
+        }
+    }
+
+    async hashFile(file) {
+        // 服务器启用去重时计算SHA-256，相同内容可以跳过上传；过大的文件一次读入内存代价太高，不计算
+        if (!this.dedupEnabled || !window.crypto || !crypto.subtle || file.size > 512 * 1024 * 1024) {
+            return null;
+        }
+        try {
+            this.setStatus(`计算校验值 ${file.name}...`);
+            const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        } catch (error) {
+            console.error('计算校验值失败:', error);
+            return null;
+        }
+    }
+
+    async uploadFileChunked(file) {
+        const chunkSize = 8 * 1024 * 1024;
+        const parallel = 3;
+        // 记录上传ID，页面刷新或网络中断后可以从已上传的位置继续
+        const resumeKey = `upload:${this.currentPath}:${file.name}:${file.size}:${file.lastModified}`;
+
+        let status = null;
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            const response = await fetch(`http://localhost:8000/api/uploads/${savedId}`, {
+                credentials: 'include'
+            });
+            if (response.status === 401) {
+                this.handleUnauthorized();
+                return false;
+            }
+            if (response.ok) {
+                status = await response.json();
+            }
+        }
+
+        if (!status) {
+            const sha256 = await this.hashFile(file);
+            const response = await fetch('http://localhost:8000/api/uploads', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                credentials: 'include',
+                body: JSON.stringify({
+                    path: this.currentPath,
+                    filename: file.name,
+                    size: file.size,
+                    sha256: sha256
+                })
+            });
+            if (response.status === 401) {
+                this.handleUnauthorized();
+                return false;
+            }
+            if (!response.ok) {
+                throw new Error(`上传文件 ${file.name} 失败`);
+            }
+            status = await response.json();
+            if (status.deduplicated) {
+                // 服务器已有相同内容，不需要传输
+                this.setStatus(`秒传完成: ${file.name}`);
+                return true;
+            }
+            localStorage.setItem(resumeKey, status.upload_id);
+        }
+
+        // 只上传服务器还没有收到的分块
+        const pending = [];
+        for (let start = 0; start < file.size; start += chunkSize) {
+            const end = Math.min(start + chunkSize, file.size);
+            const received = status.received.some(([s, e]) => s <= start && end <= e);
+            if (!received) pending.push([start, end]);
+        }
 
+        let uploadedBytes = status.received_bytes;
+        let unauthorized = false;
+        const worker = async () => {
+            while (pending.length > 0 && !unauthorized) {
+                const [start, end] = pending.shift();
+                const response = await this.putChunk(status.upload_id, file, start, end);
                 if (response.status === 401) {
-                    this.handleUnauthorized();
+                    unauthorized = true;
                     return;
                 }
+                uploadedBytes = Math.min(file.size, uploadedBytes + end - start);
+                const percent = file.size ? Math.floor(uploadedBytes * 100 / file.size) : 100;
+                this.setStatus(`上传中 ${file.name}: ${percent}%`);
+            }
+        };
+        await Promise.all(Array.from({ length: parallel }, worker));
 
-                if (!response.ok) {
-                    throw new Error(`上传文件 ${files[i].name} 失败`);
+        if (unauthorized) {
+            this.handleUnauthorized();
+            return false;
+        }
+
+        const response = await fetch(`http://localhost:8000/api/uploads/${status.upload_id}/finalize`, {
+            method: 'POST',
+            credentials: 'include'
+        });
+        if (response.status === 401) {
+            this.handleUnauthorized();
+            return false;
+        }
+        if (!response.ok) {
+            throw new Error(`上传文件 ${file.name} 失败`);
+        }
+        localStorage.removeItem(resumeKey);
+        return true;
+    }
+
+    async putChunk(uploadId, file, start, end) {
+        // 网络错误时重试，多次失败后放弃（已上传的分块下次可以续传）
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(`http://localhost:8000/api/uploads/${uploadId}?offset=${start}`, {
+                    method: 'PUT',
+                    credentials: 'include',
+                    body: file.slice(start, end)
+                });
+                if (response.ok || response.status === 401) {
+                    return response;
+                }
+                if (attempt >= 3) {
+                    throw new Error(`上传文件 ${file.name} 失败`);
                 }
+            } catch (error) {
+                if (attempt >= 3) throw error;
             }
-
-            this.setStatus('上传完成');
-            this.loadFiles();
-        } catch (error) {
-            this.setStatus('错误: ' + error.message);
-            console.error('上传文件失败:', error);
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
         }
     }
 
@@ -392,6 +836,11 @@ class FileManager {
         document.getElementById('current-path').textContent = this.currentPath;
     }
 
+    isImage(filename) {
+        const ext = filename.split('.').pop().toLowerCase();
+        return filename.includes('.') && ['png', 'jpg', 'jpeg', 'gif'].includes(ext);
+    }
+
     getFileType(filename) {
         const ext = filename.split('.').pop().toLowerCase();
         const types = {
@@ -418,6 +867,93 @@ class FileManager {
         return types[ext] || '文件';
     }
 
+    startChangeFeed() {
+        // 通过SSE接收文件变更，增量更新当前目录的列表；断线后浏览器带上次的事件ID自动重连
+        if (this.changeFeed || this.changeFeedRetry || !window.EventSource) return;
+        this.changeFeed = new EventSource('http://localhost:8000/api/changes', { withCredentials: true });
+        this.changeFeed.addEventListener('ready', () => {
+            this.changeFeedConnected = true;
+        });
+        this.changeFeed.addEventListener('change', (e) => {
+            this.applyChange(JSON.parse(e.data));
+        });
+        // 断线期间的事件已经丢失（如服务器重启），重新获取列表
+        this.changeFeed.addEventListener('reset', () => {
+            this.loadFiles();
+        });
+        this.changeFeed.onerror = () => {
+            this.changeFeedConnected = false;
+            // 服务器连接已满（503）等情况下浏览器不再自动重连，稍后重新打开；期间操作后重新获取列表
+            if (this.changeFeed && this.changeFeed.readyState === EventSource.CLOSED) {
+                this.changeFeed = null;
+                this.changeFeedRetry = setTimeout(() => {
+                    this.changeFeedRetry = null;
+                    if (this.username) this.startChangeFeed();
+                }, 30000);
+            }
+        };
+    }
+
+    stopChangeFeed() {
+        if (this.changeFeedRetry) {
+            clearTimeout(this.changeFeedRetry);
+            this.changeFeedRetry = null;
+        }
+        if (this.changeFeed) {
+            this.changeFeed.close();
+            this.changeFeed = null;
+        }
+        this.changeFeedConnected = false;
+    }
+
+    refreshAfterChange() {
+        // 变更事件流已连接时列表由事件更新，否则重新获取
+        if (!this.changeFeedConnected) {
+            this.loadFiles();
+        }
+    }
+
+    applyChange(change) {
+        // 只更新当前显示的目录，显示搜索结果时不处理
+        if (!this.username || change.path !== this.currentPath ||
+            document.getElementById('search-input').value.trim()) {
+            return;
+        }
+
+        const tbody = document.getElementById('file-list');
+        const rows = Array.from(tbody.querySelectorAll('tr.file-item:not(.parent-dir)'));
+        const existing = rows.find(row => row.dataset.name === change.name);
+
+        if (change.action === 'deleted') {
+            if (existing) existing.remove();
+            if (this.selectedFiles.delete(change.name)) {
+                this.updateSelectedCount();
+            }
+            return;
+        }
+
+        const row = this.createFileRow(change.file);
+        if (existing) {
+            if (existing.classList.contains('selected')) row.classList.add('selected');
+            existing.replaceWith(row);
+            return;
+        }
+
+        // 按列表的顺序插入（文件夹在前，名称不区分大小写）；位置在尚未加载的部分时不插入
+        const isDir = change.file.is_dir;
+        const name = change.file.name.toLowerCase();
+        const next = rows.find(other => {
+            const otherIsDir = other.dataset.isDir === '1';
+            if (otherIsDir !== isDir) return isDir;
+            return other.dataset.name.toLowerCase() > name;
+        });
+        if (next) {
+            tbody.insertBefore(row, next);
+        } else if (!document.getElementById('load-more-row')) {
+            tbody.appendChild(row);
+        }
+    }
+
     formatFileSize(bytes) {
         if (bytes === 0) return '0 B';
         const k = 1024;
@@ -435,7 +971,11 @@ class FileManager {
             if (response.ok) {
                 const userInfo = await response.json();
                 this.username = userInfo.username || userInfo.user_dir;
+                this.usage = userInfo.usage;
+                this.quotaBytes = userInfo.quota_bytes;
+                this.dedupEnabled = userInfo.dedup;
                 this.updateUserDisplay();
+                this.startChangeFeed();
                 this.loadFiles();
             } else {
                 this.renderLoginPrompt();
@@ -447,7 +987,13 @@ class FileManager {
 
     updateUserDisplay() {
         if (this.username) {
-            document.getElementById('username-display').textContent = this.username;
+            let display = this.username;
+            if (this.usage) {
+                // 显示已用空间，设置了配额时同时显示配额
+                display += ` (已用 ${this.formatFileSize(this.usage.bytes)}`;
+                display += this.quotaBytes ? ` / ${this.formatFileSize(this.quotaBytes)})` : ')';
+            }
+            document.getElementById('username-display').textContent = display;
             document.getElementById('login-btn').style.display = 'none';
             document.getElementById('logout-btn').style.display = 'block';
         } else {
@@ -465,6 +1011,7 @@ class FileManager {
             });
             
             if (response.ok) {
+                this.stopChangeFeed();
                 this.username = null;
                 this.currentPath = '';
                 this.updateUserDisplay();
@@ -477,6 +1024,7 @@ class FileManager {
     }
 
     handleUnauthorized() {
+        this.stopChangeFeed();
         this.username = null;
         this.updateUserDisplay();
         this.renderLoginPrompt();
@@ -0,0 +1,446 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from file_ops import is_temp_file
+
+# 全量重建时每个事务写入的行数
+BATCH_SIZE = 5000
+
+
+def _fts_available():
+    """当前SQLite是否支持FTS5 trigram分词器（3.34+）"""
+    try:
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(name, tokenize='trigram')")
+            return True
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def _subtree_condition(rel_path):
+    """匹配rel_path本身及其所有子项的条件（按路径范围查询，可以使用path索引）"""
+    if not rel_path:
+        return '1', ()
+    return '(path = ? OR (path >= ? AND path < ?))', (rel_path, rel_path + '/', rel_path + '0')
+
+
+def _extension(name, is_dir):
+    """小写的扩展名，文件夹和没有扩展名的文件为空字符串"""
+    if is_dir or '.' not in name.lstrip('.'):
+        return ''
+    return name.rsplit('.', 1)[1].lower()
+
+
+class _UserIndex:
+    """一个用户的索引数据库，连接在线程间共享，用锁串行访问"""
+
+    def __init__(self, db_path, use_fts):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(files)')]
+        if columns and 'parent' not in columns:
+            # 旧版本的索引没有parent列和用量表，索引可以随时重建，直接删除
+            self.conn.executescript('''
+                DROP TABLE IF EXISTS files_fts;
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS meta;
+            ''')
+        self.conn.executescript(SearchIndex.SCHEMA)
+        if use_fts:
+            self.conn.executescript(SearchIndex.FTS_SCHEMA)
+
+    def get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+
+class SearchIndex:
+    """按用户划分的文件名/路径搜索索引和空间用量账本
+
+    每个用户的文件目录对应data/search/下的一个SQLite数据库，files表保存相对路径、
+    名称、大小、修改时间和扩展名，名称和路径另建FTS5 trigram全文索引用于子串搜索，
+    名称前缀搜索和各种过滤条件使用普通索引，查询不需要遍历目录。dir_usage表由触发器
+    维护每个目录直接包含的文件字节数和文件数，目录树的用量只需汇总目录行，不需要du。
+
+    首次搜索时在后台线程中扫描整个目录建立索引，之后由服务器的修改路径（上传、
+    新建文件夹、删除、移动等）和inotify事件增量更新，并定期在后台全量核对一次，
+    以发现服务器之外的修改。多个服务器进程共享同一个数据库，全量核对由最先发现
+    索引过期的进程认领，其余进程不重复扫描。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL COLLATE NOCASE,
+            is_dir INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            ext TEXT NOT NULL,
+            gen INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_name ON files(name);
+        CREATE INDEX IF NOT EXISTS idx_files_size ON files(size);
+        CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime);
+        CREATE INDEX IF NOT EXISTS idx_files_ext ON files(ext, name);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS dir_usage (
+            path TEXT PRIMARY KEY,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            files INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TRIGGER IF NOT EXISTS usage_insert AFTER INSERT ON files WHEN new.is_dir = 0 BEGIN
+            INSERT INTO dir_usage (path, bytes, files) VALUES (new.parent, new.size, 1)
+            ON CONFLICT(path) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS usage_delete AFTER DELETE ON files WHEN old.is_dir = 0 BEGIN
+            UPDATE dir_usage SET bytes = bytes - old.size, files = files - 1 WHERE path = old.parent;
+        END;
+        CREATE TRIGGER IF NOT EXISTS usage_update AFTER UPDATE OF size, is_dir ON files
+        WHEN old.size != new.size OR old.is_dir != new.is_dir BEGIN
+            UPDATE dir_usage SET bytes = bytes - old.size, files = files - 1
+            WHERE path = old.parent AND old.is_dir = 0;
+            INSERT INTO dir_usage (path, bytes, files) SELECT new.parent, new.size, 1 WHERE new.is_dir = 0
+            ON CONFLICT(path) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + 1;
+        END;
+    """
+
+    # 全文索引与files表同步：名称和路径不会被UPDATE修改（路径是唯一键），只需处理插入和删除
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+            name, path, content='files', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+            INSERT INTO files_fts (rowid, name, path) VALUES (new.id, new.name, new.path);
+        END;
+        CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+            INSERT INTO files_fts (files_fts, rowid, name, path) VALUES ('delete', old.id, old.name, old.path);
+        END;
+    """
+
+    SORT_COLUMNS = {'name': 'name', 'size': 'size', 'mtime': 'mtime', 'path': 'path'}
+    MAX_LIMIT = 1000
+
+    def __init__(self, index_dir='data/search', reindex_interval=3600):
+        self.index_dir = index_dir
+        self.reindex_interval = reindex_interval
+        self.use_fts = _fts_available()
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._indexes = {}
+        self._indexes_lock = threading.Lock()
+
+        # 后台建立索引的队列，元素为(用户根目录, 相对路径)，重复的请求合并
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._active_root = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._worker, name='search-indexer', daemon=True)
+        self._thread.start()
+
+    def _get_index(self, root):
+        """获取用户根目录对应的索引数据库"""
+        key = os.path.basename(os.path.normpath(root))
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = _UserIndex(os.path.join(self.index_dir, f'{key}.db'), self.use_fts)
+            return index
+
+    # ---- 建立索引 ----
+
+    def _row(self, rel_path, name, is_dir, stat):
+        return (rel_path, rel_path.rpartition('/')[0], name, int(is_dir), 0 if is_dir else stat.st_size,
+                stat.st_mtime, _extension(name, is_dir))
+
+    def _write_rows(self, index, rows, gen):
+        """插入或更新一批行，只修改大小、修改时间的行不会触发全文索引更新
+
+        gen只增不减，另一个进程较晚开始的核对不会被较早开始的核对覆盖而误删。
+        """
+        with index.lock:
+            index.conn.execute('BEGIN IMMEDIATE')
+            try:
+                index.conn.executemany(
+                    'INSERT INTO files (path, parent, name, is_dir, size, mtime, ext, gen) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(path) DO UPDATE SET is_dir = excluded.is_dir, size = excluded.size, '
+                    'mtime = excluded.mtime, ext = excluded.ext, gen = MAX(files.gen, excluded.gen)',
+                    [row + (gen,) for row in rows])
+                index.conn.execute('COMMIT')
+            except Exception:
+                index.conn.execute('ROLLBACK')
+                raise
+
+    def _scan(self, root, rel_path):
+        """遍历rel_path及其子项，逐个生成索引行（不跟随符号链接，跳过临时文件）"""
+        top = os.path.join(root, rel_path) if rel_path else root
+        try:
+            stat = os.lstat(top)
+        except FileNotFoundError:
+            return
+        if rel_path:
+            is_dir = os.path.isdir(top) and not os.path.islink(top)
+            yield self._row(rel_path, os.path.basename(rel_path), is_dir, stat)
+            if not is_dir:
+                return
+
+        stack = [(top, rel_path)]
+        while stack:
+            dir_path, dir_rel = stack.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if is_temp_file(entry.name):
+                            continue
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            entry_stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        entry_rel = f'{dir_rel}/{entry.name}' if dir_rel else entry.name
+                        yield self._row(entry_rel, entry.name, is_dir, entry_stat)
+                        if is_dir:
+                            stack.append((entry.path, entry_rel))
+            except OSError as e:
+                print(f"建立搜索索引时无法读取目录 {dir_path}: {e}")
+
+    def index_tree(self, root, rel_path=''):
+        """扫描rel_path（空表示整个用户目录）并与索引核对：新增、更新变化的行并删除已不存在的行"""
+        index = self._get_index(root)
+        with index.lock:
+            index.conn.execute('BEGIN IMMEDIATE')
+            gen = int(index.get_meta('gen') or 0) + 1
+            index.set_meta('gen', gen)
+            index.conn.execute('COMMIT')
+
+        rows = []
+        for row in self._scan(root, rel_path):
+            rows.append(row)
+            if len(rows) >= BATCH_SIZE:
+                if self._stop.is_set():
+                    # 正在关闭，放弃本次核对（未核对的行保留到下次）
+                    return
+                self._write_rows(index, rows, gen)
+                rows = []
+        if rows:
+            self._write_rows(index, rows, gen)
+
+        condition, params = _subtree_condition(rel_path)
+        with index.lock:
+            index.conn.execute(f'DELETE FROM files WHERE {condition} AND gen < ?', params + (gen,))
+            if not rel_path:
+                index.conn.execute('DELETE FROM dir_usage WHERE files <= 0')
+                index.set_meta('built_at', time.time())
+
+    def _worker(self):
+        """后台索引线程"""
+        while True:
+            item = self._queue.get()
+            if item is None or self._stop.is_set():
+                self._queue.task_done()
+                return
+            root, rel_path = item
+            with self._pending_lock:
+                self._pending.discard((root, rel_path))
+                self._active_root = root
+            try:
+                self.index_tree(root, rel_path)
+            except Exception as e:
+                print(f"建立搜索索引失败 {root} {rel_path}: {e}")
+            finally:
+                with self._pending_lock:
+                    self._active_root = None
+                self._queue.task_done()
+
+    def schedule(self, root, rel_path=''):
+        """把目录加入后台索引队列"""
+        key = (root, rel_path)
+        with self._pending_lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._queue.put(key)
+
+    def is_indexing(self, root):
+        """用户目录是否有等待或正在进行的索引任务"""
+        with self._pending_lock:
+            return self._active_root == root or any(pending_root == root for pending_root, _ in self._pending)
+
+    def ensure_indexed(self, root):
+        """索引从未建立或上次全量核对已超过reindex_interval时在后台重新扫描，返回索引是否已建立"""
+        index = self._get_index(root)
+        now = time.time()
+        with index.lock:
+            index.conn.execute('BEGIN IMMEDIATE')
+            built_at = index.get_meta('built_at')
+            claimed_at = index.get_meta('scan_claimed_at')
+            # 其他进程刚认领过核对时不再重复扫描
+            stale = (built_at is None or now - float(built_at) > self.reindex_interval) and \
+                (claimed_at is None or now - float(claimed_at) > self.reindex_interval)
+            if stale:
+                index.set_meta('scan_claimed_at', now)
+            index.conn.execute('COMMIT')
+        if stale:
+            self.schedule(root)
+        return built_at is not None
+
+    def wait_idle(self):
+        """等待后台索引队列处理完毕"""
+        self._queue.join()
+
+    # ---- 增量更新 ----
+
+    def update(self, root, rel_path, action, is_dir=False):
+        """服务器修改文件后更新索引，action为'created'、'deleted'或'modified'"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        if not rel_path:
+            return
+        index = self._get_index(root)
+
+        if action == 'deleted':
+            condition, params = _subtree_condition(rel_path)
+            with index.lock:
+                index.conn.execute(f'DELETE FROM files WHERE {condition}', params)
+            return
+
+        if is_dir and action == 'created':
+            # 移动或复制进来的文件夹可能很大，放到后台扫描
+            self.schedule(root, rel_path)
+            return
+
+        full_path = os.path.join(root, rel_path)
+        try:
+            stat = os.lstat(full_path)
+        except FileNotFoundError:
+            with index.lock:
+                index.conn.execute('DELETE FROM files WHERE path = ?', (rel_path,))
+            return
+        entry_is_dir = os.path.isdir(full_path) and not os.path.islink(full_path)
+        with index.lock:
+            gen = int(index.get_meta('gen') or 0)
+        self._write_rows(index, [self._row(rel_path, os.path.basename(rel_path), entry_is_dir, stat)], gen)
+
+    # ---- 空间用量 ----
+
+    def is_built(self, root):
+        """索引是否已完成过一次全量扫描（之前的用量数据可能不完整）"""
+        index = self._get_index(root)
+        with index.lock:
+            return index.get_meta('built_at') is not None
+
+    def get_usage(self, root, rel_path=''):
+        """目录树（空表示整个用户目录）的用量，返回{'bytes', 'files'}"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        condition, params = _subtree_condition(rel_path)
+        index = self._get_index(root)
+        with index.lock:
+            total_bytes, files = index.conn.execute(
+                f'SELECT COALESCE(SUM(bytes), 0), COALESCE(SUM(files), 0) FROM dir_usage WHERE {condition}',
+                params).fetchone()
+        return {'bytes': total_bytes, 'files': files}
+
+    def get_children_usage(self, root, rel_path=''):
+        """目录下每个直接子目录的用量，直接位于该目录中的文件汇总为名称为空的一项"""
+        rel_path = rel_path.replace('\\', '/').strip('/')
+        prefix = rel_path + '/' if rel_path else ''
+        condition, params = _subtree_condition(rel_path)
+        index = self._get_index(root)
+        with index.lock:
+            rows = index.conn.execute(
+                f"SELECT CASE WHEN path = ? THEN '' "
+                f"WHEN instr(substr(path, ?), '/') > 0 THEN substr(substr(path, ?), 1, instr(substr(path, ?), '/') - 1) "
+                f"ELSE substr(path, ?) END AS child, SUM(bytes), SUM(files) "
+                f"FROM dir_usage WHERE {condition} AND files > 0 GROUP BY child ORDER BY 2 DESC",
+                (rel_path,) + (len(prefix) + 1,) * 4 + params).fetchall()
+        return [{'name': name, 'bytes': total_bytes, 'files': files} for name, total_bytes, files in rows]
+
+    # ---- 搜索 ----
+
+    def search(self, root, query='', mode='substring', path='', in_path=False, extensions=None,
+               file_type=None, min_size=None, max_size=None, modified_after=None, modified_before=None,
+               sort='name', order='asc', offset=0, limit=100):
+        """搜索文件，返回[{'path', 'name', 'is_dir', 'size', 'mtime'}]
+
+        mode为'substring'（名称包含query）或'prefix'（名称以query开头），in_path为True时
+        子串匹配整个相对路径；path限定在某个子目录下搜索。
+        """
+        index = self._get_index(root)
+        conditions, params = [], []
+        source = 'files'
+
+        query = (query or '').strip()
+        if query:
+            if mode == 'prefix':
+                # NOCASE排序下的范围查询，使用name索引
+                conditions.append('files.name >= ? AND files.name < ?')
+                params += [query, query + '\U0010ffff']
+            elif self.use_fts and len(query) >= 3:
+                phrase = '"' + query.replace('"', '""') + '"'
+                source = 'files_fts JOIN files ON files.id = files_fts.rowid'
+                conditions.append('files_fts MATCH ?')
+                params.append(phrase if in_path else f'name : {phrase}')
+            else:
+                # 少于3个字符无法使用trigram索引
+                escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                conditions.append(f"files.{'path' if in_path else 'name'} LIKE ? ESCAPE '\\'")
+                params.append(f'%{escaped}%')
+
+        path = (path or '').replace('\\', '/').strip('/')
+        if path:
+            conditions.append('files.path >= ? AND files.path < ?')
+            params += [path + '/', path + '0']
+        if extensions:
+            conditions.append(f"files.ext IN ({','.join('?' * len(extensions))})")
+            params += [ext.lower().lstrip('.') for ext in extensions]
+        if file_type in ('file', 'dir'):
+            conditions.append('files.is_dir = ?')
+            params.append(1 if file_type == 'dir' else 0)
+        if min_size is not None:
+            conditions.append('files.size >= ?')
+            params.append(min_size)
+        if max_size is not None:
+            conditions.append('files.size <= ?')
+            params.append(max_size)
+        if modified_after is not None:
+            conditions.append('files.mtime >= ?')
+            params.append(modified_after)
+        if modified_before is not None:
+            conditions.append('files.mtime <= ?')
+            params.append(modified_before)
+
+        sort_column = self.SORT_COLUMNS.get(sort, 'name')
+        direction = 'DESC' if order == 'desc' else 'ASC'
+        limit = max(1, min(int(limit), self.MAX_LIMIT))
+        sql = (f"SELECT files.path, files.name, files.is_dir, files.size, files.mtime FROM {source} "
+               f"WHERE {' AND '.join(conditions) or '1'} "
+               f"ORDER BY files.{sort_column} {direction}, files.path LIMIT ? OFFSET ?")
+        with index.lock:
+            rows = index.conn.execute(sql, params + [limit, max(0, int(offset))]).fetchall()
+        return [{'path': path, 'name': name, 'is_dir': bool(is_dir), 'size': size, 'mtime': mtime}
+                for path, name, is_dir, size, mtime in rows]
+
+    def close(self):
+        """停止后台索引线程并关闭所有索引数据库"""
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join()
+        with self._indexes_lock:
+            for index in self._indexes.values():
+                with index.lock:
+                    index.conn.close()
+            self._indexes.clear()
@@ -1,10 +1,38 @@
 import os
+import sys
 import json
+import time
+import hmac
+import hashlib
+import atexit
 import shutil
+import signal
+import threading
+import argparse
+import stat as stat_module
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, abort
+from werkzeug.wsgi import ClosingIterator
 from flask_cors import CORS
 from user_manager import UserManager
+from password_hasher import PasswordHasher
+from dir_cache import DirectoryCache, InotifyWatcher, make_etag
+from file_transfer import send_file_with_ranges, content_disposition
+from chunked_upload import UploadManager
+from zip_stream import iter_zip_stream
+from file_ops import (is_within, is_temp_file, temp_name, move_path, copy_path, delete_path,
+                      scan_totals, delete_tree, copy_tree, sweep_temp_entries, DELETING_SUFFIX, WRITING_SUFFIX)
+from jobs import JobManager
+from search_index import SearchIndex
+from blob_store import BlobStore
+from thumbnails import ThumbnailCache, is_image, THUMBNAIL_SIZES
+from metrics import REGISTRY, timed
+from static_assets import StaticAssets, compress_response
+from change_feed import ChangeFeed
+from hash_index import HashIndex, ALGORITHMS as HASH_ALGORITHMS
+from delta_sync import (compute_signature, apply_delta, choose_block_size, file_version,
+                        DeltaError, BaseChangedError, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE)
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -13,9 +41,79 @@ CORS(app)  # 允许跨域请求
 app.secret_key = 'your-secret-key-here-change-in-production'
 
 class FileManagerServer:
-    def __init__(self):
+    def __init__(self, user_backend='json', dir_cache_size=256, enable_inotify=True, default_quota=None,
+                 dedup=False, shared=False, password_hasher=None):
         self.allowed_extensions = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx', 'zip', 'rar'}
-        self.user_manager = UserManager()
+        self.user_manager = UserManager(backend=user_backend, password_hasher=password_hasher)
+        
+        # 目录列表缓存，Linux下用inotify感知服务器之外的修改（如通过SMB放入的文件）
+        watcher = None
+        if enable_inotify and InotifyWatcher.available():
+            try:
+                watcher = InotifyWatcher(self._on_fs_event, self._on_fs_overflow)
+            except OSError as e:
+                print(f"inotify不可用，根据目录修改时间和缓存有效期判断缓存是否过期: {e}")
+        self.dir_cache = DirectoryCache(dir_cache_size, watcher)
+        
+        # 分块、可续传上传；多个服务器进程时（shared）上传和任务状态通过data目录在进程间共享
+        self.upload_manager = UploadManager(self.user_manager.data_dir, shared=shared)
+        
+        # 批量操作中的复制在线程池中并行执行
+        self.copy_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='file-copy')
+        
+        # 递归删除、复制、打包等耗时操作在后台任务中执行
+        self.job_manager = JobManager(state_dir=os.path.join(self.user_manager.data_dir, 'jobs') if shared else None)
+        
+        # 按用户划分的文件名搜索索引
+        self.search_index = SearchIndex(os.path.join(self.user_manager.data_dir, 'search'))
+        
+        # 文件变更事件流，客户端据此增量更新界面；多个服务器进程时通过SQLite共享
+        self.change_feed = ChangeFeed(os.path.join(self.user_manager.data_dir, 'changes.db') if shared else None)
+        
+        # 可选的去重存储：上传内容按哈希只保存一份，用户文件是指向它的硬链接
+        self.blob_store = BlobStore(os.path.join(self.user_manager.data_dir, 'blobs')) if dedup else None
+        
+        # 文件哈希缓存，未修改的文件不重新计算；上传时边接收边计算SHA-256
+        self.hash_index = HashIndex(os.path.join(self.user_manager.data_dir, 'hashes.db'))
+        
+        # 图片缩略图（需要Pillow），上传后在后台预先生成
+        self.thumbnails = ThumbnailCache(os.path.join(self.user_manager.data_dir, 'thumbnails')) \
+            if ThumbnailCache.available() else None
+        
+        # 空间用量由搜索索引维护，启动时在后台核对尚未建立或已过期的用户索引
+        self.default_quota = default_quota
+        if os.path.isdir('files'):
+            for user_dir in os.listdir('files'):
+                if os.path.isdir(os.path.join('files', user_dir)):
+                    self.search_index.ensure_indexed(os.path.join('files', user_dir))
+        
+        # 清理上次运行被中断（崩溃、强制退出）时遗留的隐藏临时项目，启动之后创建的不动；
+        # 多个服务器进程时其他进程可能正在使用，只清理一小时前的
+        if os.path.isdir('files'):
+            before = time.time() - (3600 if shared else 0)
+            self.job_manager.submit(None, 'cleanup', lambda job: sweep_temp_entries('files', before, job),
+                                    description="清理临时文件")
+        self._closed = False
+    
+    def shutdown(self):
+        """优雅关闭：取消并等待后台任务，写回未保存的数据，关闭线程池、进程池和数据库"""
+        if self._closed:
+            return
+        self._closed = True
+        self.change_feed.close()
+        self.job_manager.shutdown()
+        self.copy_executor.shutdown(wait=True)
+        self.hash_index.close()
+        if self.thumbnails is not None:
+            self.thumbnails.shutdown()
+        self.upload_manager.stop_sweeper()
+        self.upload_manager.flush()
+        self.user_manager.close()
+        self.search_index.close()
+        if self.blob_store is not None:
+            self.blob_store.close()
+        if self.dir_cache.watcher is not None:
+            self.dir_cache.watcher.close()
     
     def get_user_files_path(self, username, path=''):
         """获取用户文件路径"""
@@ -34,41 +132,237 @@ class FileManagerServer:
         full_path = os.path.join(user_base_dir, path) if path else user_base_dir
         return os.path.normpath(full_path)
     
+    # 列表排序字段：名称、大小、修改时间（文件夹始终排在前面）
+    SORT_KEYS = {
+        'name': lambda entry: entry[0].lower(),
+        'size': lambda entry: entry[2],
+        'mtime': lambda entry: entry[3],
+    }
+    
     def get_file_info(self, file_path):
         """获取文件信息"""
         try:
             stat = os.stat(file_path)
-            return {
-                'name': os.path.basename(file_path),
-                'is_dir': os.path.isdir(file_path),
-                'size': stat.st_size if not os.path.isdir(file_path) else 0,
-                'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-                'full_path': file_path
-            }
+            is_dir = stat_module.S_ISDIR(stat.st_mode)
+            return self._format_entry((os.path.basename(file_path), is_dir,
+                                       0 if is_dir else stat.st_size, stat.st_mtime, file_path))
         except Exception as e:
             print(f"Error getting file info for {file_path}: {e}")
             return None
     
-    def list_files(self, username, path=''):
-        """列出用户目录下的文件"""
+    def _format_entry(self, entry):
+        """将扫描得到的(名称, 是否目录, 大小, 修改时间, 路径)转换为接口返回的文件信息"""
+        name, is_dir, size, mtime, full_path = entry
+        return {
+            'name': name,
+            'is_dir': is_dir,
+            'size': size,
+            'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime)),
+            'mtime': mtime,
+            'full_path': full_path
+        }
+    
+    def _scan_directory(self, dir_path):
+        """用os.scandir扫描目录，复用DirEntry缓存的类型和stat结果，逐个生成(名称, 是否目录, 大小, 修改时间, 路径)"""
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if is_temp_file(entry.name):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                except OSError as e:
+                    print(f"Error getting file info for {entry.path}: {e}")
+                    continue
+                yield (entry.name, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime, entry.path)
+    
+    def _sort_entries(self, entries, sort='name', order='asc'):
+        """按指定字段排序，文件夹优先"""
+        entries = sorted(entries, key=self.SORT_KEYS[sort], reverse=(order == 'desc'))
+        entries.sort(key=lambda entry: not entry[1])
+        return entries
+    
+    @timed('list_files')
+    def get_listing(self, username, path=''):
+        """获取目录的缓存列表，目录不存在时返回None"""
         user_path = self.get_user_files_path(username, path)
-        if not user_path or not os.path.exists(user_path):
-            return []
+        if not user_path or not os.path.isdir(user_path):
+            return None
         
         try:
-            files = []
-            for item in os.listdir(user_path):
-                item_path = os.path.join(user_path, item)
-                file_info = self.get_file_info(item_path)
-                if file_info:
-                    files.append(file_info)
-            
-            # 按文件夹优先排序
-            files.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
-            return files
+            return self.dir_cache.get(user_path, self._scan_directory)
         except Exception as e:
             print(f"Error listing files in {user_path}: {e}")
-            return []
+            return None
+    
+    def paginate_listing(self, listing, offset=0, limit=None, sort='name', order='asc'):
+        """对目录列表排序分页，只格式化当前页的条目"""
+        page = {'items': [], 'total': 0, 'offset': offset, 'limit': limit, 'next_offset': None}
+        if listing is None:
+            return page
+        
+        entries = listing.sorted_view((sort, order), lambda e: self._sort_entries(e, sort, order))
+        end = len(entries) if limit is None else min(offset + limit, len(entries))
+        page['items'] = [self._format_entry(entry) for entry in entries[offset:end]]
+        page['total'] = len(entries)
+        if end < len(entries):
+            page['next_offset'] = end
+        return page
+    
+    def list_files_page(self, username, path='', offset=0, limit=None, sort='name', order='asc'):
+        """分页列出用户目录下的文件"""
+        return self.paginate_listing(self.get_listing(username, path), offset, limit, sort, order)
+    
+    def iter_files(self, username, path=''):
+        """按scandir顺序逐个生成文件信息，不排序，用于流式返回超大目录"""
+        user_path = self.get_user_files_path(username, path)
+        if not user_path or not os.path.isdir(user_path):
+            return
+        
+        for entry in self._scan_directory(user_path):
+            yield self._format_entry(entry)
+    
+    def list_files(self, username, path=''):
+        """列出用户目录下的文件"""
+        return self.list_files_page(username, path)['items']
+    
+    def notify_change(self, username, path, name, action, is_dir=False):
+        """服务器修改文件系统后调用，action为'created'、'deleted'或'modified'"""
+        dir_path = self.get_user_files_path(username, path)
+        if not dir_path:
+            return
+        
+        self.dir_cache.invalidate(dir_path)
+        if is_dir and action == 'deleted':
+            self.dir_cache.invalidate_tree(os.path.join(dir_path, name))
+        
+        user_base = self.user_manager.get_user_files_dir(username)
+        rel_path = os.path.relpath(os.path.join(dir_path, name), user_base)
+        try:
+            self.search_index.update(user_base, rel_path, action, is_dir)
+        except Exception as e:
+            print(f"更新搜索索引失败 {rel_path}: {e}")
+        self._publish_change(user_base, dir_path, name, action, is_dir)
+    
+    def _publish_change(self, user_base, dir_path, name, action, is_dir):
+        """向变更事件流发布事件，created和modified事件附带文件信息"""
+        rel_dir = os.path.relpath(dir_path, user_base).replace(os.sep, '/')
+        if rel_dir == '.':
+            rel_dir = ''
+        file_info = None
+        if action != 'deleted':
+            # 与列表接口相同的相对路径形式（inotify回调中的目录是绝对路径）
+            full_path = os.path.normpath(os.path.join(user_base, rel_dir, name))
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                # 文件已经不存在（例如随即被删除），随后的删除事件会更新客户端
+                return
+            is_dir = stat_module.S_ISDIR(stat.st_mode)
+            file_info = self._format_entry((name, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime, full_path))
+        self.change_feed.publish(user_base, rel_dir, name, action, is_dir, file_info)
+    
+    def _on_fs_event(self, dir_path, name, mask):
+        """inotify事件回调：目录内容在服务器之外被修改"""
+        is_dir = bool(mask & InotifyWatcher.IN_ISDIR)
+        removed = bool(mask & (InotifyWatcher.IN_DELETE | InotifyWatcher.IN_MOVED_FROM))
+        self.dir_cache.invalidate(dir_path)
+        if is_dir and removed:
+            self.dir_cache.invalidate_tree(os.path.join(dir_path, name))
+        
+        # 同步更新搜索索引：被监视的目录都在files/<用户目录>/之下
+        if not name or is_temp_file(name):
+            return
+        rel_path = os.path.relpath(os.path.join(dir_path, name), os.path.abspath('files'))
+        parts = rel_path.split(os.sep)
+        if parts[0] == '..' or len(parts) < 2:
+            return
+        if removed:
+            action = 'deleted'
+        elif mask & (InotifyWatcher.IN_CREATE | InotifyWatcher.IN_MOVED_TO):
+            action = 'created'
+        else:
+            action = 'modified'
+        # 写入过程中的每次IN_MODIFY不处理，等文件关闭（IN_CLOSE_WRITE）时处理一次
+        if action == 'modified' and not mask & (InotifyWatcher.IN_CLOSE_WRITE | InotifyWatcher.IN_ATTRIB):
+            return
+        user_base = os.path.join('files', parts[0])
+        try:
+            self.search_index.update(user_base, '/'.join(parts[1:]), action, is_dir)
+        except Exception as e:
+            print(f"更新搜索索引失败 {rel_path}: {e}")
+        self._publish_change(user_base, dir_path, name, action, is_dir)
+    
+    def _on_fs_overflow(self):
+        """inotify事件队列溢出：丢失的修改无从得知，所有目录列表缓存失效，
+        客户端的变更游标过期（重新获取列表），搜索索引重新核对"""
+        self.dir_cache.invalidate_all()
+        self.change_feed.reset()
+        if os.path.isdir('files'):
+            for entry in os.scandir('files'):
+                if entry.is_dir(follow_symlinks=False) and not is_temp_file(entry.name):
+                    self.search_index.schedule(os.path.join('files', entry.name))
+    
+    def get_quota(self, username):
+        """用户的空间配额（字节），None表示不限制"""
+        quota = self.user_manager.get_user_quota(username)
+        return self.default_quota if quota is None else quota
+    
+    def get_usage(self, username, path=''):
+        """用户目录树的空间用量，不遍历目录"""
+        user_base = self.user_manager.get_user_files_dir(username)
+        if not user_base:
+            return None
+        built = self.search_index.ensure_indexed(user_base)
+        usage = self.search_index.get_usage(user_base, path)
+        usage['reserved_bytes'] = self.upload_manager.reserved_bytes(username) if not path else 0
+        usage['complete'] = built and not self.search_index.is_indexing(user_base)
+        return usage
+    
+    def get_used_bytes(self, username):
+        """配额计算使用的已用字节数（包括未完成上传的预留），用户目录不存在时返回None
+        
+        用量账本在首次建立索引完成之前不完整，这段时间直接统计目录大小。
+        """
+        user_base = self.user_manager.get_user_files_dir(username)
+        if not user_base:
+            return None
+        if self.search_index.ensure_indexed(user_base):
+            used = self.search_index.get_usage(user_base)['bytes']
+        else:
+            used = scan_totals(user_base)[1] if os.path.isdir(user_base) else 0
+        return used + self.upload_manager.reserved_bytes(username)
+    
+    def check_quota(self, username, additional_bytes, replaced_path=None, used=None):
+        """写入additional_bytes字节前检查配额，返回(是否允许, 错误信息)
+        
+        replaced_path为将被覆盖的文件；used不为None时代替当前的已用字节数（批量操作中使用）。
+        """
+        quota = self.get_quota(username)
+        if quota is None:
+            return True, None
+        if replaced_path and os.path.isfile(replaced_path):
+            additional_bytes -= os.path.getsize(replaced_path)
+        if additional_bytes <= 0:
+            return True, None
+        
+        if used is None:
+            used = self.get_used_bytes(username)
+        if used is None:
+            return False, "用户目录不存在"
+        if used + additional_bytes > quota:
+            return False, f"存储空间不足：已使用 {used} 字节，配额 {quota} 字节"
+        return True, None
+    
+    def _item_size(self, username, item_path, is_dir):
+        """文件或文件夹占用的字节数，文件夹从用量账本中读取（索引建立之前直接统计）"""
+        if not is_dir:
+            return os.lstat(item_path).st_size
+        user_base = self.user_manager.get_user_files_dir(username)
+        if not self.search_index.ensure_indexed(user_base):
+            return scan_totals(item_path)[1]
+        rel_path = os.path.relpath(item_path, user_base).replace(os.sep, '/')
+        return self.search_index.get_usage(user_base, rel_path)['bytes']
     
     def create_folder(self, username, path, name):
         """创建文件夹"""
@@ -82,6 +376,7 @@ class FileManagerServer:
                 return False, "文件夹已存在"
             
             os.makedirs(folder_path)
+            self.notify_change(username, path, name, 'created', is_dir=True)
             return True, "文件夹创建成功"
         except Exception as e:
             return False, f"创建文件夹失败: {str(e)}"
@@ -97,29 +392,660 @@ class FileManagerServer:
             if not os.path.exists(item_path):
                 return False, "文件或文件夹不存在"
             
-            if is_dir:
-                shutil.rmtree(item_path)
-            else:
-                os.remove(item_path)
+            try:
+                if is_dir:
+                    shutil.rmtree(item_path)
+                else:
+                    os.remove(item_path)
+            finally:
+                # 删除失败时只在项目确实已不存在时通知
+                if not os.path.lexists(item_path):
+                    self.notify_change(username, path, name, 'deleted', is_dir=is_dir)
             
             return True, "删除成功"
         except Exception as e:
             return False, f"删除失败: {str(e)}"
     
+    # 批量操作支持的类型和单次请求的最大操作数
+    BATCH_OPERATIONS = ('delete', 'move', 'copy', 'rename')
+    MAX_BATCH_SIZE = 10000
+    
+    def _prepare_operation(self, username, default_path, operation, reserved, quota_state):
+        """校验批量操作中的一项，返回(是否成功, 执行计划或错误信息)"""
+        if not isinstance(operation, dict):
+            return False, "无效的操作"
+        op = operation.get('op')
+        if op not in self.BATCH_OPERATIONS:
+            return False, f"不支持的操作: {op}"
+        
+        path = operation.get('path', default_path) or ''
+        name = operation.get('name', '')
+        if not self.is_valid_name(name):
+            return False, "无效的文件名"
+        
+        user_base = self.user_manager.get_user_files_dir(username)
+        src_dir = self.get_user_files_path(username, path)
+        if not user_base or not src_dir:
+            return False, "用户目录不存在"
+        src = os.path.join(src_dir, name)
+        if not os.path.lexists(src):
+            return False, "文件或文件夹不存在"
+        is_dir = os.path.isdir(src) and not os.path.islink(src)
+        plan = {'op': op, 'path': path, 'name': name, 'src': src, 'is_dir': is_dir}
+        if op == 'delete':
+            return True, plan
+        
+        # 重命名在原目录内进行，移动和复制可以同时指定新名称
+        dest_path = path if op == 'rename' else operation.get('dest_path', path) or ''
+        new_name = operation.get('new_name') or name
+        if not self.is_valid_name(new_name):
+            return False, "无效的目标名称"
+        dest_dir = self.get_user_files_path(username, dest_path)
+        if not dest_dir or not is_within(dest_dir, user_base) or not os.path.isdir(dest_dir):
+            return False, "目标目录不存在"
+        dst = os.path.join(dest_dir, new_name)
+        if os.path.lexists(dst) or os.path.normcase(os.path.abspath(dst)) in reserved:
+            return False, "目标已存在"
+        if is_dir and is_within(dst, src):
+            return False, "不能移动或复制到自身的子目录中"
+        
+        if op == 'copy':
+            # 同一批中之前的复制可能尚未执行，复制的文件夹也要等后台扫描后才计入用量，
+            # 所以以第一次复制前的用量为准，加上本批已允许的复制字节数
+            if quota_state['used'] is None:
+                quota_state['used'] = self.get_used_bytes(username)
+            size = self._item_size(username, src, is_dir)
+            used = None if quota_state['used'] is None else quota_state['used'] + quota_state['copied_bytes']
+            allowed, message = self.check_quota(username, size, used=used)
+            if not allowed:
+                return False, message
+            quota_state['copied_bytes'] += size
+        
+        plan.update(dest_path=dest_path, new_name=new_name, dst=dst)
+        return True, plan
+    
+    def _execute_operation(self, username, plan):
+        """执行一项批量操作，返回(是否成功, 消息)"""
+        op = plan['op']
+        if op == 'delete' and plan['is_dir']:
+            # 目录先重命名隐藏，再在后台删除，请求耗时与目录大小无关
+            success, result = self._start_delete_job(username, plan['path'], plan['name'], plan['src'])
+            if not success:
+                return False, result
+            plan['job_id'] = result['job_id']
+            return True, "删除任务已开始"
+        try:
+            if op == 'delete':
+                delete_path(plan['src'])
+            elif op == 'copy':
+                copy_path(plan['src'], plan['dst'])
+            else:
+                move_path(plan['src'], plan['dst'])
+        except Exception as e:
+            return False, f"操作失败: {str(e)}"
+        finally:
+            # 按实际结果通知：操作失败时源仍然存在、目标没有创建，不发布事件
+            if op != 'copy' and not os.path.lexists(plan['src']):
+                self.notify_change(username, plan['path'], plan['name'], 'deleted', is_dir=plan['is_dir'])
+            if op != 'delete' and os.path.lexists(plan['dst']):
+                self.notify_change(username, plan['dest_path'], plan['new_name'], 'created', is_dir=plan['is_dir'])
+        return True, "操作成功"
+    
+    def batch_operations(self, username, operations, path=''):
+        """批量删除、移动、复制、重命名，按顺序执行并返回每一项的结果
+        
+        连续的复制操作提交到线程池并行执行，遇到其他操作前先等待它们完成，
+        保证后面的操作能看到前面操作的结果。
+        """
+        results = [None] * len(operations)
+        pending = []
+        reserved = set()
+        # 配额检查：第一次复制前的已用字节数和本批已允许的复制字节数
+        quota_state = {'used': None, 'copied_bytes': 0}
+        
+        def record(index, operation, success, message):
+            operation = operation if isinstance(operation, dict) else {}
+            result = {'index': index, 'op': operation.get('op'), 'name': operation.get('name'), 'success': success}
+            result['message' if success else 'error'] = message
+            if operation.get('job_id'):
+                result['job_id'] = operation['job_id']
+            results[index] = result
+        
+        def wait_pending():
+            for index, plan, future in pending:
+                record(index, plan, *future.result())
+            pending.clear()
+            reserved.clear()
+        
+        for index, operation in enumerate(operations):
+            is_copy = isinstance(operation, dict) and operation.get('op') == 'copy'
+            if not is_copy:
+                wait_pending()
+            success, plan = self._prepare_operation(username, path, operation, reserved, quota_state)
+            if not success:
+                record(index, operation, False, plan)
+            elif is_copy:
+                reserved.add(os.path.normcase(os.path.abspath(plan['dst'])))
+                pending.append((index, plan, self.copy_executor.submit(self._execute_operation, username, plan)))
+            else:
+                record(index, plan, *self._execute_operation(username, plan))
+        wait_pending()
+        return results
+    
+    def _start_delete_job(self, username, path, name, item_path):
+        """把要删除的项目重命名为隐藏的临时名称后提交后台删除任务"""
+        trash_path = os.path.join(os.path.dirname(item_path), temp_name(name, DELETING_SUFFIX))
+        try:
+            os.rename(item_path, trash_path)
+        except OSError as e:
+            return False, f"删除失败: {str(e)}"
+        self.notify_change(username, path, name, 'deleted', is_dir=os.path.isdir(trash_path))
+        
+        def finish(job):
+            # 取消（包括关闭服务器时）或失败后把剩余部分恢复到原名称，不留下隐藏的目录；
+            # 原名称已被占用时留给启动时的清理
+            if job.status != 'completed' and os.path.lexists(trash_path) and not os.path.lexists(item_path):
+                os.rename(trash_path, item_path)
+                self.notify_change(username, path, name, 'created', is_dir=os.path.isdir(item_path))
+        
+        job = self.job_manager.submit(username, 'delete', lambda job: delete_tree(trash_path, job),
+                                      description=f"删除 {name}", on_finish=finish)
+        return True, job.to_dict()
+    
+    def start_delete_job(self, username, path, name):
+        """后台删除文件或文件夹，返回(是否成功, 任务信息或错误信息)"""
+        if not self.is_valid_name(name):
+            return False, "无效的文件名"
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        item_path = os.path.join(user_path, name)
+        if not os.path.lexists(item_path):
+            return False, "文件或文件夹不存在"
+        return self._start_delete_job(username, path, name, item_path)
+    
+    def start_copy_job(self, username, path, name, dest_path, new_name=None):
+        """后台复制文件或文件夹，返回(是否成功, 任务信息或错误信息)
+        
+        先复制到目标目录中的隐藏临时名称，完成后再重命名，未完成的副本不会出现在列表中。
+        """
+        success, plan = self._prepare_operation(username, path, {
+            'op': 'copy', 'name': name, 'dest_path': dest_path, 'new_name': new_name
+        }, set(), {'used': None, 'copied_bytes': 0})
+        if not success:
+            return False, plan
+        
+        src, dst = plan['src'], plan['dst']
+        temp_path = os.path.join(os.path.dirname(dst), temp_name(plan['new_name'], WRITING_SUFFIX))
+        
+        def run(job):
+            try:
+                copy_tree(src, temp_path, job)
+                if os.path.lexists(dst):
+                    raise FileExistsError(f"目标已存在: {plan['new_name']}")
+                os.rename(temp_path, dst)
+            except BaseException:
+                if os.path.lexists(temp_path):
+                    delete_path(temp_path)
+                raise
+            return {'path': plan['dest_path'], 'name': plan['new_name']}
+        
+        def finish(job):
+            if job.status == 'completed':
+                self.notify_change(username, plan['dest_path'], plan['new_name'], 'created', is_dir=plan['is_dir'])
+        
+        job = self.job_manager.submit(username, 'copy', run, description=f"复制 {name}", on_finish=finish)
+        return True, job.to_dict()
+    
+    def start_archive_job(self, username, path, names=None, archive_name=None):
+        """后台把项目打包为ZIP文件保存在当前目录，返回(是否成功, 任务信息或错误信息)"""
+        success, items, default_name = self.prepare_zip(username, path, names)
+        if not success:
+            return False, items
+        
+        archive_name = archive_name or default_name
+        if not archive_name.lower().endswith('.zip'):
+            archive_name += '.zip'
+        if not self.is_valid_name(archive_name):
+            return False, "无效的文件名"
+        dir_path = self.get_user_files_path(username, path)
+        archive_path = os.path.join(dir_path, archive_name)
+        if os.path.lexists(archive_path):
+            return False, "目标已存在"
+        temp_path = os.path.join(dir_path, temp_name(archive_name, WRITING_SUFFIX))
+        
+        def run(job):
+            total_items, total_bytes = 0, 0
+            for item_path, _ in items:
+                item_count, item_bytes = scan_totals(item_path)
+                total_items += item_count
+                total_bytes += item_bytes
+            job.set_total(total_items, total_bytes)
+            try:
+                with open(temp_path, 'wb') as f:
+                    for data in iter_zip_stream(items, progress=job.advance):
+                        f.write(data)
+                if os.path.lexists(archive_path):
+                    raise FileExistsError(f"目标已存在: {archive_name}")
+                os.rename(temp_path, archive_path)
+            except BaseException:
+                if os.path.lexists(temp_path):
+                    os.remove(temp_path)
+                raise
+            return {'path': path, 'name': archive_name}
+        
+        def finish(job):
+            if job.status == 'completed':
+                self.notify_change(username, path, archive_name, 'created')
+        
+        job = self.job_manager.submit(username, 'archive', run, description=f"打包 {archive_name}", on_finish=finish)
+        return True, job.to_dict()
+    
+    def is_valid_name(self, name):
+        """检查文件名是否合法（不能包含路径分隔符）"""
+        return bool(name) and name not in ('.', '..') and \
+               '/' not in name and '\\' not in name and '\0' not in name
+    
+    def create_upload(self, username, path, filename, size, sha256=None):
+        """创建分块上传，去重模式下该用户已上传过相同内容（sha256）时直接完成，不需要传输数据"""
+        if not self.is_valid_name(filename):
+            return False, "无效的文件名"
+        
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        
+        # 在写入任何数据之前检查配额，未完成的上传按完整大小预留（先清理过期的上传）
+        self.upload_manager.expire_stale()
+        target_path = os.path.join(user_path, filename)
+        allowed, message = self.check_quota(username, size, target_path)
+        if not allowed:
+            return False, message
+        
+        if self.blob_store is not None and sha256:
+            os.makedirs(user_path, exist_ok=True)
+            if self.blob_store.link_existing(sha256.lower(), size, username, target_path):
+                self.after_upload(username, path, filename)
+                return True, {
+                    'upload_id': None,
+                    'path': path,
+                    'filename': filename,
+                    'size': size,
+                    'received': [[0, size]] if size else [],
+                    'received_bytes': size,
+                    'complete': True,
+                    'deduplicated': True
+                }
+        
+        return self.upload_manager.create(username, path, filename, size, user_path)
+    
+    def finalize_upload(self, username, upload_id):
+        """完成分块上传"""
+        commit = None
+        if self.blob_store is not None:
+            # 计算完整文件的哈希后放入去重存储，哈希同时保存到哈希缓存
+            def commit(part_path, target_path):
+                digest, _ = self.blob_store.ingest_file(part_path, username, target_path)
+                self.hash_index.record(os.stat(target_path), 'sha256', digest)
+        success, result = self.upload_manager.finalize(upload_id, username, commit)
+        if success:
+            if self.blob_store is None:
+                # 分块乱序写入，无法边接收边计算，完成后在后台计算
+                user_path = self.get_user_files_path(username, result['path'])
+                self.hash_index.warm(os.path.join(user_path, result['filename']))
+            self.after_upload(username, result['path'], result['filename'])
+        return success, result
+    
+    def after_upload(self, username, path, filename):
+        """上传完成后调用：更新缓存和索引，图片在后台预先生成缩略图"""
+        self.notify_change(username, path, filename, 'modified')
+        if self.thumbnails is not None and is_image(filename):
+            user_path = self.get_user_files_path(username, path)
+            if user_path:
+                self.thumbnails.pregenerate(os.path.join(user_path, filename))
+    
+    def get_thumbnail(self, username, path, filename, size):
+        """获取图片缩略图的缓存路径，返回(是否成功, 路径或错误信息)"""
+        if self.thumbnails is None:
+            return False, "服务器未安装Pillow，无法生成缩略图"
+        if not self.is_valid_name(filename) or not is_image(filename):
+            return False, "不支持的图片类型"
+        if size not in THUMBNAIL_SIZES:
+            return False, "不支持的缩略图尺寸"
+        
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        file_path = os.path.join(user_path, filename)
+        if not os.path.isfile(file_path):
+            return False, "文件不存在"
+        
+        try:
+            return True, self.thumbnails.get(file_path, size)
+        except Exception as e:
+            print(f"生成缩略图失败 {file_path}: {e}")
+            return False, "无法生成缩略图"
+    
+    def save_upload(self, username, path, filename, stream):
+        """保存普通（非分块）上传的文件：写入临时文件后重命名，去重模式下边接收边计算哈希"""
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        
+        # 确保目标目录存在
+        os.makedirs(user_path, exist_ok=True)
+        file_path = os.path.join(user_path, filename)
+        
+        try:
+            if self.blob_store is not None:
+                digest, _ = self.blob_store.ingest_stream(stream, username, file_path)
+                self.hash_index.record(os.stat(file_path), 'sha256', digest)
+            else:
+                # 不原地覆盖已有文件，它可能是去重存储中被共享的内容
+                temp_path = os.path.join(user_path, temp_name(filename, WRITING_SUFFIX))
+                try:
+                    # 边接收边计算SHA-256，重命名不改变inode和修改时间，写完时的状态就是最终文件的状态
+                    hasher = hashlib.sha256()
+                    with open(temp_path, 'wb') as f:
+                        while True:
+                            chunk = stream.read(1024 * 1024)
+                            if not chunk:
+                                break
+                            hasher.update(chunk)
+                            f.write(chunk)
+                        f.flush()
+                        written_stat = os.fstat(f.fileno())
+                    os.replace(temp_path, file_path)
+                    self.hash_index.record(written_stat, 'sha256', hasher.hexdigest())
+                except BaseException:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+        except Exception as e:
+            print(f"文件保存错误: {e}")
+            return False, f"文件保存失败: {str(e)}"
+        self.after_upload(username, path, filename)
+        return True, "文件上传成功"
+    
+    def get_delta_signature(self, username, path, filename, block_size=None):
+        """差异同步第一步：返回已有文件的大小、版本和每个块的弱/强校验值"""
+        if not self.is_valid_name(filename):
+            return False, "无效的文件名"
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        
+        file_path = os.path.join(user_path, filename)
+        try:
+            with open(file_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if not stat_module.S_ISREG(stat.st_mode):
+                    return False, "文件不存在或不是文件"
+                block_size = block_size or choose_block_size(stat.st_size)
+                blocks = compute_signature(f, block_size)
+        except (FileNotFoundError, IsADirectoryError):
+            return False, "文件不存在或不是文件"
+        return True, {
+            'size': stat.st_size,
+            'version': file_version(stat),
+            'block_size': block_size,
+            'blocks': blocks
+        }
+    
+    def apply_delta(self, username, path, filename, stream, base_version, block_size, size, sha256):
+        """差异同步第二步：用原文件的块和上传的新数据在临时文件中重建文件，校验后原子替换
+        
+        原文件在生成签名之后被修改时抛出BaseChangedError，客户端需要重新获取签名。
+        """
+        if not self.is_valid_name(filename):
+            return False, "无效的文件名"
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        
+        file_path = os.path.join(user_path, filename)
+        temp_path = os.path.join(user_path, temp_name(filename, WRITING_SUFFIX))
+        try:
+            with open(file_path, 'rb') as base:
+                stat = os.fstat(base.fileno())
+                if not stat_module.S_ISREG(stat.st_mode):
+                    return False, "文件不存在或不是文件"
+                if file_version(stat) != base_version:
+                    raise BaseChangedError("文件已被修改，请重新获取签名")
+                with open(temp_path, 'wb') as out:
+                    written, digest = apply_delta(base, stream, out, block_size, stat.st_size, max_size=size)
+                    out.flush()
+                    written_stat = os.fstat(out.fileno())
+            if written != size or digest != sha256.lower():
+                raise DeltaError("重建的文件与声明的大小或SHA-256不符")
+            
+            # 重建期间文件被替换或修改时放弃，不覆盖别人的修改
+            if file_version(os.stat(file_path)) != base_version:
+                raise BaseChangedError("文件已被修改，请重新获取签名")
+            if self.blob_store is not None:
+                self.blob_store.ingest_file(temp_path, username, file_path)
+                written_stat = os.stat(file_path)
+            else:
+                os.replace(temp_path, file_path)
+            self.hash_index.record(written_stat, 'sha256', digest)
+        except (FileNotFoundError, IsADirectoryError):
+            return False, "文件不存在或不是文件"
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.after_upload(username, path, filename)
+        return True, {'path': path, 'filename': filename, 'size': written, 'sha256': digest}
+    
+    def get_checksum(self, username, path, filename, algorithm='sha256'):
+        """文件的校验值，文件未修改时从哈希缓存中读取，返回(是否成功, 结果或错误信息)"""
+        if algorithm not in HASH_ALGORITHMS:
+            return False, f"不支持的算法，可选: {', '.join(sorted(HASH_ALGORITHMS))}"
+        if not self.is_valid_name(filename):
+            return False, "无效的文件名"
+        user_path = self.get_user_files_path(username, path)
+        if not user_path:
+            return False, "用户目录不存在"
+        
+        file_path = os.path.join(user_path, filename)
+        if not os.path.isfile(file_path):
+            return False, "文件不存在或不是文件"
+        digest, size, cached = self.hash_index.get(file_path, algorithm)
+        return True, {'path': path, 'filename': filename, 'size': size,
+                      'algorithm': algorithm, 'digest': digest, 'cached': cached}
+    
+    def start_checksum_job(self, username, path, recursive=False, algorithm='sha256'):
+        """在后台计算目录中所有文件的校验值（recursive时包括子目录），多个文件并行计算"""
+        if algorithm not in HASH_ALGORITHMS:
+            return False, f"不支持的算法，可选: {', '.join(sorted(HASH_ALGORITHMS))}"
+        user_path = self.get_user_files_path(username, path)
+        if not user_path or not os.path.isdir(user_path):
+            return False, "目录不存在"
+        
+        def iter_files():
+            for dir_path, dir_names, file_names in os.walk(user_path):
+                dir_names[:] = sorted(name for name in dir_names if not is_temp_file(name)) if recursive else []
+                for name in sorted(file_names):
+                    if not is_temp_file(name):
+                        yield os.path.join(dir_path, name)
+        
+        def run(job):
+            files = []
+            for file_path, digest, size, cached in self.hash_index.get_many(iter_files(), algorithm):
+                rel_path = os.path.relpath(file_path, user_path).replace(os.sep, '/')
+                files.append({'path': rel_path, 'size': size, 'digest': digest, 'cached': cached})
+                job.advance(items=1, bytes_done=size or 0)
+            return {'path': path, 'algorithm': algorithm, 'files': files}
+        
+        job = self.job_manager.submit(username, 'checksum', run, description=f"计算校验值 {path or '/'}")
+        return True, job.to_dict()
+    
+    def prepare_zip(self, username, path, names=None):
+        """准备打包下载的项目，names为空时打包整个目录，返回(是否成功, 项目列表或错误信息, 压缩包名称)"""
+        user_path = self.get_user_files_path(username, path)
+        if not user_path or not os.path.isdir(user_path):
+            return False, "目录不存在", None
+        
+        if not names:
+            base_name = os.path.basename(os.path.normpath(user_path)) if path else username
+            return True, [(user_path, base_name)], f"{base_name}.zip"
+        
+        items = []
+        for name in names:
+            if not self.is_valid_name(name):
+                return False, f"无效的文件名: {name}", None
+            item_path = os.path.join(user_path, name)
+            if not os.path.exists(item_path):
+                return False, f"文件或文件夹不存在: {name}", None
+            items.append((item_path, name))
+        
+        archive_name = f"{names[0]}.zip" if len(names) == 1 else \
+            f"{os.path.basename(os.path.normpath(user_path)) if path else username}.zip"
+        return True, items, archive_name
+    
     def allowed_file(self, filename):
         """检查文件扩展名是否允许"""
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
 
-file_manager = FileManagerServer()
+# 由create_app()创建，导入本模块不会启动后台线程
+file_manager = None
+static_assets = None
+
+# 超过该字节数的JSON响应用gzip压缩
+GZIP_MIN_SIZE = int(os.environ.get('FILE_MANAGER_GZIP_MIN_SIZE', 2048))
+
+def create_app():
+    """创建FileManagerServer并返回Flask应用，供WSGI服务器（gunicorn、waitress）加载
+
+    配置从环境变量读取：
+    FILE_MANAGER_BACKEND：用户存储后端，json（默认）或sqlite（多进程共享同一数据库）
+    FILE_MANAGER_DEFAULT_QUOTA：默认空间配额（字节），不设置表示不限制；单个用户可以用quota_bytes覆盖
+    FILE_MANAGER_DEDUP=1：启用去重存储（data/和files/需要在同一个文件系统上才能使用硬链接）
+    FILE_MANAGER_SHARED=1：多个服务器进程同时运行（需要sqlite后端），上传和任务状态在进程间共享
+    FILE_MANAGER_PASSWORD_ALGORITHM、FILE_MANAGER_PBKDF2_ITERATIONS、FILE_MANAGER_SCRYPT_N/R/P：
+    密码哈希的算法和工作因子，FILE_MANAGER_PASSWORD_WORKERS、FILE_MANAGER_PASSWORD_QUEUE：
+    同时计算和排队的哈希数（见PasswordHasher.from_environ）
+    """
+    global file_manager, static_assets
+    if file_manager is not None:
+        return app
+
+    backend = os.environ.get('FILE_MANAGER_BACKEND', 'json')
+    shared = os.environ.get('FILE_MANAGER_SHARED') == '1'
+    if shared and backend != 'sqlite':
+        raise ValueError("多进程运行时会话和用户数据需要在进程间共享，请设置FILE_MANAGER_BACKEND=sqlite")
+    default_quota = os.environ.get('FILE_MANAGER_DEFAULT_QUOTA')
+    file_manager = FileManagerServer(user_backend=backend,
+                                     default_quota=int(default_quota) if default_quota else None,
+                                     dedup=os.environ.get('FILE_MANAGER_DEDUP') == '1',
+                                     shared=shared,
+                                     password_hasher=PasswordHasher.from_environ())
+    file_manager.user_manager.start_sweeper()
+    file_manager.upload_manager.start_sweeper()
+    atexit.register(file_manager.shutdown)
+    static_assets = StaticAssets('.')
+    return app
+
+# 请求指标：按路由（URL规则而不是实际路径，避免标签无限增长）统计
+HTTP_REQUESTS = REGISTRY.counter('file_manager_http_requests_total', 'HTTP请求数',
+                                 ('method', 'route', 'status'))
+HTTP_DURATION = REGISTRY.histogram('file_manager_http_request_duration_seconds',
+                                   'HTTP请求耗时（秒），流式响应计算到传输结束', ('method', 'route'))
+HTTP_BYTES_IN = REGISTRY.counter('file_manager_http_request_bytes_total', '请求体字节数', ('route',))
+HTTP_BYTES_OUT = REGISTRY.counter('file_manager_http_response_bytes_total', '响应体字节数', ('route',))
+PASSWORD_HASH_QUEUE = REGISTRY.gauge(
+    'file_manager_password_hash_queue_depth', '正在计算和排队等待的密码哈希数',
+    lambda: file_manager.user_manager.password_hasher.queue_depth if file_manager is not None else 0)
+
+def _count_stream_bytes(iterable, route):
+    """流式响应（长度未知）边输出边累计字节数，结束时记录一次"""
+    total = 0
+    try:
+        for chunk in iterable:
+            total += len(chunk.encode('utf-8')) if isinstance(chunk, str) else len(chunk)
+            yield chunk
+    finally:
+        HTTP_BYTES_OUT.inc(route, amount=total)
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+@app.after_request
+def _record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request.environ['file_manager.route'] = route
+    HTTP_REQUESTS.inc(request.method, route, str(response.status_code))
+    if request.content_length:
+        HTTP_BYTES_IN.inc(route, amount=request.content_length)
+    if response.content_length is not None:
+        HTTP_BYTES_OUT.inc(route, amount=response.content_length)
+    elif response.is_streamed:
+        response.response = _count_stream_bytes(response.response, route)
+    return response
+
+class _RequestTimingMiddleware:
+    """WSGI中间件：记录请求耗时，计算到服务器关闭响应（下载、打包等传输完毕）为止"""
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        result = self.wsgi_app(environ, start_response)
+        
+        def record():
+            HTTP_DURATION.observe(time.perf_counter() - started, environ['REQUEST_METHOD'],
+                                  environ.get('file_manager.route', 'unmatched'))
+        
+        # wsgi.file_wrapper需要原样返回服务器才能使用sendfile，只替换它的close
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(result, file_wrapper):
+            close = getattr(result, 'close', None)
+            
+            def close_and_record():
+                try:
+                    if close is not None:
+                        close()
+                finally:
+                    record()
+            result.close = close_and_record
+            return result
+        return ClosingIterator(result, record)
+
+app.wsgi_app = _RequestTimingMiddleware(app.wsgi_app)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus文本格式的指标，默认关闭
+    
+    设置FILE_MANAGER_METRICS_TOKEN后需要Bearer token；FILE_MANAGER_METRICS_LOCAL=1时只允许本机访问。
+    """
+    token = os.environ.get('FILE_MANAGER_METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': '未授权访问'}), 401
+    elif os.environ.get('FILE_MANAGER_METRICS_LOCAL') == '1':
+        if request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({'error': '未授权访问'}), 403
+    else:
+        abort(404)
+    return app.response_class(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.after_request
+def _compress_json(response):
+    # 注册在指标钩子之后、先于它执行，统计的是压缩后的字节数
+    return compress_response(response, request, GZIP_MIN_SIZE)
 
 @app.route('/')
 def serve_index():
-    return send_from_directory('.', 'index.html')
+    return serve_static('index.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
-    return send_from_directory('.', filename)
+    """页面、脚本和样式（预先压缩，带哈希的文件名永久缓存）"""
+    response = static_assets.response(filename, request)
+    if response is None:
+        abort(404)
+    return response
 
 def require_auth(f):
     """认证装饰器"""
@@ -201,12 +1127,32 @@ def api_user_info():
     try:
         success, user_info = file_manager.user_manager.get_user_info(request.username)
         if success:
+            user_info['usage'] = file_manager.get_usage(request.username)
+            user_info['quota_bytes'] = file_manager.get_quota(request.username)
+            user_info['dedup'] = file_manager.blob_store is not None
             return jsonify(user_info)
         else:
             return jsonify({'error': user_info}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/usage', methods=['GET'])
+@require_auth
+def api_usage():
+    try:
+        path = request.args.get('path', '')
+        usage = file_manager.get_usage(request.username, path)
+        if usage is None:
+            return jsonify({'error': '用户目录不存在'}), 404
+        
+        user_base = file_manager.user_manager.get_user_files_dir(request.username)
+        usage['path'] = path
+        usage['quota_bytes'] = file_manager.get_quota(request.username)
+        usage['children'] = file_manager.search_index.get_children_usage(user_base, path)
+        return jsonify(usage)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/forgot-password', methods=['POST'])
 def api_forgot_password():
     try:
@@ -242,15 +1188,179 @@ def api_reset_password():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/files', methods=['POST'])
+def _stream_json_array(items):
+    """逐个序列化并输出JSON数组，避免在内存中拼接完整的响应"""
+    yield '['
+    first = True
+    for item in items:
+        yield ('' if first else ',') + json.dumps(item, ensure_ascii=False)
+        first = False
+    yield ']'
+
+@app.route('/api/files', methods=['GET', 'POST'])
 @require_auth
 def api_list_files():
     try:
-        data = request.get_json()
+        data = request.get_json() if request.method == 'POST' else request.args.to_dict()
         path = data.get('path', '')
         
-        files = file_manager.list_files(request.username, path)
-        return jsonify(files)
+        # 流式返回：按磁盘顺序逐条输出，不排序不分页
+        if data.get('stream') in (True, 1, '1', 'true'):
+            items = file_manager.iter_files(request.username, path)
+            return app.response_class(_stream_json_array(items), mimetype='application/json')
+        
+        paginated = 'offset' in data or 'limit' in data or 'sort' in data
+        try:
+            offset = int(data.get('offset', 0))
+            limit = data.get('limit')
+            limit = int(limit) if limit is not None else None
+        except (TypeError, ValueError):
+            return jsonify({'error': '分页参数无效'}), 400
+        sort = data.get('sort', 'name')
+        order = data.get('order', 'asc')
+        if offset < 0 or (limit is not None and limit <= 0):
+            return jsonify({'error': '分页参数无效'}), 400
+        if sort not in FileManagerServer.SORT_KEYS or order not in ('asc', 'desc'):
+            return jsonify({'error': '排序参数无效'}), 400
+        
+        listing = file_manager.get_listing(request.username, path)
+        etag = None
+        if listing is not None:
+            etag = make_etag(listing, [path, paginated, offset, limit, sort, order])
+            # 压缩后的响应带弱ETag，用弱比较
+            if request.method == 'GET' and request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+        
+        page = file_manager.paginate_listing(listing, offset, limit, sort, order)
+        # 未指定分页参数时保持原有的数组返回格式
+        response = jsonify(page if paginated else page['items'])
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+@require_auth
+def api_search():
+    try:
+        user_base = file_manager.user_manager.get_user_files_dir(request.username)
+        if not user_base:
+            return jsonify({'error': '用户目录不存在'}), 404
+        
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = max(1, min(request.args.get('limit', 100, type=int), SearchIndex.MAX_LIMIT))
+        min_size = request.args.get('min_size', type=int)
+        max_size = request.args.get('max_size', type=int)
+        modified_after = request.args.get('modified_after', type=float)
+        modified_before = request.args.get('modified_before', type=float)
+        
+        mode = request.args.get('mode', 'substring')
+        if mode not in ('substring', 'prefix'):
+            return jsonify({'error': '无效的搜索方式'}), 400
+        extensions = [ext for value in request.args.getlist('ext') for ext in value.split(',') if ext]
+        
+        # 索引尚未建立时在后台开始扫描，先返回已有的结果
+        indexed = file_manager.search_index.ensure_indexed(user_base)
+        items = file_manager.search_index.search(
+            user_base, request.args.get('q', ''), mode=mode, path=request.args.get('path', ''),
+            in_path=request.args.get('in_path') in ('1', 'true'), extensions=extensions,
+            file_type=request.args.get('type'), min_size=min_size, max_size=max_size,
+            modified_after=modified_after, modified_before=modified_before,
+            sort=request.args.get('sort', 'name'), order=request.args.get('order', 'asc'),
+            offset=offset, limit=limit)
+        for item in items:
+            item['parent'] = item['path'].rpartition('/')[0]
+            item['modified'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['mtime']))
+        
+        return jsonify({
+            'items': items,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + len(items) if len(items) == limit else None,
+            'indexing': not indexed or file_manager.search_index.is_indexing(user_base)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 长轮询最长等待时间；SSE连接保持的时间，到期后浏览器带Last-Event-ID自动重连
+CHANGES_MAX_WAIT = 55
+CHANGES_STREAM_SECONDS = 300
+CHANGES_KEEPALIVE = 15
+
+# 同时保持的变更事件连接（SSE和长轮询）上限，超过时返回503；
+# 服务器线程数在处理请求的线程之外再加上这个数（见serve()和gunicorn.conf.py），普通请求不会被占满
+MAX_CHANGE_STREAMS = int(os.environ.get('FILE_MANAGER_MAX_CHANGE_STREAMS', 16))
+_change_stream_slots = threading.BoundedSemaphore(MAX_CHANGE_STREAMS)
+
+def _streams_busy():
+    response = jsonify({'error': '服务器的变更事件连接已满，请稍后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+def _iter_change_stream(owner, cursor, paths):
+    """SSE事件流：先发送当前游标，之后逐个发送变更事件，空闲时发送注释保持连接"""
+    feed = file_manager.change_feed
+    yield 'retry: 3000\n'
+    yield f'id: {cursor}\nevent: ready\ndata: {{}}\n\n'
+    deadline = time.monotonic() + CHANGES_STREAM_SECONDS
+    while not feed.closed and time.monotonic() < deadline:
+        events, cursor, reset = feed.wait(owner, cursor, CHANGES_KEEPALIVE, paths)
+        if reset:
+            yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+        for event in events:
+            yield f'id: {event["id"]}\nevent: change\ndata: {json.dumps(event, ensure_ascii=False)}\n\n'
+        if not events and not reset:
+            yield ': keepalive\n\n'
+
+@app.route('/api/changes', methods=['GET'])
+@require_auth
+def api_changes():
+    """文件变更事件：Accept为text/event-stream时返回SSE流，否则长轮询返回JSON"""
+    try:
+        owner = file_manager.user_manager.get_user_files_dir(request.username)
+        if not owner:
+            return jsonify({'error': '用户目录不存在'}), 404
+        
+        # 只关注指定目录中的变更（可重复的path参数），不指定时返回所有目录的变更
+        paths = request.args.getlist('path')
+        paths = {path.replace('\\', '/').strip('/') for path in paths} if paths else None
+        cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+        feed = file_manager.change_feed
+        
+        if request.accept_mimetypes.best == 'text/event-stream':
+            if not _change_stream_slots.acquire(blocking=False):
+                return _streams_busy()
+            try:
+                if not cursor:
+                    cursor = feed.current_cursor()
+                response = app.response_class(_iter_change_stream(owner, cursor, paths),
+                                              mimetype='text/event-stream')
+            except BaseException:
+                _change_stream_slots.release()
+                raise
+            # 连接结束（包括客户端断开）时由WSGI服务器关闭响应，释放名额
+            response.call_on_close(_change_stream_slots.release)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+        
+        # 不带游标时立即返回当前游标，客户端从这里开始
+        if not cursor:
+            return jsonify({'events': [], 'cursor': feed.current_cursor(), 'reset': False})
+        timeout = max(0.0, min(request.args.get('timeout', 25, type=float), CHANGES_MAX_WAIT))
+        if timeout > 0 and not _change_stream_slots.acquire(blocking=False):
+            return _streams_busy()
+        try:
+            events, cursor, reset = feed.wait(owner, cursor, timeout, paths)
+        finally:
+            if timeout > 0:
+                _change_stream_slots.release()
+        return jsonify({'events': events, 'cursor': cursor, 'reset': reset})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -285,6 +1395,13 @@ def api_delete_item():
         if not name:
             return jsonify({'error': '文件名不能为空'}), 400
         
+        if is_dir:
+            # 文件夹在后台删除，立即返回任务信息
+            success, result = file_manager.start_delete_job(request.username, path, name)
+            if success:
+                return jsonify({'message': '删除任务已开始', 'job': result}), 202
+            return jsonify({'error': result}), 400
+        
         success, message = file_manager.delete_item(request.username, path, name, is_dir)
         if success:
             return jsonify({'message': message})
@@ -293,6 +1410,76 @@ def api_delete_item():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/batch', methods=['POST'])
+@require_auth
+def api_batch_operations():
+    try:
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+        
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': '操作列表不能为空'}), 400
+        if len(operations) > file_manager.MAX_BATCH_SIZE:
+            return jsonify({'error': f'单次最多{file_manager.MAX_BATCH_SIZE}个操作'}), 400
+        
+        results = file_manager.batch_operations(request.username, operations, data.get('path', ''))
+        succeeded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+@require_auth
+def api_list_jobs():
+    return jsonify({'jobs': file_manager.job_manager.list_jobs(request.username)})
+
+@app.route('/api/jobs', methods=['POST'])
+@require_auth
+def api_create_job():
+    try:
+        data = request.get_json(silent=True) or {}
+        job_type = data.get('type')
+        path = data.get('path', '')
+        
+        if job_type == 'delete':
+            success, result = file_manager.start_delete_job(request.username, path, data.get('name', ''))
+        elif job_type == 'copy':
+            success, result = file_manager.start_copy_job(request.username, path, data.get('name', ''),
+                                                          data.get('dest_path', path), data.get('new_name'))
+        elif job_type == 'archive':
+            success, result = file_manager.start_archive_job(request.username, path, data.get('names'),
+                                                             data.get('archive_name'))
+        elif job_type == 'checksum':
+            success, result = file_manager.start_checksum_job(request.username, path, bool(data.get('recursive')),
+                                                              data.get('algorithm', 'sha256'))
+        else:
+            return jsonify({'error': f'不支持的任务类型: {job_type}'}), 400
+        
+        if not success:
+            return jsonify({'error': result}), 400
+        return jsonify(result), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_auth
+def api_job_status(job_id):
+    job = file_manager.job_manager.get(job_id, request.username)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@require_auth
+def api_cancel_job(job_id):
+    if not file_manager.job_manager.cancel(job_id, request.username):
+        return jsonify({'error': '任务不存在或已结束'}), 404
+    return jsonify({'message': '已请求取消任务'})
+
 @app.route('/api/download', methods=['GET'])
 @require_auth
 def api_download_file():
@@ -303,19 +1490,68 @@ def api_download_file():
         if not filename:
             return jsonify({'error': '文件名不能为空'}), 400
         
+        # 安全检查：防止目录遍历攻击
+        if '..' in filename or filename.startswith('/') or filename.startswith('\\'):
+            return jsonify({'error': '无效的文件名'}), 400
+        
         user_path = file_manager.get_user_files_path(request.username, path)
         if not user_path or not os.path.exists(user_path):
             return jsonify({'error': '用户目录不存在'}), 404
         
         file_path = os.path.join(user_path, filename)
-        if not os.path.exists(file_path) or os.path.isdir(file_path):
+        if not os.path.isfile(file_path):
             return jsonify({'error': '文件不存在或不是文件'}), 404
         
-        # 安全检查：防止目录遍历攻击
-        if '..' in filename or filename.startswith('/') or filename.startswith('\\'):
-            return jsonify({'error': '无效的文件名'}), 400
+        # 支持断点续传（Range）、条件请求（304）以及服务器提供的零拷贝发送
+        return send_file_with_ranges(request, file_path, os.path.basename(filename), as_attachment=True)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/thumbnail', methods=['GET'])
+@require_auth
+def api_thumbnail():
+    try:
+        path = request.args.get('path', '')
+        filename = request.args.get('filename', '')
+        size = request.args.get('size', 256, type=int)
         
-        return send_from_directory(user_path, filename, as_attachment=True)
+        success, result = file_manager.get_thumbnail(request.username, path, filename, size)
+        if not success:
+            return jsonify({'error': result}), 501 if file_manager.thumbnails is None else 404
+        
+        # 缩略图的键包含原图修改时间，客户端在URL中带上修改时间(v)，可以放心缓存
+        response = send_file_with_ranges(request, result, f"{os.path.splitext(filename)[0]}.jpg",
+                                         as_attachment=False)
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/download-zip', methods=['GET', 'POST'])
+@require_auth
+def api_download_zip():
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True)
+            if data is None:
+                # 表单提交时names为JSON数组字符串
+                data = {'path': request.form.get('path', ''), 'names': json.loads(request.form.get('names', '[]'))}
+            path = data.get('path', '')
+            names = data.get('names') or []
+        else:
+            path = request.args.get('path', '')
+            names = request.args.getlist('names')
+        
+        success, items, archive_name = file_manager.prepare_zip(request.username, path, names)
+        if not success:
+            return jsonify({'error': items}), 400
+        
+        # 边打包边发送，不使用临时文件；内存占用与文件大小无关，随项目数线性增长（每项一个ZipInfo）
+        response = app.response_class(iter_zip_stream(items), mimetype='application/zip',
+                                      direct_passthrough=True)
+        response.headers['Content-Disposition'] = content_disposition(archive_name, True)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -323,6 +1559,11 @@ def api_download_file():
 @require_auth
 def api_upload_file():
     try:
+        # 解析请求体之前按Content-Length检查配额
+        allowed, message = file_manager.check_quota(request.username, request.content_length or 0)
+        if not allowed:
+            return jsonify({'error': message}), 413
+        
         if 'file' not in request.files:
             return jsonify({'error': '没有选择文件'}), 400
         
@@ -333,26 +1574,163 @@ def api_upload_file():
             return jsonify({'error': '没有选择文件'}), 400
         
         if file:
-            user_path = file_manager.get_user_files_path(request.username, path)
-            if not user_path:
-                return jsonify({'error': '用户目录不存在'}), 400
-            
-            # 确保目标目录存在
-            os.makedirs(user_path, exist_ok=True)
-            
-            file_path = os.path.join(user_path, file.filename)
+            if not file_manager.is_valid_name(file.filename):
+                return jsonify({'error': '无效的文件名'}), 400
             
-            try:
-                file.save(file_path)
-                return jsonify({'message': '文件上传成功'})
-            except Exception as save_error:
-                print(f"文件保存错误: {save_error}")
-                return jsonify({'error': f'文件保存失败: {str(save_error)}'}), 500
+            success, message = file_manager.save_upload(request.username, path, file.filename, file.stream)
+            if success:
+                return jsonify({'message': message})
+            return jsonify({'error': message}), 500
         else:
             return jsonify({'error': '文件无效'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/checksum', methods=['GET'])
+@require_auth
+def api_checksum():
+    try:
+        success, result = file_manager.get_checksum(
+            request.username, request.args.get('path', ''), request.args.get('filename', ''),
+            request.args.get('algorithm', 'sha256'))
+        if success:
+            return jsonify(result)
+        return jsonify({'error': result}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/delta/signature', methods=['GET'])
+@require_auth
+def api_delta_signature():
+    try:
+        block_size = request.args.get('block_size', type=int)
+        if block_size is not None and not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            return jsonify({'error': f'块大小应在 {MIN_BLOCK_SIZE} 到 {MAX_BLOCK_SIZE} 字节之间'}), 400
+        
+        success, result = file_manager.get_delta_signature(
+            request.username, request.args.get('path', ''), request.args.get('filename', ''), block_size)
+        if success:
+            return jsonify(result)
+        return jsonify({'error': result}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/delta/apply', methods=['POST'])
+@require_auth
+def api_delta_apply():
+    """请求体为差异数据（格式见delta_sync），参数中给出签名的版本、块大小以及新文件的大小和SHA-256"""
+    try:
+        path = request.args.get('path', '')
+        filename = request.args.get('filename', '')
+        base_version = request.args.get('version', '')
+        block_size = request.args.get('block_size', type=int)
+        size = request.args.get('size', type=int)
+        sha256 = request.args.get('sha256', '')
+        if not base_version or block_size is None or not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            return jsonify({'error': '缺少签名的版本或块大小无效'}), 400
+        if size is None or size < 0 or len(sha256) != 64:
+            return jsonify({'error': '缺少新文件的大小或SHA-256'}), 400
+        # 先校验文件名，再用它拼接路径检查配额
+        if not file_manager.is_valid_name(filename):
+            return jsonify({'error': '无效的文件名'}), 400
+        
+        # 按重建后的大小检查配额（原文件的大小不计入）
+        user_path = file_manager.get_user_files_path(request.username, path)
+        target_path = os.path.join(user_path, filename) if user_path else None
+        allowed, message = file_manager.check_quota(request.username, size, target_path)
+        if not allowed:
+            return jsonify({'error': message}), 413
+        
+        success, result = file_manager.apply_delta(
+            request.username, path, filename, request.stream, base_version, block_size, size, sha256)
+        if success:
+            return jsonify({'message': '文件已更新', 'file': result})
+        return jsonify({'error': result}), 404
+    except BaseChangedError as e:
+        return jsonify({'error': str(e)}), 409
+    except DeltaError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads', methods=['POST'])
+@require_auth
+def api_create_upload():
+    try:
+        data = request.get_json()
+        path = data.get('path', '')
+        filename = data.get('filename', '')
+        
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': '文件大小无效'}), 400
+        if not filename:
+            return jsonify({'error': '文件名不能为空'}), 400
+        if size < 0:
+            return jsonify({'error': '文件大小无效'}), 400
+        
+        success, result = file_manager.create_upload(request.username, path, filename, size, data.get('sha256'))
+        if success:
+            return jsonify(result)
+        else:
+            return jsonify({'error': result}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@require_auth
+def api_upload_status(upload_id):
+    try:
+        status = file_manager.upload_manager.status(upload_id, request.username)
+        if status is None:
+            return jsonify({'error': '上传不存在或已过期'}), 404
+        return jsonify(status)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@require_auth
+def api_upload_chunk(upload_id):
+    try:
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({'error': '分块偏移无效'}), 400
+        if request.content_length is None:
+            return jsonify({'error': '缺少Content-Length'}), 411
+        
+        success, result = file_manager.upload_manager.write_chunk(
+            upload_id, request.username, offset, request.content_length, request.stream)
+        if success:
+            return jsonify(result)
+        else:
+            return jsonify({'error': result}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@require_auth
+def api_finalize_upload(upload_id):
+    try:
+        success, result = file_manager.finalize_upload(request.username, upload_id)
+        if success:
+            return jsonify({'message': '文件上传成功', 'upload': result})
+        else:
+            return jsonify({'error': result}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@require_auth
+def api_abort_upload(upload_id):
+    try:
+        if file_manager.upload_manager.abort(upload_id, request.username):
+            return jsonify({'message': '上传已取消'})
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': '接口不存在'}), 404
@@ -361,9 +1739,59 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': '服务器内部错误'}), 500
 
+def _exit_on_signal(signum, frame):
+    """收到SIGTERM时像Ctrl+C一样退出，以便执行优雅关闭"""
+    sys.exit(0)
+
+def serve(host='0.0.0.0', port=8000, threads=16):
+    """生产模式：用waitress多线程服务器运行（支持Windows），退出时优雅关闭
+
+    Linux上需要多个工作进程时使用gunicorn（见gunicorn.conf.py）。
+    """
+    create_app()
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+    
+    try:
+        if waitress_serve is None:
+            print("未安装waitress（pip install waitress），使用Werkzeug多线程服务器")
+            app.run(host=host, port=port, threaded=True)
+        else:
+            # 大文件上传不受默认1GB请求体限制；空闲连接120秒后关闭
+            # 变更事件连接另外占用线程，不挤占处理普通请求的threads个线程
+            waitress_serve(app, host=host, port=port, threads=threads + MAX_CHANGE_STREAMS,
+                           connection_limit=int(os.environ.get('FILE_MANAGER_CONNECTION_LIMIT', 1000)),
+                           channel_timeout=120,
+                           max_request_body_size=int(os.environ.get('FILE_MANAGER_MAX_REQUEST_BODY',
+                                                                    64 * 1024 ** 3)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("正在关闭服务器...")
+        file_manager.shutdown()
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='文件管理器服务器')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('FILE_MANAGER_THREADS', 16)),
+                        help='处理请求的线程数')
+    parser.add_argument('--debug', action='store_true', help='使用带调试器和自动重载的开发服务器')
+    args = parser.parse_args()
+    
     print("启动文件管理器服务器...")
-    print("访问地址: http://localhost:8000")
+    print(f"访问地址: http://localhost:{args.port}")
     print("按 Ctrl+C 停止服务器")
     
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    if args.debug:
+        # 自动重载的父进程只负责监视源文件，只在实际处理请求的子进程中初始化
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            create_app()
+            # 修改页面、脚本和样式后不需要重启
+            static_assets.auto_reload = True
+        app.run(host=args.host, port=args.port, debug=True)
+    else:
+        serve(args.host, args.port, args.threads)
\ No newline at end of file
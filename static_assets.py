@@ -0,0 +1,186 @@
+import os
+import re
+import gzip
+import hashlib
+import threading
+import mimetypes
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 作为静态资源提供的文件类型（只提供根目录下的这些文件，不会暴露data/、源代码等）
+STATIC_EXTENSIONS = {'.html', '.js', '.css', '.ico', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp'}
+
+# 值得压缩的文本类型
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.css', '.svg'}
+
+# 带哈希的文件名永久缓存；页面本身（地址固定）每次用ETag向服务器确认
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PAGE_CACHE_CONTROL = 'no-cache'
+
+# 页面中引用同目录资源的属性，如 href="styles.css"、src="script.js"
+_REFERENCE_PATTERN = re.compile(r'''((?:href|src)=["'])([^"'/:?#]+\.(?:css|js))(["'])''')
+
+
+class _Asset:
+    """一个静态资源的原始内容、压缩版本和带哈希的文件名"""
+
+    def __init__(self, name, content, mimetype):
+        self.name = name
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(content).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f'{stem}.{self.etag[:10]}{ext}'
+        self.variants = {'identity': content}
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            # 压缩结果不比原文件小时不保留
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) < len(content):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    self.variants['br'] = compressed
+
+
+class StaticAssets:
+    """预处理的静态资源
+
+    启动时读取根目录下的页面、脚本和样式，为每个文件计算内容哈希，生成带哈希的
+    文件名（如script.3f2a9c1b0d.js）并预先压缩出gzip和brotli（安装了brotli时）版本。
+    页面中对脚本和样式的引用改写为带哈希的文件名，这些文件以immutable永久缓存，
+    内容变化后文件名随之变化；页面本身地址不变，用ETag协商缓存。
+    所有内容保存在内存中，按Accept-Encoding选择压缩版本直接返回。
+
+    auto_reload为True时（调试模式）每次请求检查源文件修改时间，修改后重新生成。
+    """
+
+    def __init__(self, root='.', auto_reload=False):
+        self.root = root
+        self.auto_reload = auto_reload
+        self._lock = threading.Lock()
+        self._assets = {}
+        self._versions = {}
+        self.build()
+
+    def _source_files(self):
+        """根目录下作为静态资源提供的文件"""
+        names = []
+        for name in sorted(os.listdir(self.root)):
+            if os.path.splitext(name)[1].lower() in STATIC_EXTENSIONS and \
+                    os.path.isfile(os.path.join(self.root, name)):
+                names.append(name)
+        return names
+
+    def _source_versions(self):
+        versions = {}
+        for name in self._source_files():
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            versions[name] = (stat.st_mtime_ns, stat.st_size)
+        return versions
+
+    def build(self):
+        """读取并预处理所有静态资源"""
+        versions = self._source_versions()
+        sources = {}
+        for name in versions:
+            with open(os.path.join(self.root, name), 'rb') as f:
+                sources[name] = f.read()
+
+        # 先处理被引用的资源，再把页面中的引用改写为带哈希的文件名
+        assets = {}
+        for name, content in sources.items():
+            if not name.endswith('.html'):
+                assets[name] = _Asset(name, content, mimetypes.guess_type(name)[0] or 'application/octet-stream')
+
+        def rewrite(match):
+            asset = assets.get(match.group(2))
+            return match.group(1) + (asset.hashed_name if asset else match.group(2)) + match.group(3)
+
+        for name, content in sources.items():
+            if name.endswith('.html'):
+                html = _REFERENCE_PATTERN.sub(rewrite, content.decode('utf-8'))
+                assets[name] = _Asset(name, html.encode('utf-8'), 'text/html')
+
+        lookup = {}
+        for asset in assets.values():
+            lookup[asset.name] = (asset, False)
+            lookup[asset.hashed_name] = (asset, True)
+        with self._lock:
+            self._assets = lookup
+            self._versions = versions
+
+    def _reload_if_changed(self):
+        if self._source_versions() != self._versions:
+            self.build()
+
+    def get(self, name):
+        """按文件名（原名或带哈希的文件名）查找资源，返回(资源, 是否带哈希)，不存在时返回None"""
+        if self.auto_reload:
+            self._reload_if_changed()
+        with self._lock:
+            return self._assets.get(name)
+
+    def hashed_url(self, name):
+        """资源带哈希的文件名，用于在页面之外引用"""
+        found = self.get(name)
+        return found[0].hashed_name if found else name
+
+    def response(self, name, request):
+        """生成资源的响应，资源不存在时返回None"""
+        found = self.get(name)
+        if found is None:
+            return None
+        asset, hashed = found
+        cache_control = IMMUTABLE_CACHE_CONTROL if hashed else PAGE_CACHE_CONTROL
+
+        # 不同编码的字节不同，各自使用带编码后缀的强ETag
+        encoding = negotiate_encoding(request, asset.variants)
+        etag = asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}'
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        if len(asset.variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+def negotiate_encoding(request, available):
+    """按客户端的Accept-Encoding从可用编码中选择，优先brotli"""
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def compress_response(response, request, min_size=2048, level=6):
+    """对较大的JSON响应做gzip压缩（流式响应和已压缩的响应不处理）"""
+    if response.mimetype != 'application/json' or response.status_code != 200 or \
+            response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if request.accept_encodings['gzip'] <= 0:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # 压缩后字节不同，强ETag改为弱ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+
+import server
+import benchmark
+
+
+def test_summarize_percentiles():
+    result = benchmark.summarize('op', [i / 1000 for i in range(1, 101)], elapsed=2.0, extra={'mb_per_sec': 1.5})
+    assert result['ops'] == 100
+    assert result['ops_per_sec'] == 50
+    assert result['p50_ms'] == 51 and result['p99_ms'] == 100 and result['max_ms'] == 100
+    assert result['mb_per_sec'] == 1.5
+    assert benchmark.summarize('empty', [], 0)['ops'] == 0
+
+
+def test_fixtures_load_into_server(tmp_path, monkeypatch):
+    bench_tokens, all_tokens = benchmark.build_fixtures(str(tmp_path), users=5, sessions=20, dir_sizes=[3],
+                                                        file_size=1024)
+    assert len(all_tokens) == 20 and len(bench_tokens) == 4
+    monkeypatch.chdir(tmp_path)
+    manager = server.FileManagerServer()
+    monkeypatch.setattr(server, 'file_manager', manager)
+    try:
+        client = server.app.test_client()
+        headers = {'X-Session-Token': bench_tokens[0]}
+        names = [item['name'] for item in client.get('/api/files?path=dir_3', headers=headers).get_json()]
+        assert names == ['file000000.txt', 'file000001.txt', 'file000002.txt']
+        response = client.post('/api/login', json={'username': benchmark.BENCH_USER, 'password': benchmark.BENCH_PASSWORD})
+        assert response.status_code == 200
+    finally:
+        manager.shutdown()
+
+
+def test_quick_run_writes_comparable_json(tmp_path, monkeypatch):
+    # 进程内测量会创建全局的file_manager，测试结束后恢复
+    monkeypatch.setattr(server, 'file_manager', None)
+    monkeypatch.setattr(server, 'static_assets', None)
+    monkeypatch.setenv('FILE_MANAGER_BACKEND', 'json')
+    output = tmp_path / 'results.json'
+    monkeypatch.setattr(sys, 'argv', [
+        'benchmark.py', '--users', '5', '--sessions', '20', '--dir-sizes', '3', '--file-size', '4096',
+        '--iterations', '3', '--auth-iterations', '1', '--transfer-iterations', '1', '--server', 'none',
+        '--output', str(output)])
+    benchmark.main()
+
+    report = json.loads(output.read_text(encoding='utf-8'))
+    assert report['params']['server'] == 'none'
+    names = [item['name'] for item in report['results']]
+    assert names and all(item['ops'] > 0 for item in report['results'])
+    assert len(names) == len(set(names))
+    # 与自己对比不报告变慢
+    benchmark.compare(report['results'], str(output))
@@ -0,0 +1,65 @@
+import io
+import os
+import errno
+import threading
+
+import pytest
+
+import blob_store
+from blob_store import BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    yield store
+    store.close()
+
+
+def test_gc_removes_unreferenced_blobs(store, tmp_path):
+    target = tmp_path / 'a.txt'
+    digest, size = store.ingest_stream(io.BytesIO(b'hello'), 'tester', str(target))
+    assert size == 5 and target.read_bytes() == b'hello'
+    assert store.gc() == 0
+    os.remove(target)
+    assert store.gc() == 1
+    assert not os.path.exists(store.blob_path(digest))
+
+
+@pytest.mark.skipif(blob_store.fcntl is None, reason='需要fcntl')
+def test_gc_waits_for_lock_held_by_other_process(store, tmp_path):
+    target = tmp_path / 'a.txt'
+    store.ingest_stream(io.BytesIO(b'hello'), 'tester', str(target))
+    os.remove(target)
+
+    # 单独打开锁文件，相当于另一个进程持有锁（如正在放入blob、尚未创建链接）
+    with open(os.path.join(store.store_dir, 'lock'), 'a') as other:
+        blob_store.fcntl.flock(other, blob_store.fcntl.LOCK_EX)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(store.gc()))
+        thread.start()
+        thread.join(0.3)
+        assert thread.is_alive()
+        blob_store.fcntl.flock(other, blob_store.fcntl.LOCK_UN)
+    thread.join(5)
+    assert result == [1]
+
+
+def test_ingest_file_from_other_filesystem(store, tmp_path, monkeypatch):
+    # 模拟上传的临时文件与存储位于不同的文件系统：不能直接重命名进存储
+    part = tmp_path / '.a.txt.uploading'
+    part.write_bytes(b'hello')
+    target = tmp_path / 'a.txt'
+    monkeypatch.setattr(store, '_same_device', lambda file_path: False)
+    replace = os.replace
+
+    def no_cross_device_rename(src, dst):
+        if src == str(part):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        replace(src, dst)
+    monkeypatch.setattr(os, 'replace', no_cross_device_rename)
+
+    digest, size = store.ingest_file(str(part), 'tester', str(target))
+    assert size == 5 and target.read_bytes() == b'hello'
+    assert not part.exists()
+    assert os.path.isfile(store.blob_path(digest))
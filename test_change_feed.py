@@ -0,0 +1,159 @@
+import io
+import os
+import time
+import threading
+
+import pytest
+
+import server
+from change_feed import ChangeFeed
+from dir_cache import InotifyWatcher
+
+
+def _wait_for_events(client, cursor, count, timeout=5):
+    """读取事件直到收到count个或超时"""
+    events = []
+    deadline = time.monotonic() + timeout
+    while len(events) < count and time.monotonic() < deadline:
+        result = client.get('/api/changes', query_string={'cursor': cursor, 'timeout': 1}).get_json()
+        events.extend(result['events'])
+        cursor = result['cursor']
+    return events, cursor
+
+
+def test_feed_reports_server_changes(client):
+    cursor = client.get('/api/changes').get_json()['cursor']
+    client.post('/api/create-folder', json={'path': '', 'name': 'docs'})
+    events, _ = _wait_for_events(client, cursor, 1)
+    assert [(e['action'], e['path'], e['name']) for e in events] == [('created', '', 'docs')]
+    assert events[0]['file']['is_dir'] is True
+
+
+def test_feed_filters_by_path(client):
+    client.post('/api/create-folder', json={'path': '', 'name': 'a'})
+    cursor = client.get('/api/changes').get_json()['cursor']
+    client.post('/api/create-folder', json={'path': '', 'name': 'b'})
+    client.post('/api/create-folder', json={'path': 'a', 'name': 'inner'})
+    result = client.get('/api/changes', query_string={'cursor': cursor, 'timeout': 0, 'path': 'a'}).get_json()
+    assert [e['name'] for e in result['events']] == ['inner']
+
+
+def test_failed_operation_publishes_nothing(client, monkeypatch):
+    client.post('/api/create-folder', json={'path': '', 'name': 'docs'})
+    cursor = client.get('/api/changes').get_json()['cursor']
+
+    def fail(src, dst):
+        raise OSError('磁盘错误')
+    monkeypatch.setattr(server, 'move_path', fail)
+    result = client.post('/api/batch', json={'operations': [{'op': 'rename', 'name': 'docs', 'new_name': 'notes'}]})
+    assert result.get_json()['failed'] == 1
+    result = client.get('/api/changes', query_string={'cursor': cursor, 'timeout': 0}).get_json()
+    assert result['events'] == []
+
+
+def test_failed_upload_publishes_nothing(client, file_manager, monkeypatch):
+    client.post('/api/upload', data={'path': '', 'file': (io.BytesIO(b'old'), 'a.txt')})
+    changes = []
+    monkeypatch.setattr(file_manager, 'notify_change', lambda *args, **kwargs: changes.append(args))
+
+    def fail(src, dst):
+        raise OSError('磁盘已满')
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'replace', fail)
+        response = client.post('/api/upload', data={'path': '', 'file': (io.BytesIO(b'new'), 'a.txt')})
+    assert response.status_code == 500
+    assert changes == []
+    user_dir = file_manager.user_manager.get_user_files_dir('tester')
+    with open(os.path.join(user_dir, 'a.txt'), 'rb') as f:
+        assert f.read() == b'old'
+
+
+def test_unknown_cursor_requests_reset(client):
+    result = client.get('/api/changes', query_string={'cursor': 'stale-1', 'timeout': 0}).get_json()
+    assert result['reset'] is True
+    assert result['events'] == []
+
+
+def test_expired_cursor_requests_reset():
+    feed = ChangeFeed(max_events=3)
+    cursor = feed.current_cursor()
+    for i in range(5):
+        feed.publish('files/u', '', f'f{i}', 'deleted')
+    events, _, reset = feed.wait('files/u', cursor, timeout=0)
+    assert reset and events == []
+
+
+@pytest.mark.skipif(not InotifyWatcher.available(), reason='需要inotify')
+def test_directory_stays_watched_after_external_change(client, file_manager):
+    # 列出目录后在服务器之外连续创建文件，每个文件都应该产生事件
+    client.get('/api/files?path=')
+    cursor = client.get('/api/changes').get_json()['cursor']
+    user_dir = file_manager.user_manager.get_user_files_dir('tester')
+    for i in range(5):
+        with open(os.path.join(user_dir, f'ext{i}.txt'), 'w') as f:
+            f.write('data')
+        time.sleep(0.05)
+
+    events, _ = _wait_for_events(client, cursor, 5)
+    created = sorted({e['name'] for e in events if e['action'] in ('created', 'modified')})
+    assert created == [f'ext{i}.txt' for i in range(5)]
+
+    names = [item['name'] for item in client.get('/api/files?path=').get_json()]
+    assert sorted(names) == [f'ext{i}.txt' for i in range(5)]
+
+
+def test_change_streams_are_capped(client, monkeypatch):
+    import server
+    monkeypatch.setattr(server, '_change_stream_slots', threading.BoundedSemaphore(1))
+    headers = {'Accept': 'text/event-stream'}
+
+    stream = client.get('/api/changes', headers=headers, buffered=False)
+    assert stream.status_code == 200
+    assert client.get('/api/changes', headers=headers).status_code == 503
+    cursor = client.get('/api/changes').get_json()['cursor']
+    busy = client.get('/api/changes', query_string={'cursor': cursor, 'timeout': 1})
+    assert busy.status_code == 503 and busy.headers['Retry-After']
+
+    # 关闭连接后名额释放
+    stream.close()
+    again = client.get('/api/changes', headers=headers, buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_reset_expires_cursors_in_all_processes(tmp_path):
+    db_path = str(tmp_path / 'changes.db')
+    first, second = ChangeFeed(db_path), ChangeFeed(db_path)
+    try:
+        first.publish('files/u', '', 'a', 'created')
+        cursor = second.current_cursor()
+        first.reset()
+        events, new_cursor, reset = second.wait('files/u', cursor, timeout=0)
+        assert reset and events == []
+        first.publish('files/u', '', 'b', 'created')
+        events, _, reset = second.wait('files/u', new_cursor, timeout=0)
+        assert not reset and [e['name'] for e in events] == ['b']
+    finally:
+        first.close()
+        second.close()
+
+
+def test_overflow_invalidates_listings_and_cursors(client, file_manager):
+    client.get('/api/files?path=')
+    cursor = client.get('/api/changes').get_json()['cursor']
+    invalidations = file_manager.dir_cache.get_stats()['invalidations']
+    file_manager._on_fs_overflow()
+    assert file_manager.dir_cache.get_stats()['invalidations'] > invalidations
+    result = client.get('/api/changes', query_string={'cursor': cursor, 'timeout': 0}).get_json()
+    assert result['reset'] is True
+
+
+@pytest.mark.skipif(not InotifyWatcher.available(), reason='需要inotify')
+def test_watcher_reports_queue_overflow():
+    overflows = []
+    watcher = InotifyWatcher(lambda *args: None, lambda: overflows.append(True))
+    try:
+        watcher._dispatch(InotifyWatcher._EVENT_HEADER.pack(-1, InotifyWatcher.IN_Q_OVERFLOW, 0, 0))
+    finally:
+        watcher.close()
+    assert overflows == [True]
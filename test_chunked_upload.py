@@ -0,0 +1,92 @@
+import io
+import os
+import time
+
+import server
+from chunked_upload import UploadManager
+
+
+def _login():
+    test_client = server.app.test_client()
+    response = test_client.post('/api/login', json={'username': 'tester', 'password': 'password'})
+    assert response.status_code == 200
+    return test_client
+
+
+def test_upload_resumes_after_restart(client, file_manager, monkeypatch):
+    data = os.urandom(300 * 1024)
+    upload = client.post('/api/uploads', json={'path': '', 'filename': 'big.bin', 'size': len(data)}).get_json()
+    upload_id = upload['upload_id']
+    # 乱序上传后半部分
+    response = client.put(f'/api/uploads/{upload_id}?offset=200000', data=data[200000:])
+    assert response.status_code == 200
+    assert client.post(f'/api/uploads/{upload_id}/finalize').status_code == 400
+
+    # 重启服务器后查询已收到的部分并补齐
+    file_manager.shutdown()
+    restarted = server.FileManagerServer()
+    monkeypatch.setattr(server, 'file_manager', restarted)
+    try:
+        client = _login()
+        status = client.get(f'/api/uploads/{upload_id}').get_json()
+        assert status['received'] == [[200000, len(data)]]
+        assert status['complete'] is False
+        client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:200000])
+        assert client.post(f'/api/uploads/{upload_id}/finalize').status_code == 200
+        path = os.path.join(restarted.user_manager.get_user_files_dir('tester'), 'big.bin')
+        with open(path, 'rb') as f:
+            assert f.read() == data
+    finally:
+        restarted.shutdown()
+
+
+def test_chunk_outside_declared_size_rejected(client):
+    upload = client.post('/api/uploads', json={'path': '', 'filename': 'small.bin', 'size': 10}).get_json()
+    response = client.put(f"/api/uploads/{upload['upload_id']}?offset=5", data=b'0123456789')
+    assert response.status_code == 400
+
+
+def test_stale_uploads_do_not_hold_quota(client, file_manager):
+    file_manager.default_quota = 1000
+    stale = client.post('/api/uploads', json={'path': '', 'filename': 'a.bin', 'size': 900}).get_json()
+    assert client.post('/api/uploads', json={'path': '', 'filename': 'b.bin', 'size': 900}).status_code == 400
+
+    # 上传长时间没有活动后不再占用配额，创建新上传时被清理
+    manager = file_manager.upload_manager
+    manager._uploads[stale['upload_id']]['updated_at'] = 0
+    manager._last_expire = 0
+    part_path = manager._uploads[stale['upload_id']]['part_path']
+    response = client.post('/api/uploads', json={'path': '', 'filename': 'b.bin', 'size': 900})
+    assert response.status_code == 200, response.get_json()
+    assert client.get(f"/api/uploads/{stale['upload_id']}").status_code == 404
+    assert not os.path.exists(part_path)
+
+
+def test_failed_commit_keeps_upload(tmp_path):
+    manager = UploadManager(str(tmp_path))
+    success, upload = manager.create('tester', '', 'a.bin', 3, str(tmp_path))
+    manager.write_chunk(upload['upload_id'], 'tester', 0, 3, io.BytesIO(b'abc'))
+
+    def commit(part_path, target_path):
+        raise ValueError('存储不可用')
+    success, message = manager.finalize(upload['upload_id'], 'tester', commit)
+    assert not success and '存储不可用' in message
+    assert manager.status(upload['upload_id'], 'tester')['complete'] is True
+    assert manager.finalize(upload['upload_id'], 'tester')[0]
+    assert (tmp_path / 'a.bin').read_bytes() == b'abc'
+
+
+def test_sweeper_removes_stale_uploads(tmp_path):
+    manager = UploadManager(str(tmp_path), expire_seconds=60)
+    success, upload = manager.create('tester', '', 'a.bin', 3, str(tmp_path))
+    manager._uploads[upload['upload_id']]['updated_at'] = 0
+    part_path = manager._uploads[upload['upload_id']]['part_path']
+    manager.start_sweeper(interval=0.05)
+    try:
+        deadline = time.monotonic() + 5
+        while manager.status(upload['upload_id'], 'tester') is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        manager.stop_sweeper()
+    assert manager.status(upload['upload_id'], 'tester') is None
+    assert not os.path.exists(part_path)
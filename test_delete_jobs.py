@@ -0,0 +1,100 @@
+import os
+import time
+import threading
+
+import server
+from file_ops import sweep_temp_entries, temp_name, DELETING_SUFFIX, WRITING_SUFFIX
+
+
+def _make_tree(root, count):
+    os.makedirs(root)
+    for i in range(count):
+        with open(os.path.join(root, f'f{i}.txt'), 'w') as f:
+            f.write('x')
+
+
+def _wait_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['status'] in ('completed', 'failed', 'cancelled'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('任务没有结束')
+
+
+def test_cancelled_delete_restores_folder(client, file_manager, monkeypatch):
+    user_dir = file_manager.user_manager.get_user_files_dir('tester')
+    _make_tree(os.path.join(user_dir, 'big'), 50)
+
+    # 删除任务开始后等到取消请求到达再继续，第一项删除后即被取消
+    started, cancelled = threading.Event(), threading.Event()
+    real_delete_tree = server.delete_tree
+
+    def delete_after_cancel(path, job):
+        started.set()
+        cancelled.wait(5)
+        real_delete_tree(path, job)
+    monkeypatch.setattr(server, 'delete_tree', delete_after_cancel)
+
+    job_id = client.post('/api/jobs', json={'type': 'delete', 'name': 'big'}).get_json()['job_id']
+    assert started.wait(5)
+    client.post(f'/api/jobs/{job_id}/cancel')
+    cancelled.set()
+    assert _wait_job(client, job_id)['status'] == 'cancelled'
+
+    assert sorted(os.listdir(user_dir)) == ['big']
+    assert len(os.listdir(os.path.join(user_dir, 'big'))) == 49
+    assert [item['name'] for item in client.get('/api/files?path=').get_json()] == ['big']
+
+
+def test_delete_cancelled_before_start_restores_folder(client, file_manager, monkeypatch):
+    user_dir = file_manager.user_manager.get_user_files_dir('tester')
+    _make_tree(os.path.join(user_dir, 'queued'), 3)
+    gate = threading.Event()
+    # 占满任务线程池，删除任务在队列中被取消
+    blockers = [file_manager.job_manager.submit('tester', 'block', lambda job: gate.wait(5))
+                for _ in range(file_manager.job_manager._executor._max_workers)]
+
+    job_id = client.post('/api/jobs', json={'type': 'delete', 'name': 'queued'}).get_json()['job_id']
+    client.post(f'/api/jobs/{job_id}/cancel')
+    gate.set()
+    assert _wait_job(client, job_id)['status'] == 'cancelled'
+    for blocker in blockers:
+        file_manager.job_manager.wait(blocker.id, 'tester', timeout=5)
+    assert sorted(os.listdir(user_dir)) == ['queued']
+
+
+def test_sweep_removes_stale_temp_entries(tmp_path):
+    root = tmp_path / 'files' / 'user'
+    os.makedirs(root / 'keep')
+    stale_dir = root / temp_name('old', DELETING_SUFFIX)
+    os.makedirs(stale_dir / 'nested')
+    (stale_dir / 'nested' / 'a.txt').write_text('x')
+    stale_file = root / 'keep' / temp_name('doc.txt', WRITING_SUFFIX)
+    stale_file.write_text('partial')
+    before = time.time() + 1
+
+    # 清理开始之后创建的临时项目（正在进行的写入）保留
+    fresh_file = root / temp_name('new.txt', WRITING_SUFFIX)
+    fresh_file.write_text('writing')
+    os.utime(fresh_file, (before + 10, before + 10))
+
+    assert sweep_temp_entries(str(tmp_path / 'files'), before) == 2
+    assert not stale_dir.exists() and not stale_file.exists()
+    assert fresh_file.exists() and (root / 'keep').is_dir()
+
+
+def test_failed_rename_publishes_nothing(client, file_manager, monkeypatch):
+    client.post('/api/create-folder', json={'path': '', 'name': 'docs'})
+    cursor = client.get('/api/changes').get_json()['cursor']
+
+    def fail(src, dst):
+        raise PermissionError('文件被占用')
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'rename', fail)
+        response = client.post('/api/jobs', json={'type': 'delete', 'name': 'docs'})
+    assert response.status_code == 400
+    result = client.get('/api/changes', query_string={'cursor': cursor, 'timeout': 0}).get_json()
+    assert result['events'] == []
+    assert os.path.isdir(os.path.join(file_manager.user_manager.get_user_files_dir('tester'), 'docs'))
@@ -0,0 +1,53 @@
+import io
+import os
+import hashlib
+
+from delta_sync import compute_delta
+
+
+def _write_file(file_manager, name, data):
+    path = os.path.join(file_manager.user_manager.get_user_files_dir('tester'), name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _apply(client, name, signature, new_data, version=None):
+    delta = b''.join(compute_delta(signature, io.BytesIO(new_data)))
+    return client.post('/api/delta/apply', data=delta, query_string={
+        'filename': name,
+        'version': version or signature['version'],
+        'block_size': signature['block_size'],
+        'size': len(new_data),
+        'sha256': hashlib.sha256(new_data).hexdigest()
+    })
+
+
+def test_delta_round_trip(client, file_manager):
+    old_data = os.urandom(64 * 1024)
+    path = _write_file(file_manager, 'data.bin', old_data)
+    signature = client.get('/api/delta/signature', query_string={'filename': 'data.bin'}).get_json()
+    assert signature['size'] == len(old_data)
+
+    new_data = old_data[:10000] + b'inserted' + old_data[10000:50000] + os.urandom(3000)
+    response = _apply(client, 'data.bin', signature, new_data)
+    assert response.status_code == 200, response.get_json()
+    with open(path, 'rb') as f:
+        assert f.read() == new_data
+
+
+def test_stale_base_is_rejected(client, file_manager):
+    _write_file(file_manager, 'data.bin', b'a' * 4096)
+    signature = client.get('/api/delta/signature', query_string={'filename': 'data.bin'}).get_json()
+    response = _apply(client, 'data.bin', signature, b'b' * 4096, version='0-0-0')
+    assert response.status_code == 409
+
+
+def test_invalid_filename_rejected_before_quota_check(client, file_manager, monkeypatch):
+    def check_quota(*args, **kwargs):
+        raise AssertionError('不应检查配额')
+    monkeypatch.setattr(file_manager, 'check_quota', check_quota)
+    signature = {'version': '1-1-1', 'block_size': 1024, 'size': 0, 'blocks': []}
+    response = _apply(client, '..', signature, b'data')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == '无效的文件名'
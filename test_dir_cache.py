@@ -0,0 +1,70 @@
+import os
+import time
+
+from dir_cache import DirectoryCache
+
+
+def _loader(dir_path):
+    return sorted((entry.name, entry.stat().st_size) for entry in os.scandir(dir_path))
+
+
+def test_unwatched_cache_expires_after_ttl(tmp_path):
+    cache = DirectoryCache(watcher=None, ttl=0.2)
+    file_path = tmp_path / 'a.txt'
+    file_path.write_bytes(b'1')
+    assert cache.get(str(tmp_path), _loader).entries == [('a.txt', 1)]
+
+    # 原地修改文件不改变目录的修改时间
+    version = os.stat(tmp_path).st_mtime_ns
+    file_path.write_bytes(b'12345')
+    assert os.stat(tmp_path).st_mtime_ns == version
+    assert cache.get(str(tmp_path), _loader).entries == [('a.txt', 1)]
+
+    time.sleep(0.25)
+    assert cache.get(str(tmp_path), _loader).entries == [('a.txt', 5)]
+
+
+def test_new_file_invalidates_by_directory_version(tmp_path):
+    cache = DirectoryCache(watcher=None, ttl=60)
+    cache.get(str(tmp_path), _loader)
+    (tmp_path / 'b.txt').write_bytes(b'')
+    os.utime(tmp_path, ns=(0, 0))
+    assert cache.get(str(tmp_path), _loader).entries == [('b.txt', 0)]
+
+
+def test_invalidate_all_marks_every_listing_stale(tmp_path):
+    cache = DirectoryCache(watcher=None, ttl=60)
+    calls = []
+
+    def loader(dir_path):
+        calls.append(dir_path)
+        return _loader(dir_path)
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        cache.get(str(tmp_path / name), loader)
+    cache.invalidate_all()
+    for name in ('a', 'b'):
+        cache.get(str(tmp_path / name), loader)
+    assert len(calls) == 4
+
+
+class _RecordingWatcher:
+    def __init__(self):
+        self.watched = set()
+
+    def add(self, dir_path):
+        self.watched.add(dir_path)
+
+    def remove(self, dir_path):
+        self.watched.discard(dir_path)
+
+
+def test_directory_watched_before_scan(tmp_path):
+    watcher = _RecordingWatcher()
+    cache = DirectoryCache(watcher=watcher)
+
+    def loader(dir_path):
+        # 扫描开始时目录必须已经被监视
+        assert watcher.watched
+        return _loader(dir_path)
+    cache.get(str(tmp_path), loader)
@@ -0,0 +1,42 @@
+import os
+
+from file_transfer import parse_byte_ranges
+
+
+def test_parse_byte_ranges():
+    assert parse_byte_ranges('bytes=0-99', 1000) == [(0, 100)]
+    assert parse_byte_ranges('bytes=900-', 1000) == [(900, 1000)]
+    assert parse_byte_ranges('bytes=-100', 1000) == [(900, 1000)]
+    assert parse_byte_ranges('bytes=950-2000', 1000) == [(950, 1000)]
+    # 重叠和相邻的范围合并
+    assert parse_byte_ranges('bytes=500-599, 0-99, 50-149, 150-199', 1000) == [(0, 200), (500, 600)]
+
+
+def test_parse_byte_ranges_invalid_or_unsatisfiable():
+    assert parse_byte_ranges(None, 1000) is None
+    assert parse_byte_ranges('items=0-1', 1000) is None
+    assert parse_byte_ranges('bytes=5-1', 1000) is None
+    assert parse_byte_ranges('bytes=abc', 1000) is None
+    assert parse_byte_ranges('bytes=1000-', 1000) == []
+    assert parse_byte_ranges('bytes=-0', 1000) == []
+
+
+def test_download_range(client, file_manager):
+    data = os.urandom(4096)
+    with open(os.path.join(file_manager.user_manager.get_user_files_dir('tester'), 'a.bin'), 'wb') as f:
+        f.write(data)
+    query = {'filename': 'a.bin'}
+
+    response = client.get('/api/download', query_string=query, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 100-199/4096'
+    assert response.get_data() == data[100:200]
+
+    response = client.get('/api/download', query_string=query, headers={'Range': 'bytes=5000-'})
+    assert response.status_code == 416
+
+    # If-Range与当前ETag不符时返回完整文件
+    response = client.get('/api/download', query_string=query,
+                          headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.get_data() == data
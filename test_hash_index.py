@@ -0,0 +1,95 @@
+import os
+import zlib
+import hashlib
+
+import pytest
+
+import hash_index
+from hash_index import HashIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = HashIndex(str(tmp_path / 'hashes.db'))
+    yield index
+    index.close()
+
+
+def _write(path, data, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_cache_hit_until_size_or_mtime_changes(index, tmp_path):
+    path = tmp_path / 'a.bin'
+    _write(path, b'hello', 1_000_000_000)
+    assert index.get(str(path)) == (hashlib.sha256(b'hello').hexdigest(), 5, False)
+    assert index.get(str(path)) == (hashlib.sha256(b'hello').hexdigest(), 5, True)
+
+    # 同样大小、不同修改时间
+    _write(path, b'world', 2_000_000_000)
+    assert index.get(str(path)) == (hashlib.sha256(b'world').hexdigest(), 5, False)
+
+    # 同样修改时间、不同大小
+    _write(path, b'hello world', 2_000_000_000)
+    digest, size, cached = index.get(str(path))
+    assert (digest, size, cached) == (hashlib.sha256(b'hello world').hexdigest(), 11, False)
+
+
+def test_algorithms_cached_separately(index, tmp_path):
+    path = tmp_path / 'a.bin'
+    _write(path, b'hello')
+    assert index.get(str(path), 'crc32')[0] == f'{zlib.crc32(b"hello"):08x}'
+    assert index.get(str(path), 'sha256')[2] is False
+    assert index.get(str(path), 'crc32')[2] is True
+
+
+def test_file_modified_while_hashing_not_recorded(index, tmp_path, monkeypatch):
+    path = tmp_path / 'a.bin'
+    _write(path, b'x' * (3 * hash_index.CHUNK_SIZE), 1_000_000_000)
+    real_sha256 = hash_index.ALGORITHMS['sha256']
+
+    class ModifyingHasher:
+        """读取第一块后修改文件"""
+
+        def __init__(self):
+            self._hasher = real_sha256()
+            self._modified = False
+
+        def update(self, data):
+            self._hasher.update(data)
+            if not self._modified:
+                self._modified = True
+                os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+
+        def hexdigest(self):
+            return self._hasher.hexdigest()
+    monkeypatch.setitem(hash_index.ALGORITHMS, 'sha256', ModifyingHasher)
+    assert index.get(str(path))[2] is False
+    monkeypatch.setitem(hash_index.ALGORITHMS, 'sha256', real_sha256)
+    assert index.lookup(os.stat(path), 'sha256') is None
+    assert index.get(str(path))[2] is False
+    assert index.get(str(path))[2] is True
+
+
+def test_get_many_preserves_order_and_reports_unreadable(index, tmp_path):
+    paths = []
+    for i in range(10):
+        path = tmp_path / f'{i}.bin'
+        _write(path, str(i).encode())
+        paths.append(str(path))
+    paths.insert(3, str(tmp_path / 'missing.bin'))
+    results = list(index.get_many(paths, window=4))
+    assert [result[0] for result in results] == paths
+    assert results[3][1] is None
+    assert [result[1] for result in results if result[1]] == \
+        [hashlib.sha256(str(i).encode()).hexdigest() for i in range(10)]
+
+
+def test_record_shared_by_hard_links(index, tmp_path):
+    path = tmp_path / 'a.bin'
+    _write(path, b'hello')
+    index.record(os.stat(path), 'sha256', 'f' * 64)
+    os.link(path, tmp_path / 'b.bin')
+    assert index.get(str(tmp_path / 'b.bin')) == ('f' * 64, 5, True)
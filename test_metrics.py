@@ -0,0 +1,28 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def app_client(monkeypatch):
+    monkeypatch.delenv('FILE_MANAGER_METRICS_TOKEN', raising=False)
+    monkeypatch.delenv('FILE_MANAGER_METRICS_LOCAL', raising=False)
+    return server.app.test_client()
+
+
+def test_metrics_disabled_by_default(app_client):
+    assert app_client.get('/metrics').status_code == 404
+
+
+def test_metrics_token(app_client, monkeypatch):
+    monkeypatch.setenv('FILE_MANAGER_METRICS_TOKEN', 'secret')
+    assert app_client.get('/metrics').status_code == 401
+    response = app_client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert '# TYPE file_manager_http_requests_total counter' in response.get_data(as_text=True)
+
+
+def test_metrics_local_only(app_client, monkeypatch):
+    monkeypatch.setenv('FILE_MANAGER_METRICS_LOCAL', '1')
+    assert app_client.get('/metrics').status_code == 200
+    assert app_client.get('/metrics', environ_base={'REMOTE_ADDR': '192.168.1.20'}).status_code == 403
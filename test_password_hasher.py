@@ -0,0 +1,36 @@
+from password_hasher import PasswordHasher
+
+
+def test_parameters_from_environ():
+    hasher = PasswordHasher.from_environ({
+        'FILE_MANAGER_PASSWORD_ALGORITHM': 'scrypt',
+        'FILE_MANAGER_SCRYPT_N': '1024',
+        'FILE_MANAGER_PASSWORD_WORKERS': '2',
+    })
+    try:
+        assert (hasher.algorithm, hasher.scrypt_n, hasher.scrypt_r, hasher.max_workers) == ('scrypt', 1024, 8, 2)
+        hashed = hasher.hash('secret')
+        assert hashed.startswith('scrypt$1024$8$1$')
+        assert hasher.verify('secret', hashed)
+        assert not hasher.needs_rehash(hashed)
+    finally:
+        hasher.shutdown()
+
+
+def test_changed_work_factor_triggers_rehash():
+    old = PasswordHasher(iterations=1000)
+    new = PasswordHasher.from_environ({'FILE_MANAGER_PBKDF2_ITERATIONS': '2000'})
+    try:
+        hashed = old.hash('secret')
+        assert new.verify('secret', hashed)
+        assert new.needs_rehash(hashed)
+    finally:
+        old.shutdown()
+        new.shutdown()
+
+
+def test_queue_depth_exported(client, monkeypatch):
+    monkeypatch.setenv('FILE_MANAGER_METRICS_LOCAL', '1')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE file_manager_password_hash_queue_depth gauge' in text
+    assert 'file_manager_password_hash_queue_depth 0' in text
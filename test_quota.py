@@ -0,0 +1,86 @@
+import os
+import time
+
+import server
+
+
+def _user_dir(file_manager):
+    return file_manager.user_manager.get_user_files_dir('tester')
+
+
+def _write_file(file_manager, name, size):
+    with open(os.path.join(_user_dir(file_manager), name), 'wb') as f:
+        f.write(b'x' * size)
+    file_manager.notify_change('tester', '', name, 'created')
+
+
+def _disk_usage(file_manager):
+    return server.scan_totals(_user_dir(file_manager))[1]
+
+
+def test_batch_copies_share_quota(client, file_manager, monkeypatch):
+    file_manager.default_quota = 10000
+    # 复制变慢，使后面的复制在前面的完成之前通过检查
+    copy_path = server.copy_path
+
+    def slow_copy(src, dst):
+        time.sleep(0.2)
+        copy_path(src, dst)
+    monkeypatch.setattr(server, 'copy_path', slow_copy)
+    _write_file(file_manager, 'data.bin', 4000)
+
+    operations = [{'op': 'copy', 'name': 'data.bin', 'new_name': f'copy{i}.bin'} for i in range(5)]
+    response = client.post('/api/batch', json={'operations': operations})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['succeeded'] == 1
+    assert body['failed'] == 4
+    assert _disk_usage(file_manager) <= 10000
+
+
+def test_quota_enforced_before_index_is_built(client, file_manager, monkeypatch):
+    file_manager.default_quota = 10000
+    _write_file(file_manager, 'data.bin', 8000)
+    # 模拟首次建立索引尚未完成：用量账本为空
+    monkeypatch.setattr(file_manager.search_index, 'ensure_indexed', lambda root: False)
+    monkeypatch.setattr(file_manager.search_index, 'get_usage', lambda root, rel_path='': {'bytes': 0, 'files': 0})
+
+    allowed, message = file_manager.check_quota('tester', 4000)
+    assert not allowed
+    assert '存储空间不足' in message
+
+    response = client.post('/api/batch', json={'operations': [{'op': 'copy', 'name': 'data.bin', 'new_name': 'copy.bin'}]})
+    assert response.get_json()['failed'] == 1
+    assert not os.path.exists(os.path.join(_user_dir(file_manager), 'copy.bin'))
+
+
+def _wait_for_job(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('任务未结束')
+
+
+def test_copy_job(client, file_manager):
+    client.post('/api/create-folder', json={'path': '', 'name': 'docs'})
+    _write_file(file_manager, 'data.bin', 100)
+    response = client.post('/api/jobs', json={'type': 'copy', 'name': 'data.bin', 'dest_path': 'docs'})
+    assert response.status_code == 202, response.get_json()
+    assert _wait_for_job(client, response.get_json()['job_id'])['status'] == 'completed'
+    assert os.path.getsize(os.path.join(_user_dir(file_manager), 'docs', 'data.bin')) == 100
+
+
+def test_folder_copy_counted_before_index_is_built(client, file_manager, monkeypatch):
+    file_manager.default_quota = 10000
+    client.post('/api/create-folder', json={'path': '', 'name': 'docs'})
+    with open(os.path.join(_user_dir(file_manager), 'docs', 'data.bin'), 'wb') as f:
+        f.write(b'x' * 6000)
+    monkeypatch.setattr(file_manager.search_index, 'ensure_indexed', lambda root: False)
+    monkeypatch.setattr(file_manager.search_index, 'get_usage', lambda root, rel_path='': {'bytes': 0, 'files': 0})
+
+    response = client.post('/api/jobs', json={'type': 'copy', 'name': 'docs', 'new_name': 'docs2'})
+    assert response.status_code == 400
+    assert '存储空间不足' in response.get_json()['error']
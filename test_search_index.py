@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def indexed(client, file_manager):
+    user_dir = file_manager.user_manager.get_user_files_dir('tester')
+    os.makedirs(os.path.join(user_dir, 'photos', '2024'))
+    for rel_path, size in (('report.pdf', 100), ('notes.txt', 10), ('photos/beach.jpg', 5000),
+                           ('photos/2024/beach_party.JPG', 8000), ('photos/2024/report_draft.txt', 20)):
+        with open(os.path.join(user_dir, rel_path), 'wb') as f:
+            f.write(b'x' * size)
+    file_manager.search_index.ensure_indexed(user_dir)
+    file_manager.search_index.wait_idle()
+    return client
+
+
+def _search(client, **params):
+    result = client.get('/api/search', query_string=params).get_json()
+    return sorted(item['path'] for item in result['items'])
+
+
+def test_substring_and_prefix(indexed):
+    assert _search(indexed, q='beach') == ['photos/2024/beach_party.JPG', 'photos/beach.jpg']
+    # 少于3个字符不走trigram索引
+    assert _search(indexed, q='ot') == ['notes.txt', 'photos']
+    assert _search(indexed, q='rep', mode='prefix') == ['photos/2024/report_draft.txt', 'report.pdf']
+    assert _search(indexed, q='REPORT') == ['photos/2024/report_draft.txt', 'report.pdf']
+    assert _search(indexed, q='2024/rep', in_path='1') == ['photos/2024/report_draft.txt']
+
+
+def test_filters(indexed):
+    assert _search(indexed, ext='jpg') == ['photos/2024/beach_party.JPG', 'photos/beach.jpg']
+    assert _search(indexed, ext='txt,pdf', max_size=50) == ['notes.txt', 'photos/2024/report_draft.txt']
+    assert _search(indexed, min_size=5000, type='file') == ['photos/2024/beach_party.JPG', 'photos/beach.jpg']
+    assert _search(indexed, type='dir') == ['photos', 'photos/2024']
+    assert _search(indexed, q='report', path='photos') == ['photos/2024/report_draft.txt']
+
+
+def test_index_follows_server_changes(indexed):
+    indexed.post('/api/create-folder', json={'path': 'photos', 'name': 'holiday'})
+    assert _search(indexed, q='holiday') == ['photos/holiday']
+    indexed.post('/api/delete', json={'path': '', 'name': 'notes.txt', 'is_dir': False})
+    assert _search(indexed, q='notes') == []
+
+
+def test_paging(indexed):
+    first = indexed.get('/api/search', query_string={'limit': 3, 'sort': 'size', 'type': 'file'}).get_json()
+    assert [item['size'] for item in first['items']] == [10, 20, 100]
+    assert first['next_offset'] == 3
+    rest = indexed.get('/api/search', query_string={'limit': 3, 'offset': 3, 'sort': 'size', 'type': 'file'}).get_json()
+    assert [item['size'] for item in rest['items']] == [5000, 8000]
+    assert rest['next_offset'] is None
@@ -0,0 +1,77 @@
+import os
+import gzip
+import json
+
+import pytest
+from flask import Flask, request
+
+from static_assets import StaticAssets, compress_response
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / 'script.js').write_text('console.log("hello");\n' * 200)
+    return StaticAssets(str(tmp_path))
+
+
+def _get(assets, name, **headers):
+    with Flask(__name__).test_request_context(headers=headers):
+        return assets.response(name, request)
+
+
+def test_each_encoding_has_its_own_etag(assets):
+    identity = _get(assets, 'script.js', **{'Accept-Encoding': 'identity'})
+    compressed = _get(assets, 'script.js', **{'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == identity.get_data()
+    assert identity.get_etag()[0] != compressed.get_etag()[0]
+    assert not compressed.get_etag()[1]
+
+
+def test_not_modified_only_for_matching_encoding(assets):
+    etag = _get(assets, 'script.js', **{'Accept-Encoding': 'gzip'}).headers['ETag']
+    assert _get(assets, 'script.js', **{'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+    # 同一缓存条目被不支持gzip的客户端重新验证时返回完整内容
+    response = _get(assets, 'script.js', **{'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def _compress(body, min_size=100, **headers):
+    app = Flask(__name__)
+    with app.test_request_context(headers=headers):
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag('abc')
+        return compress_response(response, request, min_size)
+
+
+def test_large_json_gzipped_when_accepted():
+    body = json.dumps([{'name': f'file{i}.txt'} for i in range(100)])
+    response = _compress(body, **{'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert gzip.decompress(response.get_data()).decode() == body
+    assert response.get_etag() == ('abc', True)
+
+
+def test_json_not_gzipped_when_not_accepted_or_small():
+    body = json.dumps([{'name': f'file{i}.txt'} for i in range(100)])
+    for headers in ({}, {'Accept-Encoding': 'identity'}, {'Accept-Encoding': 'gzip;q=0, br'}):
+        response = _compress(body, **headers)
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_etag() == ('abc', False)
+    assert 'Content-Encoding' not in _compress('[]', **{'Accept-Encoding': 'gzip'}).headers
+
+
+def test_listing_compressed_and_revalidated(client, file_manager):
+    user_dir = file_manager.user_manager.get_user_files_dir('tester')
+    for i in range(100):
+        open(os.path.join(user_dir, f'file{i:03d}.txt'), 'w').close()
+    response = client.get('/api/files?path=', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(json.loads(gzip.decompress(response.get_data()))) == 100
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get('/api/files?path=', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
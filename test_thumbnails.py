@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import thumbnails
+from thumbnails import ThumbnailCache
+
+
+class _ImmediateExecutor:
+    """同步执行任务，返回已经结束的future"""
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def test_already_finished_render_does_not_deadlock(tmp_path, monkeypatch):
+    def fail(src_path, dst_path, size):
+        raise ValueError('无法解析图片')
+    monkeypatch.setattr(thumbnails, '_render_thumbnail', fail)
+    cache = ThumbnailCache(str(tmp_path / 'cache'))
+    cache._executor = _ImmediateExecutor()
+    (tmp_path / 'a.png').write_bytes(b'not an image')
+
+    errors = []
+
+    def get():
+        try:
+            cache.get(str(tmp_path / 'a.png'), 128)
+        except ValueError as e:
+            errors.append(e)
+    thread = threading.Thread(target=get, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert cache.get_stats()['failed'] == 1
+    assert cache.get_stats()['pending'] == 0
+
+
+@pytest.mark.skipif(not ThumbnailCache.available(), reason='需要Pillow')
+def test_thumbnail_generated_and_cached(tmp_path):
+    from PIL import Image
+    Image.new('RGB', (800, 600), 'red').save(tmp_path / 'a.png')
+    cache = ThumbnailCache(str(tmp_path / 'cache'))
+    cache._executor = _ImmediateExecutor()
+    path = cache.get(str(tmp_path / 'a.png'), 128)
+    with Image.open(path) as thumbnail:
+        assert max(thumbnail.size) == 128
+    assert cache.get(str(tmp_path / 'a.png'), 128) == path
+    assert cache.get_stats()['hits'] == 1
@@ -0,0 +1,52 @@
+import io
+import os
+import zipfile
+
+from zip_stream import iter_zip_stream
+
+
+def _make_folder(user_dir):
+    base = os.path.join(user_dir, 'docs')
+    os.makedirs(os.path.join(base, 'empty'))
+    os.makedirs(os.path.join(base, 'sub'))
+    with open(os.path.join(base, 'a.txt'), 'w') as f:
+        f.write('hello')
+    with open(os.path.join(base, 'sub', 'photo.jpg'), 'wb') as f:
+        f.write(os.urandom(300 * 1024))
+    # 上传中的临时文件不打包
+    with open(os.path.join(base, '.b.txt.0123.uploading'), 'w') as f:
+        f.write('partial')
+    return base
+
+
+def test_download_folder_as_zip(client, file_manager):
+    base = _make_folder(file_manager.user_manager.get_user_files_dir('tester'))
+    response = client.get('/api/download-zip', query_string={'names': 'docs'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert 'docs.zip' in response.headers['Content-Disposition']
+
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == ['docs/', 'docs/a.txt', 'docs/empty/', 'docs/sub/', 'docs/sub/photo.jpg']
+        assert archive.read('docs/a.txt') == b'hello'
+        with open(os.path.join(base, 'sub', 'photo.jpg'), 'rb') as f:
+            assert archive.read('docs/sub/photo.jpg') == f.read()
+        # 已压缩的类型只存储
+        assert archive.getinfo('docs/sub/photo.jpg').compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo('docs/a.txt').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_selection_with_invalid_name_rejected(client):
+    response = client.post('/api/download-zip', json={'path': '', 'names': ['../etc']})
+    assert response.status_code == 400
+
+
+def test_progress_reports_items_and_bytes(tmp_path):
+    base = _make_folder(str(tmp_path))
+    items, total_bytes = [], []
+    data = b''.join(iter_zip_stream([(base, 'docs')], progress=lambda i, b: (items.append(i), total_bytes.append(b))))
+    assert sum(total_bytes) == 5 + 300 * 1024
+    assert sum(items) == 5
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert len(archive.namelist()) == 5
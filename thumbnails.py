@@ -0,0 +1,203 @@
+import os
+import time
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 可以生成缩略图的图片类型
+THUMBNAIL_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# 允许的缩略图边长，限制缓存中同一图片的版本数
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+
+
+def is_image(filename):
+    """是否是支持生成缩略图的图片"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in THUMBNAIL_EXTENSIONS
+
+
+def _render_thumbnail(src_path, dst_path, size):
+    """生成缩略图（在工作进程中执行），返回缩略图字节数"""
+    with Image.open(src_path) as image:
+        # JPEG解码时直接按比例缩小，大照片不需要完整解码
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        tmp_path = f'{dst_path}.{os.getpid()}.tmp'
+        image.save(tmp_path, 'JPEG', quality=80, optimize=True)
+    os.replace(tmp_path, dst_path)
+    return os.path.getsize(dst_path)
+
+
+class ThumbnailCache:
+    """缩略图生成和磁盘缓存
+
+    缩略图以(路径, 修改时间, 大小, 边长)为键保存在data/thumbnails/中，原图修改后键随之改变，
+    旧缩略图不再被访问并最终被淘汰。缓存按总字节数做LRU淘汰，访问时只更新文件的访问时间
+    （修改时间和ETag保持不变），重启后按访问时间恢复LRU顺序。
+
+    生成在进程池中进行（forkserver可用时），同一张图片的并发请求只生成一次。进程池在第一次
+    生成时才创建，此时服务器已有多个线程，直接fork出的子进程会继承其他线程持有的锁，
+    所以工作进程由forkserver启动。只能使用spawn的平台（Windows）上改用线程池，
+    Pillow解码和缩放时会释放GIL。
+    """
+
+    def __init__(self, cache_dir='data/thumbnails', max_bytes=256 * 1024 * 1024, max_workers=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._pending = {}
+        self._executor = None
+        self.stats = {'hits': 0, 'misses': 0, 'generated': 0, 'failed': 0, 'evicted': 0}
+        self._load()
+
+    @staticmethod
+    def available():
+        """是否安装了Pillow"""
+        return Image is not None
+
+    def _load(self):
+        """扫描缓存目录，按访问时间恢复LRU顺序"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith('.tmp'):
+                    os.remove(path)
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def _get_executor(self):
+        """首次使用时创建工作进程池"""
+        if self._executor is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                self._executor = ProcessPoolExecutor(self.max_workers,
+                                                     mp_context=multiprocessing.get_context('forkserver'))
+            else:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='thumbnail')
+        return self._executor
+
+    def _cache_name(self, src_path, stat, size):
+        """缩略图缓存文件名"""
+        key = f'{os.path.abspath(src_path)}|{stat.st_mtime_ns}|{stat.st_size}|{size}'
+        return hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest() + '.jpg'
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def _evict(self):
+        """淘汰最久未使用的缩略图，直到总字节数不超过max_bytes（调用方需持有_lock）"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.stats['evicted'] += 1
+            try:
+                os.remove(self._cache_path(name))
+            except OSError:
+                pass
+
+    def _submit(self, src_path, size):
+        """提交生成任务（已缓存时返回None），返回(缓存文件名, future)"""
+        stat = os.stat(src_path)
+        name = self._cache_name(src_path, stat, size)
+        cache_path = self._cache_path(name)
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self.stats['hits'] += 1
+                return name, None
+            future = self._pending.get(name)
+            if future is not None:
+                return name, future
+            self.stats['misses'] += 1
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            future = self._get_executor().submit(_render_thumbnail, src_path, cache_path, size)
+            self._pending[name] = future
+        # 在锁外注册回调：任务已经结束时回调会在当前线程中立即执行，而_finish需要获取同一个锁
+        future.add_done_callback(lambda f: self._finish(name, f))
+        return name, future
+
+    def _finish(self, name, future):
+        """生成结束后登记到缓存"""
+        with self._lock:
+            self._pending.pop(name, None)
+            if future.exception() is not None:
+                self.stats['failed'] += 1
+                return
+            self._entries[name] = future.result()
+            self._total_bytes += self._entries[name]
+            self.stats['generated'] += 1
+            self._evict()
+
+    def get(self, src_path, size=256, timeout=30):
+        """获取缩略图路径，需要时生成并等待；图片无法解析时抛出异常"""
+        name, future = self._submit(src_path, size)
+        if future is not None:
+            future.result(timeout)
+        cache_path = self._cache_path(name)
+        try:
+            self._touch(cache_path)
+        except FileNotFoundError:
+            # 刚生成就被淘汰（缓存上限过小），或被共享缓存目录的其他进程淘汰，重新生成一次
+            with self._lock:
+                self._total_bytes -= self._entries.pop(name, 0)
+            name, future = self._submit(src_path, size)
+            if future is not None:
+                future.result(timeout)
+            cache_path = self._cache_path(name)
+        return cache_path
+
+    def _touch(self, cache_path):
+        """更新访问时间，供重启后恢复LRU顺序"""
+        stat = os.stat(cache_path)
+        os.utime(cache_path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+    def pregenerate(self, src_path, sizes=(128,)):
+        """上传后在后台预先生成缩略图，不等待结果"""
+        for size in sizes:
+            try:
+                self._submit(src_path, size)
+            except OSError as e:
+                print(f"预生成缩略图失败 {src_path}: {e}")
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._total_bytes
+            stats['max_bytes'] = self.max_bytes
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def shutdown(self):
+        """关闭工作进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -1,24 +1,48 @@
 import os
-import json
-import hashlib
+import time
 import secrets
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
+from user_store import JsonUserStore, SqliteUserStore
+from password_hasher import PasswordHasher
+from metrics import timed
 
 class UserManager:
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', session_persist_interval=5, sweep_interval=600,
+                 backend='json', db_path=None, persist_delay=0.5, password_hasher=None):
         self.data_dir = data_dir
-        self.users_file = os.path.join(data_dir, 'users.json')
-        self.sessions_file = os.path.join(data_dir, 'sessions.json')
-        self.reset_tokens_file = os.path.join(data_dir, 'reset_tokens.json')
         
-        # 创建数据目录
-        os.makedirs(data_dir, exist_ok=True)
-        
-        # 初始化文件
-        self._init_files()
+        # 密码哈希（PBKDF2/scrypt，在有界线程池中计算）
+        self.password_hasher = password_hasher or PasswordHasher()
+        
+        # 存储后端：'json'为默认的JSON文件存储，'sqlite'支持多进程共享
+        # JSON存储中persist_delay秒内的用户数据修改会合并为一次写盘
+        if backend == 'sqlite':
+            self.store = SqliteUserStore(data_dir, db_path)
+        elif backend == 'json':
+            self.store = JsonUserStore(data_dir, session_persist_interval, persist_delay)
+        else:
+            raise ValueError(f"未知的存储后端: {backend}")
+        self.backend = backend
+        
+        # 后台清理线程：定期批量删除过期的会话和重置token
+        self.sweep_interval = sweep_interval
+        self._sweeper_thread = None
+        self._sweeper_stop = threading.Event()
+        self._sweep_stats_lock = threading.Lock()
+        self.sweep_stats = {
+            'runs': 0,
+            'sessions_purged': 0,
+            'reset_tokens_purged': 0,
+            'last_run_at': None,
+            'last_sessions_purged': 0,
+            'last_reset_tokens_purged': 0,
+            'last_duration_ms': 0.0,
+            'max_duration_ms': 0.0
+        }
         
         # 邮件配置（需要用户配置）
         self.smtp_config = {
@@ -28,74 +52,103 @@ class UserManager:
             'password': 'your_app_password'
         }
     
-    def _init_files(self):
-        """初始化数据文件"""
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
-        
-        if not os.path.exists(self.sessions_file):
-            with open(self.sessions_file, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
-        
-        if not os.path.exists(self.reset_tokens_file):
-            with open(self.reset_tokens_file, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
-    
     def _hash_password(self, password):
         """哈希密码"""
-        salt = secrets.token_hex(16)
-        hashed = hashlib.sha256((password + salt).encode()).hexdigest()
-        return f"{salt}${hashed}"
+        return self.password_hasher.hash(password)
     
     def _verify_password(self, password, hashed_password):
         """验证密码"""
-        if not hashed_password or '$' not in hashed_password:
-            return False
-        salt, stored_hash = hashed_password.split('$', 1)
-        computed_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-        return computed_hash == stored_hash
+        return self.password_hasher.verify(password, hashed_password)
     
     def _generate_token(self):
         """生成随机token"""
         return secrets.token_urlsafe(32)
     
-    def _load_data(self, file_path):
-        """加载JSON数据"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+    def flush_sessions(self):
+        """将未保存的会话写回存储"""
+        self.store.flush()
     
-    def _save_data(self, file_path, data):
-        """保存JSON数据"""
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def sweep_expired(self):
+        """批量删除过期的会话和重置token，返回本次清理的统计信息"""
+        started = time.perf_counter()
+        now = time.time()
+        
+        sessions_purged = self.store.purge_expired_sessions(now)
+        reset_tokens_purged = self.store.purge_expired_reset_tokens(now)
+        
+        duration_ms = (time.perf_counter() - started) * 1000
+        with self._sweep_stats_lock:
+            stats = self.sweep_stats
+            stats['runs'] += 1
+            stats['sessions_purged'] += sessions_purged
+            stats['reset_tokens_purged'] += reset_tokens_purged
+            stats['last_run_at'] = datetime.now().isoformat()
+            stats['last_sessions_purged'] = sessions_purged
+            stats['last_reset_tokens_purged'] = reset_tokens_purged
+            stats['last_duration_ms'] = duration_ms
+            stats['max_duration_ms'] = max(stats['max_duration_ms'], duration_ms)
+            return dict(stats)
+    
+    def get_sweep_stats(self):
+        """获取后台清理统计信息"""
+        with self._sweep_stats_lock:
+            return dict(self.sweep_stats)
+    
+    def _sweeper_loop(self):
+        """后台清理线程主循环"""
+        while not self._sweeper_stop.wait(self.sweep_interval):
+            try:
+                stats = self.sweep_expired()
+                if stats['last_sessions_purged'] or stats['last_reset_tokens_purged']:
+                    print(f"清理过期数据: 会话 {stats['last_sessions_purged']} 个, "
+                          f"重置token {stats['last_reset_tokens_purged']} 个, "
+                          f"耗时 {stats['last_duration_ms']:.1f}ms")
+            except Exception as e:
+                print(f"清理过期数据失败: {e}")
+    
+    def start_sweeper(self, interval=None):
+        """启动后台清理线程"""
+        if interval is not None:
+            self.sweep_interval = interval
+        if not self.sweep_interval or self.sweep_interval <= 0:
+            return False
+        if self._sweeper_thread is not None and self._sweeper_thread.is_alive():
+            return False
+        
+        self._sweeper_stop.clear()
+        self._sweeper_thread = threading.Thread(target=self._sweeper_loop, name='session-sweeper', daemon=True)
+        self._sweeper_thread.start()
+        return True
+    
+    def stop_sweeper(self):
+        """停止后台清理线程"""
+        self._sweeper_stop.set()
+        if self._sweeper_thread is not None:
+            self._sweeper_thread.join()
+            self._sweeper_thread = None
+    
+    def close(self):
+        """停止后台清理线程，写回未保存的数据并关闭存储"""
+        self.stop_sweeper()
+        self.store.close()
     
     def register_user(self, username, password, email):
         """注册新用户"""
-        users = self._load_data(self.users_file)
-        
-        # 检查用户名和邮箱是否已存在
-        if username in users:
-            return False, "用户名已存在"
+        password_hash = self._hash_password(password)
         
-        for user_data in users.values():
-            if user_data.get('email') == email:
-                return False, "邮箱已被注册"
-        
-        # 创建用户
-        users[username] = {
-            'password_hash': self._hash_password(password),
+        # 检查用户名和邮箱是否已存在，并创建用户
+        conflict = self.store.add_user(username, {
+            'password_hash': password_hash,
             'email': email,
             'created_at': datetime.now().isoformat(),
             'last_login': None,
             'is_verified': False,
             'user_dir': username  # 用户文件目录
-        }
-        
-        self._save_data(self.users_file, users)
+        })
+        if conflict == 'username':
+            return False, "用户名已存在"
+        if conflict == 'email':
+            return False, "邮箱已被注册"
         
         # 创建用户目录
         user_files_dir = os.path.join('files', username)
@@ -105,97 +158,95 @@ class UserManager:
     
     def login_user(self, username, password):
         """用户登录"""
-        users = self._load_data(self.users_file)
+        user_data = self.store.get_user(username)
         
-        if username not in users:
+        if user_data is None:
             return False, "用户不存在", None
         
-        user_data = users[username]
         if not self._verify_password(password, user_data['password_hash']):
             return False, "密码错误", None
         
-        # 更新最后登录时间
-        user_data['last_login'] = datetime.now().isoformat()
-        self._save_data(self.users_file, users)
+        # 更新最后登录时间，旧格式或工作因子已变化的密码哈希顺便升级
+        fields = {'last_login': datetime.now().isoformat()}
+        if self.password_hasher.needs_rehash(user_data['password_hash']):
+            fields['password_hash'] = self._hash_password(password)
+        self.store.update_user(username, fields)
         
         # 创建会话
         session_token = self._generate_token()
-        sessions = self._load_data(self.sessions_file)
-        sessions[session_token] = {
+        now = datetime.now()
+        expires_at = now + timedelta(hours=24)
+        self.store.add_session(session_token, {
             'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(hours=24)).isoformat()
-        }
-        self._save_data(self.sessions_file, sessions)
+            'created_at': now.isoformat(),
+            'expires_at': expires_at.isoformat()
+        }, expires_at.timestamp())
         
         return True, "登录成功", session_token
     
+    @timed('verify_session')
     def verify_session(self, session_token):
         """验证会话"""
-        sessions = self._load_data(self.sessions_file)
-        
-        if session_token not in sessions:
+        session = self.store.get_session(session_token)
+        if session is None:
             return False, None
         
-        session_data = sessions[session_token]
-        expires_at = datetime.fromisoformat(session_data['expires_at'])
-        
-        if datetime.now() > expires_at:
+        username, expires = session
+        if time.time() > expires:
             # 会话过期，删除
-            del sessions[session_token]
-            self._save_data(self.sessions_file, sessions)
+            self.store.delete_session(session_token)
             return False, None
         
-        return True, session_data['username']
+        return True, username
     
     def logout_user(self, session_token):
         """用户登出"""
-        sessions = self._load_data(self.sessions_file)
-        
-        if session_token in sessions:
-            del sessions[session_token]
-            self._save_data(self.sessions_file, sessions)
+        if self.store.delete_session(session_token):
             return True, "登出成功"
         
         return False, "会话不存在"
     
     def get_user_info(self, username):
         """获取用户信息"""
-        users = self._load_data(self.users_file)
+        user_data = self.store.get_user(username)
         
-        if username in users:
-            user_data = users[username].copy()
+        if user_data is not None:
             # 移除敏感信息
             user_data.pop('password_hash', None)
             return True, user_data
         
         return False, "用户不存在"
     
+    def get_user_quota(self, username):
+        """获取用户的空间配额（字节），未单独设置时返回None"""
+        user_data = self.store.get_user(username)
+        if user_data is None:
+            return None
+        return user_data.get('quota_bytes')
+    
+    def set_user_quota(self, username, quota_bytes):
+        """设置用户的空间配额（字节），None表示使用默认配额"""
+        if not self.store.update_user(username, {'quota_bytes': quota_bytes}):
+            return False, "用户不存在"
+        return True, "配额设置成功"
+    
     def generate_reset_token(self, email):
         """生成密码重置token"""
-        users = self._load_data(self.users_file)
-        
         # 查找邮箱对应的用户
-        username = None
-        for uname, user_data in users.items():
-            if user_data.get('email') == email:
-                username = uname
-                break
+        username = self.store.find_username_by_email(email)
         
         if not username:
             return False, "邮箱未注册"
         
         # 生成重置token
         reset_token = self._generate_token()
-        reset_tokens = self._load_data(self.reset_tokens_file)
-        
-        reset_tokens[reset_token] = {
+        now = datetime.now()
+        expires_at = now + timedelta(hours=1)
+        self.store.add_reset_token(reset_token, {
             'username': username,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(hours=1)).isoformat()
-        }
-        
-        self._save_data(self.reset_tokens_file, reset_tokens)
+            'created_at': now.isoformat(),
+            'expires_at': expires_at.isoformat()
+        }, expires_at.timestamp())
         
         # 发送重置邮件（需要配置SMTP）
         self._send_reset_email(email, reset_token)
@@ -204,32 +255,22 @@ class UserManager:
     
     def reset_password(self, reset_token, new_password):
         """重置密码"""
-        reset_tokens = self._load_data(self.reset_tokens_file)
+        token = self.store.get_reset_token(reset_token)
         
-        if reset_token not in reset_tokens:
+        if token is None:
             return False, "无效的重置链接"
         
-        token_data = reset_tokens[reset_token]
-        expires_at = datetime.fromisoformat(token_data['expires_at'])
-        
-        if datetime.now() > expires_at:
-            del reset_tokens[reset_token]
-            self._save_data(self.reset_tokens_file, reset_tokens)
+        username, expires = token
+        if expires is None or time.time() > expires:
+            self.store.delete_reset_token(reset_token)
             return False, "重置链接已过期"
         
-        username = token_data['username']
-        users = self._load_data(self.users_file)
-        
-        if username not in users:
-            return False, "用户不存在"
-        
         # 更新密码
-        users[username]['password_hash'] = self._hash_password(new_password)
-        self._save_data(self.users_file, users)
+        if not self.store.update_user(username, {'password_hash': self._hash_password(new_password)}):
+            return False, "用户不存在"
         
         # 删除已使用的token
-        del reset_tokens[reset_token]
-        self._save_data(self.reset_tokens_file, reset_tokens)
+        self.store.delete_reset_token(reset_token)
         
         return True, "密码重置成功"
     
@@ -269,27 +310,23 @@ class UserManager:
     
     def update_email(self, username, new_email):
         """更新邮箱"""
-        users = self._load_data(self.users_file)
+        conflict = self.store.set_user_email(username, new_email)
         
-        if username not in users:
+        if conflict == 'username':
             return False, "用户不存在"
         
         # 检查邮箱是否已被其他用户使用
-        for uname, user_data in users.items():
-            if uname != username and user_data.get('email') == new_email:
-                return False, "邮箱已被其他用户使用"
-        
-        users[username]['email'] = new_email
-        self._save_data(self.users_file, users)
+        if conflict == 'email':
+            return False, "邮箱已被其他用户使用"
         
         return True, "邮箱更新成功"
     
     def get_user_files_dir(self, username):
         """获取用户文件目录"""
-        users = self._load_data(self.users_file)
+        user_data = self.store.get_user(username)
         
-        if username in users:
-            user_dir = users[username].get('user_dir', username)
+        if user_data is not None:
+            user_dir = user_data.get('user_dir', username)
             return os.path.join('files', user_dir)
         
         return None
\ No newline at end of file
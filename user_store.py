@@ -0,0 +1,709 @@
+import os
+import sys
+import json
+import time
+import heapq
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+from metrics import timed, OPERATION_SECONDS
+
+
+def normalize_email(email):
+    """规范化邮箱地址（去除首尾空白并转为小写），用于邮箱索引"""
+    return (email or '').strip().lower()
+
+
+def _parse_timestamp(value):
+    """将ISO格式时间转换为时间戳，无法解析时返回None"""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _get_file_lock(file_path):
+    """获取文件对应的写锁，同一文件的所有写入者共享一把锁"""
+    key = os.path.normcase(os.path.abspath(file_path))
+    with _file_locks_guard:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = _file_locks[key] = threading.Lock()
+        return lock
+
+
+def write_file_atomic(file_path, content):
+    """原子写入文件：先写入同目录的临时文件并fsync，再用os.replace替换目标文件"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(file_path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # Windows下目标文件正被读取时替换可能失败，短暂重试
+        for attempt in range(5):
+            try:
+                os.replace(tmp_path, file_path)
+                break
+            except PermissionError:
+                if attempt == 4:
+                    raise
+                time.sleep(0.05)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class JsonFilePersister:
+    """JSON文件持久化
+
+    修改后调用mark_dirty()，delay秒内的多次修改合并为一次紧凑的原子写入；
+    delay<=0时立即写入。serialize在写入时被调用，需返回要写入的数据。
+    """
+
+    def __init__(self, file_path, serialize, delay=0, on_written=None):
+        self.file_path = file_path
+        self.delay = delay
+        self._serialize = serialize
+        self._on_written = on_written
+        self._file_lock = _get_file_lock(file_path)
+        self._state_lock = threading.Lock()
+        self._dirty = False
+        self._writing = False
+        self._timer = None
+        self.writes = 0
+        atexit.register(self.flush)
+
+    @property
+    def dirty(self):
+        """是否有尚未写盘（或正在写盘）的修改"""
+        return self._dirty or self._writing
+
+    def mark_dirty(self):
+        """标记数据已修改，安排写盘（调用方不能持有serialize中使用的锁）"""
+        with self._state_lock:
+            self._dirty = True
+            if self.delay > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """立即写入未保存的修改"""
+        with self._file_lock:
+            with self._state_lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._writing = True
+            try:
+                with OPERATION_SECONDS.time('store_save'):
+                    content = json.dumps(self._serialize(), ensure_ascii=False, separators=(',', ':'))
+                    write_file_atomic(self.file_path, content)
+                self.writes += 1
+                if self._on_written is not None:
+                    self._on_written()
+            except Exception:
+                with self._state_lock:
+                    self._dirty = True
+                raise
+            finally:
+                self._writing = False
+
+
+class JsonUserStore:
+    """基于JSON文件的存储后端（默认）
+
+    用户、会话和重置token常驻内存；用户文件被外部修改时重新加载。
+    所有写盘都通过JsonFilePersister原子完成，persist_delay秒内的用户数据修改、
+    session_persist_interval秒内的会话修改分别合并为一次写入。
+    """
+
+    def __init__(self, data_dir='data', session_persist_interval=5, persist_delay=0.5):
+        self.data_dir = data_dir
+        self.users_file = os.path.join(data_dir, 'users.json')
+        self.sessions_file = os.path.join(data_dir, 'sessions.json')
+        self.reset_tokens_file = os.path.join(data_dir, 'reset_tokens.json')
+
+        # 创建数据目录
+        os.makedirs(data_dir, exist_ok=True)
+
+        # 初始化文件
+        self._init_files()
+
+        # 用户数据常驻内存，只有文件被修改时才重新加载
+        self._users_lock = threading.RLock()
+        self._users = {}
+        self._users_version = None
+        # 邮箱索引：规范化邮箱 -> 用户名，随用户数据一起重新加载
+        self._email_index = {}
+        self._users_persister = JsonFilePersister(
+            self.users_file, self._serialize_users, persist_delay, self._on_users_written)
+
+        # 会话表常驻内存：token索引会话数据，按过期时间排序的堆用于清理过期会话
+        self.session_persist_interval = session_persist_interval
+        self._sessions_lock = threading.Lock()
+        self._sessions = {}
+        self._session_expiry = {}
+        self._session_heap = []
+        self._sessions_persister = JsonFilePersister(
+            self.sessions_file, self._serialize_sessions, session_persist_interval)
+        self._load_sessions()
+
+        self._reset_tokens_lock = threading.Lock()
+        self._reset_tokens = self._load_data(self.reset_tokens_file)
+        self._reset_tokens_persister = JsonFilePersister(
+            self.reset_tokens_file, self._serialize_reset_tokens, persist_delay)
+
+    def _init_files(self):
+        """初始化数据文件"""
+        for file_path in (self.users_file, self.sessions_file, self.reset_tokens_file):
+            if not os.path.exists(file_path):
+                write_file_atomic(file_path, '{}')
+
+    @timed('store_load')
+    def _load_data(self, file_path):
+        """加载JSON数据"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _file_version(self, file_path):
+        """获取文件版本（修改时间和大小），文件不存在时返回None"""
+        try:
+            stat = os.stat(file_path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    # ---- 用户 ----
+
+    def _get_users(self):
+        """获取内存中的用户数据，文件被外部修改时重新加载"""
+        with self._users_lock:
+            # 还有修改未写盘时以内存数据为准
+            if self._users_persister.dirty:
+                return self._users
+            version = self._file_version(self.users_file)
+            if version is None or version != self._users_version:
+                self._users = self._load_data(self.users_file)
+                self._users_version = version
+                self._rebuild_email_index()
+            return self._users
+
+    def _rebuild_email_index(self):
+        """根据内存中的用户数据重建邮箱索引（调用方需持有_users_lock）"""
+        email_index = {}
+        for username, user_data in self._users.items():
+            email = normalize_email(user_data.get('email'))
+            if email:
+                email_index.setdefault(email, username)
+        self._email_index = email_index
+
+    def _serialize_users(self):
+        """复制用户数据用于写盘"""
+        with self._users_lock:
+            return {username: dict(user_data) for username, user_data in self._users.items()}
+
+    def _on_users_written(self):
+        """用户文件写入后记录新的文件版本，避免把自己的写入当作外部修改"""
+        with self._users_lock:
+            self._users_version = self._file_version(self.users_file)
+
+    def get_user(self, username):
+        """获取用户数据的副本，用户不存在时返回None"""
+        with self._users_lock:
+            user_data = self._get_users().get(username)
+            return dict(user_data) if user_data is not None else None
+
+    def find_username_by_email(self, email):
+        """根据邮箱查找用户名（不区分大小写）"""
+        with self._users_lock:
+            self._get_users()
+            return self._email_index.get(normalize_email(email))
+
+    def add_user(self, username, user_data):
+        """添加用户，成功返回None，冲突时返回冲突字段名（'username'或'email'）"""
+        with self._users_lock:
+            users = self._get_users()
+            if username in users:
+                return 'username'
+            email = normalize_email(user_data.get('email'))
+            if email in self._email_index:
+                return 'email'
+            users[username] = dict(user_data)
+            if email:
+                self._email_index[email] = username
+        self._users_persister.mark_dirty()
+        return None
+
+    def update_user(self, username, fields):
+        """更新用户字段，用户不存在时返回False"""
+        with self._users_lock:
+            users = self._get_users()
+            if username not in users:
+                return False
+            users[username].update(fields)
+            if 'email' in fields:
+                self._rebuild_email_index()
+        self._users_persister.mark_dirty()
+        return True
+
+    def set_user_email(self, username, email):
+        """修改用户邮箱，成功返回None，失败返回'username'（用户不存在）或'email'（邮箱已被使用）"""
+        with self._users_lock:
+            users = self._get_users()
+            if username not in users:
+                return 'username'
+            normalized = normalize_email(email)
+            owner = self._email_index.get(normalized)
+            if owner is not None and owner != username:
+                return 'email'
+            old_email = normalize_email(users[username].get('email'))
+            if self._email_index.get(old_email) == username:
+                del self._email_index[old_email]
+            users[username]['email'] = email
+            if normalized:
+                self._email_index[normalized] = username
+        self._users_persister.mark_dirty()
+        return None
+
+    # ---- 会话 ----
+
+    def _load_sessions(self):
+        """从磁盘加载会话表并建立过期时间索引"""
+        sessions = self._load_data(self.sessions_file)
+        with self._sessions_lock:
+            self._sessions = {}
+            self._session_expiry = {}
+            self._session_heap = []
+            for token, session_data in sessions.items():
+                expires = _parse_timestamp(session_data.get('expires_at'))
+                if expires is None:
+                    continue
+                self._sessions[token] = session_data
+                self._session_expiry[token] = expires
+                self._session_heap.append((expires, token))
+            heapq.heapify(self._session_heap)
+
+    def _serialize_sessions(self):
+        """复制会话表用于写盘"""
+        with self._sessions_lock:
+            return dict(self._sessions)
+
+    def _remove_session(self, token):
+        """删除会话（调用方需持有_sessions_lock），堆中的旧条目在出堆时忽略"""
+        self._sessions.pop(token, None)
+        return self._session_expiry.pop(token, None) is not None
+
+    def _expire_sessions(self, now):
+        """从堆顶批量删除已过期的会话（调用方需持有_sessions_lock），返回删除数量"""
+        removed = 0
+        heap = self._session_heap
+        while heap and heap[0][0] < now:
+            expires, token = heapq.heappop(heap)
+            if self._session_expiry.get(token) == expires:
+                self._remove_session(token)
+                removed += 1
+        return removed
+
+    def add_session(self, token, session_data, expires):
+        """添加会话，expires为过期时间戳"""
+        with self._sessions_lock:
+            self._expire_sessions(time.time())
+            self._sessions[token] = session_data
+            self._session_expiry[token] = expires
+            heapq.heappush(self._session_heap, (expires, token))
+        self._sessions_persister.mark_dirty()
+
+    def get_session(self, token):
+        """获取会话，返回(用户名, 过期时间戳)，不存在时返回None"""
+        with self._sessions_lock:
+            expires = self._session_expiry.get(token)
+            if expires is None:
+                return None
+            return self._sessions[token]['username'], expires
+
+    def delete_session(self, token):
+        """删除会话，会话不存在时返回False"""
+        with self._sessions_lock:
+            removed = self._remove_session(token)
+        if removed:
+            self._sessions_persister.mark_dirty()
+        return removed
+
+    def purge_expired_sessions(self, now):
+        """批量删除过期会话，返回删除数量"""
+        with self._sessions_lock:
+            removed = self._expire_sessions(now)
+        if removed:
+            self._sessions_persister.mark_dirty()
+        return removed
+
+    def flush(self):
+        """立即写入所有未保存的修改"""
+        self._users_persister.flush()
+        self._sessions_persister.flush()
+        self._reset_tokens_persister.flush()
+
+    # ---- 密码重置token ----
+
+    def _serialize_reset_tokens(self):
+        """复制重置token表用于写盘"""
+        with self._reset_tokens_lock:
+            return dict(self._reset_tokens)
+
+    def add_reset_token(self, token, token_data, expires):
+        """添加密码重置token"""
+        with self._reset_tokens_lock:
+            self._reset_tokens[token] = token_data
+        self._reset_tokens_persister.mark_dirty()
+
+    def get_reset_token(self, token):
+        """获取密码重置token，返回(用户名, 过期时间戳)，不存在时返回None"""
+        with self._reset_tokens_lock:
+            token_data = self._reset_tokens.get(token)
+        if token_data is None:
+            return None
+        return token_data['username'], _parse_timestamp(token_data.get('expires_at'))
+
+    def delete_reset_token(self, token):
+        """删除密码重置token，不存在时返回False"""
+        with self._reset_tokens_lock:
+            if self._reset_tokens.pop(token, None) is None:
+                return False
+        self._reset_tokens_persister.mark_dirty()
+        return True
+
+    def purge_expired_reset_tokens(self, now):
+        """批量删除过期的密码重置token，返回删除数量"""
+        with self._reset_tokens_lock:
+            valid_tokens = {}
+            for token, token_data in self._reset_tokens.items():
+                expires = _parse_timestamp(token_data.get('expires_at'))
+                if expires is not None and expires >= now:
+                    valid_tokens[token] = token_data
+            removed = len(self._reset_tokens) - len(valid_tokens)
+            self._reset_tokens = valid_tokens
+        if removed:
+            self._reset_tokens_persister.mark_dirty()
+        return removed
+
+    def close(self):
+        """关闭存储，写回未保存的数据"""
+        self.flush()
+
+
+class SqliteUserStore:
+    """基于SQLite的存储后端
+
+    使用WAL模式，用户名、邮箱和token均有索引，多个服务器进程可以共享同一个数据库。
+    users表的email列保存规范化后的邮箱，原始邮箱保存在data中。
+    首次打开时自动从data目录下的JSON文件迁移数据。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            email TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+        CREATE TABLE IF NOT EXISTS sessions (
+            token TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at TEXT,
+            expires_at TEXT,
+            expires_ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_ts);
+        CREATE TABLE IF NOT EXISTS reset_tokens (
+            token TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            created_at TEXT,
+            expires_at TEXT,
+            expires_ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_reset_tokens_expires ON reset_tokens(expires_ts);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, data_dir='data', db_path=None, migrate=True):
+        self.data_dir = data_dir
+        self.db_path = db_path or os.path.join(data_dir, 'users.db')
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        # 每个线程使用独立的连接
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        self._normalize_emails()
+
+        if migrate:
+            migrate_json_to_sqlite(data_dir, store=self)
+
+    def _conn(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _transaction(self):
+        """开始一个写事务，返回连接（调用方负责COMMIT/ROLLBACK）"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def _normalize_emails(self):
+        """将旧数据库中未规范化的email列更新为规范化邮箱（只执行一次）"""
+        conn = self._transaction()
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'emails_normalized'").fetchone():
+                conn.execute('ROLLBACK')
+                return
+            rows = conn.execute('SELECT username, data FROM users').fetchall()
+            for username, data in rows:
+                email = normalize_email(json.loads(data).get('email'))
+                conn.execute('UPDATE users SET email = ? WHERE username = ?', (email, username))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('emails_normalized', ?)",
+                         (datetime.now().isoformat(),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # ---- 用户 ----
+
+    def get_user(self, username):
+        """获取用户数据，用户不存在时返回None"""
+        row = self._conn().execute(
+            'SELECT data FROM users WHERE username = ?', (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_username_by_email(self, email):
+        """根据邮箱查找用户名（不区分大小写）"""
+        row = self._conn().execute(
+            'SELECT username FROM users WHERE email = ? LIMIT 1', (normalize_email(email),)).fetchone()
+        return row[0] if row else None
+
+    def add_user(self, username, user_data):
+        """添加用户，成功返回None，冲突时返回冲突字段名（'username'或'email'）"""
+        conn = self._transaction()
+        try:
+            if conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
+                conn.execute('ROLLBACK')
+                return 'username'
+            email = normalize_email(user_data.get('email'))
+            if email and conn.execute('SELECT 1 FROM users WHERE email = ? LIMIT 1', (email,)).fetchone():
+                conn.execute('ROLLBACK')
+                return 'email'
+            conn.execute('INSERT INTO users (username, email, data) VALUES (?, ?, ?)',
+                         (username, email, json.dumps(user_data, ensure_ascii=False)))
+            conn.execute('COMMIT')
+            return None
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def update_user(self, username, fields):
+        """更新用户字段，用户不存在时返回False"""
+        conn = self._transaction()
+        try:
+            row = conn.execute('SELECT data FROM users WHERE username = ?', (username,)).fetchone()
+            if not row:
+                conn.execute('ROLLBACK')
+                return False
+            user_data = json.loads(row[0])
+            user_data.update(fields)
+            conn.execute('UPDATE users SET email = ?, data = ? WHERE username = ?',
+                         (normalize_email(user_data.get('email')),
+                          json.dumps(user_data, ensure_ascii=False), username))
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def set_user_email(self, username, email):
+        """修改用户邮箱，成功返回None，失败返回'username'（用户不存在）或'email'（邮箱已被使用）"""
+        conn = self._transaction()
+        try:
+            row = conn.execute('SELECT data FROM users WHERE username = ?', (username,)).fetchone()
+            if not row:
+                conn.execute('ROLLBACK')
+                return 'username'
+            normalized = normalize_email(email)
+            if conn.execute('SELECT 1 FROM users WHERE email = ? AND username != ? LIMIT 1',
+                            (normalized, username)).fetchone():
+                conn.execute('ROLLBACK')
+                return 'email'
+            user_data = json.loads(row[0])
+            user_data['email'] = email
+            conn.execute('UPDATE users SET email = ?, data = ? WHERE username = ?',
+                         (normalized, json.dumps(user_data, ensure_ascii=False), username))
+            conn.execute('COMMIT')
+            return None
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # ---- 会话 ----
+
+    def add_session(self, token, session_data, expires):
+        """添加会话，expires为过期时间戳"""
+        self._conn().execute(
+            'INSERT OR REPLACE INTO sessions (token, username, created_at, expires_at, expires_ts) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (token, session_data['username'], session_data.get('created_at'),
+             session_data.get('expires_at'), expires))
+
+    def get_session(self, token):
+        """获取会话，返回(用户名, 过期时间戳)，不存在时返回None"""
+        row = self._conn().execute(
+            'SELECT username, expires_ts FROM sessions WHERE token = ?', (token,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def delete_session(self, token):
+        """删除会话，会话不存在时返回False"""
+        cursor = self._conn().execute('DELETE FROM sessions WHERE token = ?', (token,))
+        return cursor.rowcount > 0
+
+    def purge_expired_sessions(self, now):
+        """批量删除过期会话，返回删除数量"""
+        cursor = self._conn().execute('DELETE FROM sessions WHERE expires_ts < ?', (now,))
+        return cursor.rowcount
+
+    def flush(self):
+        """SQLite后端每次修改都已提交，无需额外写盘"""
+        pass
+
+    # ---- 密码重置token ----
+
+    def add_reset_token(self, token, token_data, expires):
+        """添加密码重置token"""
+        self._conn().execute(
+            'INSERT OR REPLACE INTO reset_tokens (token, username, created_at, expires_at, expires_ts) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (token, token_data['username'], token_data.get('created_at'),
+             token_data.get('expires_at'), expires))
+
+    def get_reset_token(self, token):
+        """获取密码重置token，返回(用户名, 过期时间戳)，不存在时返回None"""
+        row = self._conn().execute(
+            'SELECT username, expires_ts FROM reset_tokens WHERE token = ?', (token,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def delete_reset_token(self, token):
+        """删除密码重置token，不存在时返回False"""
+        cursor = self._conn().execute('DELETE FROM reset_tokens WHERE token = ?', (token,))
+        return cursor.rowcount > 0
+
+    def purge_expired_reset_tokens(self, now):
+        """批量删除过期的密码重置token，返回删除数量"""
+        cursor = self._conn().execute('DELETE FROM reset_tokens WHERE expires_ts < ?', (now,))
+        return cursor.rowcount
+
+    def close(self):
+        """关闭所有数据库连接"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+
+
+def migrate_json_to_sqlite(data_dir='data', db_path=None, store=None):
+    """将data目录下的JSON数据一次性迁移到SQLite，已迁移过时直接跳过
+
+    返回迁移的(用户数, 会话数, 重置token数)，跳过时返回None。
+    """
+    if store is None:
+        store = SqliteUserStore(data_dir, db_path, migrate=False)
+
+    conn = store._transaction()
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            conn.execute('ROLLBACK')
+            return None
+
+        def load(name):
+            try:
+                with open(os.path.join(data_dir, name), 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return {}
+
+        users = load('users.json')
+        for username, user_data in users.items():
+            conn.execute('INSERT OR IGNORE INTO users (username, email, data) VALUES (?, ?, ?)',
+                         (username, normalize_email(user_data.get('email')),
+                          json.dumps(user_data, ensure_ascii=False)))
+
+        counts = [len(users)]
+        for name, table in (('sessions.json', 'sessions'), ('reset_tokens.json', 'reset_tokens')):
+            tokens = load(name)
+            migrated = 0
+            for token, token_data in tokens.items():
+                expires = _parse_timestamp(token_data.get('expires_at'))
+                if expires is None or 'username' not in token_data:
+                    continue
+                conn.execute(f'INSERT OR IGNORE INTO {table} '
+                             '(token, username, created_at, expires_at, expires_ts) VALUES (?, ?, ?, ?, ?)',
+                             (token, token_data['username'], token_data.get('created_at'),
+                              token_data.get('expires_at'), expires))
+                migrated += 1
+            counts.append(migrated)
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                     (datetime.now().isoformat(),))
+        conn.execute('COMMIT')
+        return tuple(counts)
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+if __name__ == '__main__':
+    # 用法: python user_store.py [data目录] [数据库路径]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else None
+    result = migrate_json_to_sqlite(data_dir, db_path)
+    if result is None:
+        print("数据库已迁移过，跳过")
+    else:
+        print(f"迁移完成: 用户 {result[0]} 个, 会话 {result[1]} 个, 重置token {result[2]} 个")
@@ -0,0 +1,4 @@
+# WSGI入口：gunicorn -c gunicorn.conf.py wsgi:app、waitress-serve wsgi:app 等加载
+from server import create_app
+
+app = create_app()
@@ -0,0 +1,109 @@
+import os
+import io
+import zipfile
+from file_ops import is_temp_file
+
+# 已经压缩过的文件类型，打包时只存储不再压缩
+STORED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic',
+    'zip', 'rar', '7z', 'gz', 'bz2', 'xz', 'zst',
+    'docx', 'xlsx', 'pptx', 'pdf',
+    'mp3', 'mp4', 'mkv', 'avi', 'mov', 'm4a', 'flac'
+}
+
+# 每次从文件读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+
+class _StreamSink(io.RawIOBase):
+    """只能追加写入的输出缓冲区，zipfile写入的数据由生成器取走后发送"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """取出目前缓冲的所有数据"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compress_type(name):
+    """根据扩展名选择压缩方式"""
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _walk_items(items):
+    """展开要打包的项目，逐个生成(文件路径, 压缩包内路径, 是否目录)，不跟随符号链接"""
+    for item_path, arcname in items:
+        if os.path.islink(item_path):
+            continue
+        if not os.path.isdir(item_path):
+            yield item_path, arcname, False
+            continue
+
+        yield item_path, arcname, True
+        for root, dirs, files in os.walk(item_path):
+            dirs[:] = sorted(d for d in dirs if not is_temp_file(d) and not os.path.islink(os.path.join(root, d)))
+            relative_root = os.path.relpath(root, item_path)
+            base = arcname if relative_root == '.' else f"{arcname}/{relative_root.replace(os.sep, '/')}"
+            for name in dirs:
+                yield os.path.join(root, name), f"{base}/{name}", True
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                if is_temp_file(name) or os.path.islink(file_path):
+                    continue
+                yield file_path, f"{base}/{name}", False
+
+
+def iter_zip_stream(items, progress=None):
+    """边读取文件边生成ZIP数据
+
+    items为[(文件或目录路径, 压缩包内名称)]。输出不可回退，zipfile会使用数据描述符，
+    大文件和大压缩包自动使用ZIP64，不使用临时文件。文件内容按CHUNK_SIZE分块读取，
+    单个文件占用的内存与其大小无关；但zipfile为写出末尾的中央目录要为每一项保留一个ZipInfo
+    （约数百字节），整个压缩包的内存占用随项目数线性增长。
+    progress(项目数, 字节数)在每读取一块数据和每处理完一项后调用（后台打包任务用于报告进度）。
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zf:
+        for file_path, arcname, is_dir in _walk_items(items):
+            try:
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname, strict_timestamps=False)
+                if is_dir:
+                    zf.writestr(zinfo, b'')
+                else:
+                    zinfo.compress_type = _compress_type(arcname)
+                    with open(file_path, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            if progress is not None:
+                                progress(0, len(chunk))
+                            data = sink.drain()
+                            if data:
+                                yield data
+            except OSError as e:
+                # 打包过程中文件被删除或无法读取时跳过该文件
+                print(f"打包文件失败 {file_path}: {e}")
+            if progress is not None:
+                progress(1, 0)
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()